@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""analytics.py
+
+Udacity conference server-side Python App Engine attendee analytics
+
+Keeps, per conference, the number of attendees, their tee shirt sizes and
+the number of wishlists each session is in, updated as users register,
+unregister, change their tee shirt size and edit their wishlists. The
+aggregates are spread over STATS_SHARDS ConferenceStatsShard entities, each
+in its own entity group, so concurrent updates rarely contend. Updates are
+queued as a task added within the transaction of the change they count, so
+they're applied if and only if it commits, and a retried task doesn't count
+twice; recomputeStats rebuilds a conference's aggregates from its Attendance
+& SessionWish entities, to reconcile them.
+
+"""
+
+import collections
+import json
+import zlib
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Attendance, ConferenceStatsShard, SessionWish
+from settings import STATS_SHARDS, STATS_RECENT_TASKS, FANOUT_BATCH_SIZE
+from transactions import transactional
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+
+def _shardKeys(c_key):
+    """Return the keys of all ConferenceStatsShards of a conference."""
+    return [ndb.Key(ConferenceStatsShard, '%s-%d' % (c_key.urlsafe(), i))
+            for i in range(STATS_SHARDS)]
+
+
+def _addCounts(counts, deltas):
+    """Add deltas to a dict of counts, dropping the counts down to zero."""
+    counts = dict(counts or {})
+    for name, delta in deltas.items():
+        counts[name] = counts.get(name, 0) + delta
+        if not counts[name]:
+            del counts[name]
+    return counts
+
+
+@transactional
+def _update(shard_key, task, attendees, sizes, wishes):
+    shard = shard_key.get() or ConferenceStatsShard(key=shard_key)
+    # a retried task finds its name among the shard's last updates
+    if task in shard.recentTasks:
+        return
+    shard.attendees += attendees
+    shard.teeShirtSizes = _addCounts(shard.teeShirtSizes, sizes)
+    shard.sessionWishes = _addCounts(shard.sessionWishes, wishes)
+    shard.recentTasks = (shard.recentTasks + [task])[-STATS_RECENT_TASKS:]
+    shard.put()
+
+
+def _record(deltas):
+    """Queue deltas, (conference key, attendees, sizes, wishes) tuples, to
+    be added to the aggregates; within a transaction, the task is only added
+    if it commits."""
+    deltas = [(c_key.urlsafe(), attendees, sizes, wishes)
+              for c_key, attendees, sizes, wishes in deltas]
+    taskqueue.add(params={'deltas': json.dumps(deltas)},
+                  url='/tasks/record_stats',
+                  transactional=ndb.in_transaction())
+
+
+def applyStats(task, deltas):
+    """
+    Add the deltas queued by a task to the aggregates
+
+    The deltas of a conference go to the shard picked by the task's name,
+    so a retry of the task finds the ones it already added.
+
+    Args:
+        task (string): name of the task
+        deltas (string): JSON list of [websafe conference key, attendees,
+                         sizes, wishes]
+    """
+    for wsck, attendees, sizes, wishes in json.loads(deltas):
+        shard_keys = _shardKeys(ndb.Key(urlsafe=wsck))
+        shard_key = shard_keys[zlib.crc32(task) % STATS_SHARDS]
+        _update(shard_key, task, attendees, sizes, wishes)
+
+
+def recordAttendance(c_keys, tee_shirt_size, delta):
+    """
+    Count users registering for (delta 1) or unregistering from (delta -1)
+    conferences
+
+    Args:
+        c_keys (list): keys of the conferences
+        tee_shirt_size (string): teeShirtSize of the user's Profile
+        delta (int): 1 or -1
+    """
+    if c_keys:
+        _record([(c_key, delta, {tee_shirt_size: delta}, {})
+                 for c_key in c_keys])
+
+
+def recordSizeChange(c_keys, previous_size, tee_shirt_size):
+    """Move an attendee of conferences from one tee shirt size to another."""
+    if c_keys:
+        _record([(c_key, 0, {previous_size: -1, tee_shirt_size: 1}, {})
+                 for c_key in c_keys])
+
+
+def recordWishes(s_keys, delta):
+    """
+    Count sessions added to (delta 1) or removed from (delta -1) a wishlist
+
+    Args:
+        s_keys (list): keys of the sessions
+        delta (int): 1 or -1
+    """
+    by_conference = collections.defaultdict(dict)
+    for s_key in s_keys:
+        by_conference[s_key.parent()][s_key.urlsafe()] = delta
+    if by_conference:
+        _record([(c_key, 0, {}, wishes)
+                 for c_key, wishes in by_conference.items()])
+
+
+def conferenceStats(c_key):
+    """
+    Sum the shards of a conference's aggregates
+
+    Args:
+        c_key (ndb.Key): key of the conference
+    Returns:
+        attendees (int): number of users registered
+        sizes (dict): teeShirtSize mapped to its number of attendees
+        wishes (dict): websafe session keys mapped to the number of
+                       wishlists the session is in
+    """
+    attendees, sizes, wishes = 0, {}, {}
+    for shard in ndb.get_multi(_shardKeys(c_key)):
+        if shard:
+            attendees += shard.attendees
+            sizes = _addCounts(sizes, shard.teeShirtSizes or {})
+            wishes = _addCounts(wishes, shard.sessionWishes or {})
+    return attendees, sizes, wishes
+
+
+@transactional(xg=True)
+def _store(c_key, attendees, sizes, wishes):
+    """Replace the aggregates of a conference: the totals go to the first
+    shard, the other shards are reset. Each shard keeps the names of the
+    tasks already applied to it, so they aren't applied again if retried."""
+    shard_keys = _shardKeys(c_key)
+    shards = [ConferenceStatsShard(
+                  key=key, recentTasks=shard.recentTasks if shard else [])
+              for key, shard in zip(shard_keys, ndb.get_multi(shard_keys))]
+    shards[0].attendees = attendees
+    shards[0].teeShirtSizes = sizes
+    shards[0].sessionWishes = wishes
+    ndb.put_multi(shards)
+
+
+def recomputeStats(c_key):
+    """
+    Rebuild the aggregates of a conference from its registrations & wishlists
+
+    The registrations are read in batches of FANOUT_BATCH_SIZE, along with
+    the Profiles of the attendees. Changes counted while the aggregates are
+    being rebuilt may be lost, until the next recompute.
+
+    Args:
+        c_key (ndb.Key): key of the conference
+    """
+    attendees = 0
+    sizes = collections.Counter()
+    a_keys = Attendance.query(Attendance.conference == c_key).iter(
+        keys_only=True, batch_size=FANOUT_BATCH_SIZE)
+    while True:
+        p_keys = [a_key.parent() for _, a_key
+                  in zip(range(FANOUT_BATCH_SIZE), a_keys)]
+        if not p_keys:
+            break
+        attendees += len(p_keys)
+        sizes.update(prof.teeShirtSize for prof in ndb.get_multi(p_keys)
+                     if prof)
+    # the wishlist entries are keyed by the websafe key of their session
+    wishes = collections.Counter(
+        w_key.string_id() for w_key in
+        SessionWish.query(SessionWish.conference == c_key).iter(
+            keys_only=True, batch_size=FANOUT_BATCH_SIZE))
+    _store(c_key, attendees, dict(sizes), dict(wishes))
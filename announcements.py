@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""announcements.py
+
+Udacity conference server-side Python App Engine nearly sold out announcement
+
+Keeps the set of nearly sold out conferences up to date as seats are taken
+and given back, instead of querying every conference periodically. The set
+is stored in a single NearlySoldOut entity, mirrored in memcache along with
+the announcement built from it; both are only written when a conference
+enters or leaves the set. Each write of the set bumps its version, and the
+memcache copy is replaced with compare and set only by a newer version, so
+it never goes back to an older set.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from counters import countSeats
+from models import NearlySoldOut
+from transactions import transactional
+from settings import ANNOUNCEMENT_TPL, NEARLY_SOLD_OUT_SEATS
+from settings import MEMCACHE_ANNOUNCEMENTS_KEY, MEMCACHE_NEARLY_SOLD_OUT_KEY
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+_KEY = ndb.Key(NearlySoldOut, 'conferences')
+
+
+def isNearlySoldOut(seats):
+    """Return True if a conference with this many seats left is announced."""
+    return 0 < (seats or 0) <= NEARLY_SOLD_OUT_SEATS
+
+
+def _publish(entity):
+    """Cache the set of nearly sold out conferences & its announcement,
+    unless a newer version of the set is cached already."""
+    members = dict(zip([key.urlsafe() for key in entity.conferenceKeys],
+                       entity.conferenceNames))
+    client = memcache.Client()
+    # compare and set, so concurrent writers can't put back an older set
+    for _ in range(3):
+        cached = client.gets(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+        if cached is not None and cached[0] >= entity.version:
+            return members
+        value = (entity.version, members)
+        if cached is None:
+            stored = client.add(MEMCACHE_NEARLY_SOLD_OUT_KEY, value)
+        else:
+            stored = client.cas(MEMCACHE_NEARLY_SOLD_OUT_KEY, value)
+        if stored:
+            break
+    else:
+        return members
+    if entity.conferenceNames:
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, ANNOUNCEMENT_TPL % (
+            ', '.join(entity.conferenceNames)))
+    else:
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+    return members
+
+
+def _members():
+    """Return the urlsafe keys of nearly sold out conferences mapped to
+    their names, from memcache or else Datastore."""
+    cached = memcache.get(MEMCACHE_NEARLY_SOLD_OUT_KEY)
+    if cached is None:
+        return _publish(_KEY.get() or NearlySoldOut(key=_KEY))
+    return cached[1]
+
+
+@transactional
+def _store(changes):
+    """Apply {conference key: name, or None to remove} to the stored set,
+    as re-read within the transaction."""
+    entity = _KEY.get() or NearlySoldOut(key=_KEY)
+    members = zip(entity.conferenceKeys, entity.conferenceNames)
+    kept = [(c_key, name) for c_key, name in members
+            if c_key not in changes]
+    kept += [(c_key, name) for c_key, name in changes.items() if name]
+    # the cached copy was stale; refresh it without writing the entity
+    if sorted(kept) == sorted(members):
+        ndb.get_context().call_on_commit(lambda: _publish(entity))
+        return entity
+    entity.conferenceKeys = [c_key for c_key, _ in kept]
+    entity.conferenceNames = [name for _, name in kept]
+    entity.version += 1
+    entity.put()
+    ndb.get_context().call_on_commit(lambda: _publish(entity))
+    return entity
+
+
+def scheduleNearlySoldOutUpdate(conf):
+    """Queue a check of a conference against the nearly sold out set; within
+    a transaction, the task is only added if it commits."""
+    taskqueue.add(params={'wsck': conf.key.urlsafe()},
+                  url='/tasks/update_nearly_sold_out',
+                  transactional=ndb.in_transaction())
+
+
+def updateNearlySoldOut(conf, seats):
+    """
+    Add or remove a conference from the nearly sold out set
+
+    Cheap when nothing changes: the set is read from memcache and only
+    written when the conference crosses the threshold or was renamed.
+
+    Args:
+        conf (Conference): conference whose seats or name changed
+        seats (int): seats now available for conf
+    """
+    name = conf.name if isNearlySoldOut(seats) else None
+    if _members().get(conf.key.urlsafe()) != name:
+        _store({conf.key: name})
+
+
+def reconcileNearlySoldOut(confs):
+    """
+    Replace the nearly sold out set, if it differs from the conferences
+    found nearly sold out by their live seat count
+
+    Conference.seatsAvailable trails the seat shards by up to
+    SEATS_SYNC_INTERVAL, so the conferences a query finds by it, along with
+    the current members, are only candidates: each is kept or left out by
+    countSeats, like the incremental updates do, so a fresh update isn't
+    undone.
+
+    Args:
+        confs (list): conferences nearly sold out by their seatsAvailable,
+                      as found by a query
+    """
+    members = _members()
+    found = set(conf.key for conf in confs)
+    confs = list(confs) + [conf for conf in ndb.get_multi(
+        [ndb.Key(urlsafe=key) for key in members
+         if ndb.Key(urlsafe=key) not in found]) if conf]
+    expected = {conf.key.urlsafe(): conf.name for conf in confs
+                if isNearlySoldOut(countSeats(conf))}
+    if members != expected:
+        changes = {ndb.Key(urlsafe=key): None for key in members}
+        changes.update((ndb.Key(urlsafe=key), name)
+                       for key, name in expected.items())
+        _store(changes)
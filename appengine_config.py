@@ -1,5 +1,13 @@
+import os
+
+from google.appengine.ext import vendor
+
 appstats_CALC_RPC_COSTS = True
 
+# third-party libraries installed with pip install -t lib -r requirements.txt
+if os.path.isdir(os.path.join(os.path.dirname(__file__), 'lib')):
+    vendor.add(os.path.join(os.path.dirname(__file__), 'lib'))
+
 
 def webapp_add_wsgi_middleware(app):
     from google.appengine.ext.appstats import recording
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""attendance.py
+
+Udacity conference server-side Python App Engine conference attendance
+
+Registrations and wishlists are kept as Attendance and SessionWish entities,
+children of the user's Profile keyed by the websafe key of the conference or
+session, instead of lists on the Profile. Checking or changing one of them is
+a single get or put within the user's entity group, whatever the number of
+registrations, and the attendees of a conference can be queried.
+
+"""
+
+from google.appengine.ext import ndb
+
+from analytics import recordAttendance, recordWishes
+from models import Attendance, SessionWish
+from transactions import transactional
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+
+def attendanceKey(p_key, c_key):
+    """Return the key of a user's registration for a conference."""
+    return ndb.Key(Attendance, c_key.urlsafe(), parent=p_key)
+
+
+def wishKey(p_key, s_key):
+    """Return the key of a session in a user's wishlist."""
+    return ndb.Key(SessionWish, s_key.urlsafe(), parent=p_key)
+
+
+def newAttendance(p_key, c_key):
+    """Build the registration of a user for a conference."""
+    return Attendance(key=attendanceKey(p_key, c_key), conference=c_key)
+
+
+def newWish(p_key, s_key):
+    """Build the wishlist entry of a session for a user."""
+    return SessionWish(key=wishKey(p_key, s_key), session=s_key,
+                       conference=s_key.parent())
+
+
+@ndb.tasklet
+def _childKeysAsync(kind, p_key):
+    """Return the keys encoded in the ids of a Profile's children."""
+    keys = yield kind.query(ancestor=p_key).fetch_async(keys_only=True)
+    raise ndb.Return([ndb.Key(urlsafe=key.string_id()) for key in keys])
+
+
+def attendedConferenceKeysAsync(p_key):
+    """
+    Return the keys of the conferences a user is registered for
+
+    Args:
+        p_key (ndb.Key): key of the user's Profile
+    Returns:
+        future (ndb.Future): resolves to a list of Conference keys
+    """
+    return _childKeysAsync(Attendance, p_key)
+
+
+def wishedSessionKeysAsync(p_key):
+    """
+    Return the keys of the sessions in a user's wishlist
+
+    Args:
+        p_key (ndb.Key): key of the user's Profile
+    Returns:
+        future (ndb.Future): resolves to a list of Session keys
+    """
+    return _childKeysAsync(SessionWish, p_key)
+
+
+def attendeesQuery(c_key):
+    """Return the query for the registrations of a conference; the parents
+    of the results are the attendees' Profile keys."""
+    return Attendance.query(Attendance.conference == c_key)
+
+
+def hasLegacyLists(profile):
+    """Return True if a Profile still lists conferences or sessions."""
+    return bool(profile.conferenceKeysToAttend or profile.sessionKeysToAttend)
+
+
+@transactional
+def migrateProfile(p_key):
+    """
+    Move the conferences & sessions listed on a Profile to their own entities
+
+    Args:
+        p_key (ndb.Key): key of the Profile to be migrated
+    Returns:
+        profile (Profile): migrated Profile, None if there's none
+    """
+    profile = p_key.get()
+    if not profile or not hasLegacyLists(profile):
+        return profile
+    entities = ([newAttendance(p_key, c_key)
+                 for c_key in set(profile.conferenceKeysToAttend)] +
+                [newWish(p_key, s_key)
+                 for s_key in set(profile.sessionKeysToAttend)])
+    # count the moved registrations & wishes in the attendee stats, once
+    # the migration commits
+    recordAttendance(list(set(profile.conferenceKeysToAttend)),
+                     profile.teeShirtSize, 1)
+    recordWishes(list(set(profile.sessionKeysToAttend)), 1)
+    profile.conferenceKeysToAttend = []
+    profile.sessionKeysToAttend = []
+    ndb.put_multi(entities + [profile])
+    return profile
+
+
+def migrateProfiles(profiles):
+    """Migrate those of a batch of Profiles still listing conferences or
+    sessions, returning how many were."""
+    migrated = [profile.key for profile in profiles if hasLegacyLists(profile)]
+    for p_key in migrated:
+        migrateProfile(p_key)
+    return len(migrated)
+
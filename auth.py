@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""auth.py
+
+Udacity conference server-side Python App Engine request-scoped user context
+
+Resolves the signed in user and their user id once per request, and loads
+their Profile at most once, for every helper of the request to share.
+authMiddleware starts a new context with each request. Within a
+transaction the Profile is read as part of the transaction, and only kept
+for the rest of the request once the transaction has committed.
+
+"""
+
+import threading
+
+import endpoints
+from google.appengine.ext import ndb
+
+from attendance import hasLegacyLists, migrateProfile
+from models import Profile, TeeShirtSize
+from settings import USER_ID_TYPE
+from utils import getUserId
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# marks the user as not resolved yet
+_UNRESOLVED = object()
+
+# user, user id & Profile of the request running on the current thread
+_local = threading.local()
+
+
+def reset():
+    """Start a new request: forget the user & Profile of the previous one."""
+    _local.user = _UNRESOLVED
+    _local.userId = None
+    _local.profile = None
+
+
+def authMiddleware(app):
+    """
+    Wrap a WSGI application so each of its requests gets a fresh context
+
+    Args:
+        app (callable): WSGI application, e.g. the endpoints API server
+    Returns:
+        app (callable): WSGI application resetting the context per request
+    """
+    def contextApp(environ, start_response):
+        reset()
+        try:
+            return app(environ, start_response)
+        finally:
+            reset()
+    return contextApp
+
+
+def currentUser():
+    """Return the signed in user, None if there's none; resolved once."""
+    if getattr(_local, 'user', _UNRESOLVED) is _UNRESOLVED:
+        reset()
+        _local.user = endpoints.get_current_user()
+        if _local.user:
+            _local.userId = getUserId(_local.user, USER_ID_TYPE)
+    return _local.user
+
+
+def currentUserId():
+    """Return the signed in user's id, raising UnauthorizedException if
+    there's no signed in user."""
+    if not currentUser():
+        raise endpoints.UnauthorizedException('Authorization required')
+    return _local.userId
+
+
+def profileKey():
+    """Return the key of the signed in user's Profile."""
+    return ndb.Key(Profile, currentUserId())
+
+
+def keepProfile(profile):
+    """Share a Profile read or written by the request with its other
+    helpers; within a transaction, only once the transaction commits."""
+    def keep():
+        _local.profile = profile
+    if ndb.in_transaction():
+        ndb.get_context().call_on_commit(keep)
+    else:
+        keep()
+
+
+def getProfile():
+    """
+    Return the signed in user's Profile, creating it if non-existent
+
+    Outside of transactions the Profile is read once per request. Within
+    a transaction it's always read as part of the transaction, so the
+    transaction is retried if the Profile changes before it commits.
+    Profiles still listing the conferences & sessions of the user are
+    migrated to Attendance & SessionWish entities on the way.
+
+    Returns:
+        profile (Profile): Profile of the signed in user
+    """
+    p_key = profileKey()
+    if _local.profile is not None and not ndb.in_transaction():
+        return _local.profile
+    profile = p_key.get()
+    if not profile:
+        user = currentUser()
+        profile = Profile(
+            key=p_key,
+            displayName=user.nickname(),
+            mainEmail=user.email(),
+            teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
+        )
+        profile.put()
+    elif hasLegacyLists(profile):
+        profile = migrateProfile(p_key)
+    keepProfile(profile)
+    return profile
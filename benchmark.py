@@ -0,0 +1,725 @@
+#!/usr/bin/env python
+
+"""
+benchmark.py -- Udacity conference server-side Python App Engine
+
+Benchmarks of the ConferenceApi run against the App Engine testbed stubs.
+The App Engine SDK (and its bundled endpoints/protorpc/webapp2 libraries)
+must be importable, e.g.
+
+    $ export PYTHONPATH=$SDK:$SDK/lib/endpoints-1.0:$SDK/lib/protorpc-1.0
+    $ python benchmark.py rpc --conferences 200 --organizers 10
+
+Results are printed to stdout as JSON.
+
+"""
+
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import endpoints
+import webapp2
+from protorpc import message_types
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import datastore_errors
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from google.appengine.runtime import request_environment
+
+from attendance import newAttendance, attendeesQuery
+from auth import reset as resetRequest
+from conference import ConferenceApi
+from containers import CONF_GET_REQUEST, SESSION_GET_REQUEST
+from containers import SESSIONS_GET_REQUEST
+from counters import createShards, countSeats, reserveSeat
+from main import app as mainApp
+from models import Profile, ProfileForm, TeeShirtSize
+from models import Conference, ConferenceForm, ConferenceForms
+from models import ConferenceQueryForm, ConferenceQueryForms
+from models import Session, SessionForm, Speaker, SpeakerForm
+from models import ConferenceSpeaker
+from search import prefixes
+from serializers import toForm
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+BENCH_USER = 'bench-user@example.com'
+LOAD_MIX = 'queryConferences=40,getConferenceSessions=40,' \
+           'registerForConference=10,addSessionToWishList=10'
+PERCENTILES = (50, 90, 99)
+
+
+class RpcCounter(object):
+    """RpcCounter -- count App Engine API calls made while recording"""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.recording = False
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'benchmark_rpc_counter', self)
+
+    def __call__(self, service, call, request, response):
+        if self.recording:
+            self.calls['%s.%s' % (service, call)] += 1
+
+    def record(self, func, *args):
+        """Run func as a fresh request and return its RPC counts."""
+        # drop the ndb in-context cache & the request's user context so
+        # every call starts cold
+        ndb.get_context().clear_cache()
+        resetRequest()
+        self.calls.clear()
+        self.recording = True
+        try:
+            func(*args)
+        finally:
+            self.recording = False
+        return dict(self.calls, total=sum(self.calls.values()))
+
+
+def setUpTestbed():
+    """Activate the testbed stubs used by ConferenceApi and main.app."""
+    tb = testbed.Testbed()
+    tb.activate()
+    # make every write immediately visible to queries
+    policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+    tb.init_datastore_v3_stub(consistency_policy=policy)
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=os.path.dirname(os.path.abspath(
+                                                                __file__)))
+    tb.init_urlfetch_stub()
+    tb.init_mail_stub()
+    tb.init_app_identity_stub()
+    # authenticate every endpoints call as the benchmark user
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = BENCH_USER
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'example.com'
+    return tb
+
+
+def seedConferences(conferences, organizers):
+    """Create Profiles and Conferences spread evenly across organizers."""
+    profiles = [Profile(id='organizer%d@example.com' % i,
+                        displayName='Organizer %d' % i,
+                        mainEmail='organizer%d@example.com' % i)
+                for i in range(organizers)]
+    profiles.append(Profile(id=BENCH_USER, displayName='Bench User',
+                            mainEmail=BENCH_USER))
+    ndb.put_multi(profiles)
+    confs = []
+    for i in range(conferences):
+        prof = profiles[i % organizers]
+        confs.append(Conference(parent=prof.key, name='Conference %05d' % i,
+                                organizerUserId=prof.key.id(),
+                                organizerDisplayName=prof.displayName,
+                                city='City %d' % (i % 7), month=i % 12 + 1,
+                                topics=['Topic %d' % (i % 5)],
+                                maxAttendees=100, seatsAvailable=100))
+    conf_keys = ndb.put_multi(confs)
+    # register the benchmark user for every other conference
+    bench = profiles[-1]
+    ndb.put_multi([newAttendance(bench.key, c_key)
+                   for c_key in conf_keys[::2]])
+
+
+def legacyQueryConferences(api, request):
+    """queryConferences before single-pass materialisation, for reference."""
+    conferences = api._getQuery(request).query
+    organisers = [ndb.Key(Profile, conf.organizerUserId)
+                  for conf in conferences]
+    names = {}
+    for profile in ndb.get_multi(organisers):
+        names[profile.key.id()] = profile.displayName
+    return ConferenceForms(
+        items=[api._copyConferenceToForm(conf, names[conf.organizerUserId])
+               for conf in conferences])
+
+
+def benchRpc(args):
+    """Report the RPCs per request made by the conference list endpoints."""
+    seedConferences(args.conferences, args.organizers)
+    api = ConferenceApi()
+    counter = RpcCounter()
+    # request a page large enough to hold every seeded conference
+    page = ConferenceQueryForms(pageSize=min(args.conferences, 100))
+    return {
+        'conferences': args.conferences,
+        'organizers': args.organizers,
+        'rpcs': {
+            'queryConferences (legacy)': counter.record(
+                legacyQueryConferences, api, ConferenceQueryForms()),
+            'queryConferences': counter.record(api.queryConferences, page),
+            'getConferencesToAttend': counter.record(
+                api.getConferencesToAttend, message_types.VoidMessage()),
+        },
+    }
+
+
+@ndb.transactional(xg=True)
+def legacyReserveSeat(conf, register):
+    """Seat reservation on the Conference entity itself, for reference."""
+    conf = conf.key.get()
+    if conf.seatsAvailable <= 0:
+        return False
+    register()
+    conf.seatsAvailable -= 1
+    conf.put()
+    return True
+
+
+def benchSeats(args):
+    """Register concurrently for one conference and check for oversells."""
+    organizer = Profile(id='organizer@example.com', displayName='Organizer')
+    organizer.put()
+    results = {'seats': args.seats, 'threads': args.threads}
+    for strategy, reserve in (('sharded', reserveSeat),
+                              ('single entity', legacyReserveSeat)):
+        conf = Conference(parent=organizer.key, name=strategy,
+                          organizerUserId=organizer.key.id(),
+                          maxAttendees=args.seats, seatsAvailable=args.seats)
+        if reserve is reserveSeat:
+            ndb.put_multi([conf] + createShards(conf))
+        else:
+            conf.put()
+        stats = collections.Counter()
+        lock = threading.Lock()
+
+        def attendee(worker):
+            for i in range(args.attempts):
+                p_key = ndb.Key(Profile, '%s-%d-%d' % (strategy, worker, i))
+
+                def register():
+                    ndb.put_multi([Profile(key=p_key),
+                                   newAttendance(p_key, conf.key)])
+                try:
+                    outcome = 'reserved' if reserve(conf, register) \
+                        else 'sold out'
+                except datastore_errors.TransactionFailedError:
+                    outcome = 'contention failures'
+                with lock:
+                    stats[outcome] += 1
+
+        threads = [threading.Thread(target=attendee, args=(worker,))
+                   for worker in range(args.threads)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        ndb.get_context().clear_cache()
+        registered = attendeesQuery(conf.key).count()
+        remaining = countSeats(conf.key.get(), cached=False)
+        stats.update({
+            'attempts': args.threads * args.attempts,
+            'registrations per second': args.threads * args.attempts / elapsed,
+            'registered': registered,
+            'seats remaining': remaining,
+            'oversold': max(0, registered - args.seats),
+            'seats lost': args.seats - registered - remaining,
+        })
+        results[strategy] = dict(stats)
+    return results
+
+
+def legacyConferenceToForm(conf):
+    """_copyConferenceToForm before compiled serializers, for reference."""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    cf.check_initialized()
+    return cf
+
+
+def legacyProfileToForm(prof):
+    """_copyProfileToForm before compiled serializers, for reference."""
+    pf = ProfileForm()
+    for field in pf.all_fields():
+        if hasattr(prof, field.name):
+            if field.name.endswith('Attend'):
+                key_list = [x.urlsafe() for x in getattr(prof, field.name)]
+                setattr(pf, field.name, key_list)
+            elif field.name == 'teeShirtSize':
+                setattr(pf, field.name,
+                        getattr(TeeShirtSize, getattr(prof, field.name)))
+            else:
+                setattr(pf, field.name, getattr(prof, field.name))
+    pf.check_initialized()
+    return pf
+
+
+def legacySessionToForm(session):
+    """_copySessionToForm before compiled serializers, for reference."""
+    sf = SessionForm()
+    for field in sf.all_fields():
+        if hasattr(session, field.name):
+            if field.name in ['date', 'startTime']:
+                setattr(sf, field.name, str(getattr(session, field.name)))
+            else:
+                setattr(sf, field.name, getattr(session, field.name))
+        elif field.name == "websafeKey":
+            setattr(sf, field.name, session.key.urlsafe())
+    sf.check_initialized()
+    return sf
+
+
+def legacySpeakerToForm(speaker):
+    """_copySpeakerToForm before compiled serializers, for reference."""
+    sf = SpeakerForm()
+    for field in sf.all_fields():
+        if field.name == 'speakerId':
+            sf.speakerId = speaker.key.integer_id()
+        elif hasattr(speaker, field.name):
+            setattr(sf, field.name, getattr(speaker, field.name))
+    sf.check_initialized()
+    return sf
+
+
+def syntheticEntities(count):
+    """Build unsaved entities of every serialized kind, keys included."""
+    p_key = ndb.Key(Profile, 'organizer@example.com')
+    c_keys = [ndb.Key(Conference, i + 1, parent=p_key) for i in range(count)]
+    return {
+        Conference: [Conference(key=c_key, name='Conference %d' % i,
+                                description='Description %d' % i,
+                                organizerUserId=p_key.id(),
+                                organizerDisplayName='Organizer',
+                                topics=['Topic %d' % (i % 5), 'Default'],
+                                city='City %d' % (i % 7),
+                                startDate=datetime.date(2016, i % 12 + 1, 1),
+                                endDate=datetime.date(2016, i % 12 + 1, 3),
+                                month=i % 12 + 1, maxAttendees=100,
+                                seatsAvailable=i % 100)
+                     for i, c_key in enumerate(c_keys)],
+        Profile: [Profile(key=ndb.Key(Profile, 'user%d@example.com' % i),
+                          displayName='User %d' % i,
+                          mainEmail='user%d@example.com' % i,
+                          teeShirtSize='XL_M',
+                          conferenceKeysToAttend=c_keys[i % count:][:10])
+                  for i in range(count)],
+        Session: [Session(key=ndb.Key(Session, i + 1, parent=c_keys[i]),
+                          name='Session %d' % i, sessionType='lecture',
+                          speakerId=i % 50 + 1, highlight='Highlight',
+                          date=datetime.date(2016, 1, 1),
+                          startTime=datetime.time(i % 24, 0),
+                          duration_minutes=60)
+                  for i in range(count)],
+        Speaker: [Speaker(key=ndb.Key(Speaker, i + 1),
+                          displayName='Speaker %d' % i,
+                          mainEmail='speaker%d@example.com' % i)
+                  for i in range(count)],
+    }
+
+
+def benchSerializers(args):
+    """Time reflection based and compiled entity to form copies."""
+    forms = {Conference: (ConferenceForm, legacyConferenceToForm),
+             Profile: (ProfileForm, legacyProfileToForm),
+             Session: (SessionForm, legacySessionToForm),
+             Speaker: (SpeakerForm, legacySpeakerToForm)}
+    results = {'entities': args.entities, 'repeat': args.repeat}
+    for model, entities in syntheticEntities(args.entities).items():
+        form_class, legacy = forms[model]
+        # both implementations must render identical forms
+        if [legacy(e) for e in entities] != [toForm(e, form_class)
+                                             for e in entities]:
+            raise AssertionError('%s forms differ' % model.__name__)
+        timings = {}
+        for name, copy in (('reflection', legacy),
+                           ('compiled', lambda e: toForm(e, form_class))):
+            best = None
+            for _ in range(args.repeat):
+                start = time.time()
+                for entity in entities:
+                    copy(entity)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings['%s ms' % name] = best * 1000
+        timings['speedup'] = timings['reflection ms'] / timings['compiled ms']
+        results[model.__name__] = timings
+    return results
+
+
+class LocalRpcCounter(threading.local):
+    """LocalRpcCounter -- count the API calls of each thread separately"""
+
+    def __init__(self):
+        self.calls = None
+
+    def __call__(self, service, call, request, response):
+        if self.calls is not None:
+            self.calls[service] += 1
+
+    def start(self):
+        self.calls = collections.Counter()
+
+    def stop(self):
+        """Stop counting and return the calls made since start()."""
+        calls, self.calls = self.calls, None
+        return calls
+
+
+def localEnviron():
+    """
+    Give every thread its own os.environ, as the threadsafe runtime does,
+    so that concurrent requests can be made by different users
+
+    Returns:
+        environ (dict): the process-wide environment, to start each
+                        request's environment from
+        restore (callable): puts the process-wide os.environ back
+    """
+    environ = os.environ
+    request_environment.current_request.Init(sys.stderr, dict(environ))
+    request_environment.PatchOsEnviron()
+
+    def restore():
+        os.environ = environ
+    return dict(environ), restore
+
+
+def parseMix(mix):
+    """Parse 'operation=weight,...' into (operations, weights) lists."""
+    pairs = [item.split('=') for item in mix.split(',') if item]
+    return [name for name, _ in pairs], [float(weight) for _, weight in pairs]
+
+
+def _weightedChoice(rand, items, weights):
+    """Pick one of items, each with a probability proportional to its
+    weight."""
+    point = rand.random() * sum(weights)
+    for item, weight in zip(items, weights):
+        point -= weight
+        if point < 0:
+            return item
+    return items[-1]
+
+
+def seedLoad(args):
+    """
+    Seed the volumes of a load run
+
+    Every user is registered for args.registrations conferences, with the
+    seats taken from the conferences' shards, so wishlists can be filled.
+
+    Returns:
+        users (list): emails of the seeded Profiles
+        sessions (dict): websafe conference keys mapped to the websafe keys
+                         of their sessions
+        registered (dict): user emails mapped to the set of websafe keys of
+                           the conferences they're registered for
+    """
+    rand = random.Random(args.seed)
+    users = ['user%d@example.com' % i for i in range(args.profiles)]
+    profiles = [Profile(id=email, displayName='User %d' % i, mainEmail=email,
+                        teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED))
+                for i, email in enumerate(users)]
+    confs = []
+    for i in range(args.conferences):
+        prof = profiles[i % len(profiles)]
+        confs.append(Conference(parent=prof.key, name='Conference %05d' % i,
+                                description='Description %d' % i,
+                                organizerUserId=prof.key.id(),
+                                organizerDisplayName=prof.displayName,
+                                city='City %d' % (i % 7), month=i % 12 + 1,
+                                topics=['Topic %d' % (i % 5)],
+                                maxAttendees=args.seats,
+                                seatsAvailable=args.seats))
+    ndb.put_multi(confs)
+
+    attendances = []
+    for prof in profiles:
+        for conf in rand.sample(confs, min(args.registrations, len(confs))):
+            attendances.append(newAttendance(prof.key, conf.key))
+            conf.seatsAvailable -= 1
+    shards = []
+    for conf in confs:
+        shards += createShards(conf)
+    ndb.put_multi(profiles + confs + shards + attendances)
+
+    speakers = [Speaker(displayName='Speaker %d' % i,
+                        mainEmail='speaker%d@example.com' % i,
+                        searchTokens=prefixes('Speaker %d' % i))
+                for i in range(args.speakers)]
+    speaker_ids = [key.id() for key in ndb.put_multi(speakers)]
+    sessions = []
+    for conf in confs:
+        for i in range(args.sessions):
+            sessions.append(Session(
+                parent=conf.key, name='Session %d' % i,
+                sessionType=rand.choice(['lecture', 'workshop', 'keynote']),
+                speakerId=rand.choice(speaker_ids) if speaker_ids else None,
+                date=datetime.date(2016, conf.month, 1),
+                startTime=datetime.time(9 + i % 9, 0), duration_minutes=60))
+    ndb.put_multi(sessions)
+    # the speaker index createSession keeps for each conference
+    indexes = {}
+    for session in sessions:
+        if session.speakerId:
+            index = indexes.setdefault(
+                (session.key.parent(), session.speakerId),
+                ConferenceSpeaker(id=session.speakerId,
+                                  parent=session.key.parent()))
+            index.sessionKeys.append(session.key)
+            index.sessionNames.append(session.name)
+    ndb.put_multi(indexes.values())
+
+    by_conference = {conf.key.urlsafe(): [] for conf in confs}
+    for session in sessions:
+        by_conference[session.key.parent().urlsafe()].append(
+            session.key.urlsafe())
+    registered = {email: set() for email in users}
+    for attendance in attendances:
+        registered[attendance.key.parent().id()].add(
+            attendance.conference.urlsafe())
+    return users, by_conference, registered
+
+
+def runTasks(taskqueue_stub, environ, counter, timings, lock):
+    """
+    Run the queued tasks through main.app, as the push queues would
+
+    Tasks are run right away, whatever their countdown.
+
+    Returns:
+        ran (int): number of tasks run
+    """
+    ran = 0
+    for task in taskqueue_stub.get_filtered_tasks():
+        taskqueue_stub.DeleteTask(task.queue_name, task.name)
+        request_environment.current_request.Init(sys.stderr, dict(environ))
+        ndb.get_context().clear_cache()
+        request = webapp2.Request.blank(task.url, method=task.method,
+                                        headers=task.headers)
+        if task.method == 'POST':
+            request.body = task.payload or ''
+        counter.start()
+        start = time.time()
+        response = request.get_response(mainApp)
+        elapsed = time.time() - start
+        rpcs = counter.stop()
+        outcome = ('ok' if response.status_int < 300
+                   else 'HTTP %d' % response.status_int)
+        with lock:
+            timings[task.url].append((elapsed, outcome, rpcs))
+        ran += 1
+    return ran
+
+
+def _summary(samples, elapsed):
+    """Throughput, outcomes, latency percentiles & RPCs of one operation."""
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    rpcs = collections.Counter()
+    for _, _, calls in samples:
+        rpcs.update(calls)
+    summary = {
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed,
+        'outcomes': dict(collections.Counter(outcome
+                                             for _, outcome, _ in samples)),
+        'latency ms': {'mean': sum(latencies) / len(latencies),
+                       'max': latencies[-1]},
+    }
+    for percentile in PERCENTILES:
+        summary['latency ms']['p%d' % percentile] = latencies[
+            min(len(latencies) - 1, len(latencies) * percentile // 100)]
+    summary['rpcs per request'] = {service: float(count) / len(samples)
+                                   for service, count in rpcs.items()}
+    summary['rpcs per request']['total'] = \
+        float(sum(rpcs.values())) / len(samples)
+    return summary
+
+
+def benchLoad(args):
+    """Drive a mix of endpoint calls from concurrent users and run the
+    tasks they queue through main.app."""
+    operations, weights = parseMix(args.mix)
+    users, sessions, registered = seedLoad(args)
+    conferences = sorted(sessions)
+    api = ConferenceApi()
+    timings = collections.defaultdict(list)
+    task_timings = collections.defaultdict(list)
+    lock = threading.Lock()
+    queries = [
+        [],
+        [ConferenceQueryForm(field='CITY', operator='EQ', value='City 1')],
+        [ConferenceQueryForm(field='MONTH', operator='GT', value='6')],
+        [ConferenceQueryForm(field='TOPIC', operator='EQ', value='Topic 2'),
+         ConferenceQueryForm(field='MONTH', operator='LTEQ', value='9')],
+    ]
+
+    def queryConferences(rand, user):
+        api.queryConferences(ConferenceQueryForms(
+            filters=rand.choice(queries), pageSize=args.page_size))
+
+    def getConferenceSessions(rand, user):
+        api.getConferenceSessions(SESSIONS_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=rand.choice(conferences),
+            pageSize=args.page_size))
+
+    def registerForConference(rand, user):
+        wsck = rand.choice(conferences)
+        api.registerForConference(CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck))
+        with lock:
+            registered[user].add(wsck)
+
+    def addSessionToWishList(rand, user):
+        with lock:
+            attending = sorted(wsck for wsck in registered[user]
+                               if sessions[wsck])
+        api.addSessionToWishList(SESSION_GET_REQUEST.combined_message_class(
+            websafeSessionKey=rand.choice(
+                sessions[rand.choice(attending or conferences)])))
+
+    calls = {'queryConferences': queryConferences,
+             'getConferenceSessions': getConferenceSessions,
+             'registerForConference': registerForConference,
+             'addSessionToWishList': addSessionToWishList}
+    unknown = set(operations) - set(calls)
+    if unknown:
+        raise ValueError('Unknown operations: %s' % ', '.join(sorted(unknown)))
+    if not conferences or ('addSessionToWishList' in operations and
+                           not args.sessions):
+        raise ValueError('Nothing to call: seed conferences and sessions')
+
+    environ, restore = localEnviron()
+    counter = LocalRpcCounter()
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'benchmark_local_rpc_counter', counter)
+    taskqueue_stub = apiproxy_stub_map.apiproxy.GetStub('taskqueue')
+    remaining = itertools.count()
+    done = threading.Event()
+
+    def worker(number):
+        rand = random.Random('%s-%d' % (args.seed, number))
+        while next(remaining) < args.requests:
+            name = _weightedChoice(rand, operations, weights)
+            user = rand.choice(users)
+            # every request starts with its own environment & a cold cache
+            request_environment.current_request.Init(
+                sys.stderr, dict(environ, ENDPOINTS_AUTH_EMAIL=user))
+            ndb.get_context().clear_cache()
+            resetRequest()
+            counter.start()
+            start = time.time()
+            try:
+                calls[name](rand, user)
+                outcome = 'ok'
+            except endpoints.ServiceException as e:
+                outcome = type(e).__name__
+            except datastore_errors.TransactionFailedError:
+                outcome = 'TransactionFailedError'
+            elapsed = time.time() - start
+            rpcs = counter.stop()
+            with lock:
+                timings[name].append((elapsed, outcome, rpcs))
+
+    def taskRunner():
+        while not done.wait(args.task_interval):
+            runTasks(taskqueue_stub, environ, counter, task_timings, lock)
+
+    try:
+        threads = [threading.Thread(target=worker, args=(number,))
+                   for number in range(args.threads)]
+        tasks = threading.Thread(target=taskRunner)
+        start = time.time()
+        tasks.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        done.set()
+        tasks.join()
+        # tasks still queued at the end, e.g. those queued by other tasks
+        while runTasks(taskqueue_stub, environ, counter, task_timings,
+                       lock):
+            pass
+    finally:
+        restore()
+
+    return {
+        'volumes': {'profiles': args.profiles,
+                    'conferences': args.conferences,
+                    'sessions': args.sessions * args.conferences,
+                    'speakers': args.speakers},
+        'threads': args.threads,
+        'requests': args.requests,
+        'seconds': elapsed,
+        'throughput': args.requests / elapsed,
+        'operations': {name: _summary(samples, elapsed)
+                       for name, samples in timings.items()},
+        'tasks': {url: _summary(samples, elapsed)
+                  for url, samples in task_timings.items()},
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    subparsers = parser.add_subparsers()
+
+    rpc = subparsers.add_parser('rpc', help=benchRpc.__doc__)
+    rpc.add_argument('--conferences', type=int, default=100)
+    rpc.add_argument('--organizers', type=int, default=10)
+    rpc.set_defaults(func=benchRpc)
+
+    seats = subparsers.add_parser('seats', help=benchSeats.__doc__)
+    seats.add_argument('--seats', type=int, default=500)
+    seats.add_argument('--threads', type=int, default=20)
+    seats.add_argument('--attempts', type=int, default=50)
+    seats.set_defaults(func=benchSeats)
+
+    serializers = subparsers.add_parser('serializers',
+                                        help=benchSerializers.__doc__)
+    serializers.add_argument('--entities', type=int, default=1000)
+    serializers.add_argument('--repeat', type=int, default=5)
+    serializers.set_defaults(func=benchSerializers)
+
+    load = subparsers.add_parser('load', help=benchLoad.__doc__)
+    load.add_argument('--profiles', type=int, default=200)
+    load.add_argument('--conferences', type=int, default=100)
+    load.add_argument('--sessions', type=int, default=5,
+                      help='sessions per conference')
+    load.add_argument('--speakers', type=int, default=50)
+    load.add_argument('--seats', type=int, default=100,
+                      help='seats per conference')
+    load.add_argument('--registrations', type=int, default=2,
+                      help='conferences each user is registered for')
+    load.add_argument('--threads', type=int, default=10)
+    load.add_argument('--requests', type=int, default=2000)
+    load.add_argument('--mix', default=LOAD_MIX,
+                      help='operation=weight pairs, comma separated')
+    load.add_argument('--page-size', type=int, default=20)
+    load.add_argument('--task-interval', type=float, default=0.5,
+                      help='seconds between runs of the queued tasks')
+    load.add_argument('--seed', type=int, default=0)
+    load.set_defaults(func=benchLoad)
+
+    args = parser.parse_args(argv)
+    tb = setUpTestbed()
+    try:
+        result = args.func(args)
+    finally:
+        tb.deactivate()
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""cache.py
+
+Udacity conference server-side Python App Engine rendered form cache
+
+Read-through memcache cache of the ProtoRPC forms rendered for single
+Conference, Session, Speaker and Profile entities, so the hottest get
+endpoints skip both the Datastore read and the entity to form copy.
+
+A miss first leaves a placeholder and only swaps the rendered form in with
+compare-and-set, so a form rendered before a concurrent update (whose
+invalidation drops the placeholder) is never cached. Hits & misses are
+counted without waiting for memcache, and each instance tracks the hit rate
+of the batch lookups of list requests, so they only look forms up when it's
+worth a round trip.
+
+"""
+
+import collections
+import random
+
+from protorpc import protobuf
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from settings import MEMCACHE_FORM_KEY, MEMCACHE_FORM_STATS_KEY
+from settings import FORM_CACHE_VERSION, FORM_CACHE_TTL
+from settings import FORM_PEEK_MIN_HIT_RATE, FORM_PEEK_PROBE
+from settings import FORM_PEEK_WINDOW
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# cached while a miss renders the form; forms are cached as strings
+PLACEHOLDER = 0
+PLACEHOLDER_TTL = 10
+
+# per kind, forms looked up and found by peekForms on this instance, halved
+# every FORM_PEEK_WINDOW lookups so the rate follows recent requests
+_peeked = collections.defaultdict(lambda: [0, 0])
+
+
+def _cacheKey(key):
+    return MEMCACHE_FORM_KEY % (FORM_CACHE_VERSION, key.urlsafe())
+
+
+def _isForm(data):
+    return isinstance(data, basestring)
+
+
+def _count(kind, outcome):
+    """Count a hit or miss, without waiting for the RPC."""
+    memcache.Client().incr_async(MEMCACHE_FORM_STATS_KEY % (kind, outcome),
+                                 initial_value=0)
+
+
+def _countMulti(keys, found):
+    """Count the hits & misses of a batch of lookups in one RPC, without
+    waiting for it."""
+    counts = {}
+    for key in keys:
+        stat = MEMCACHE_FORM_STATS_KEY % (
+                    key.kind(), 'hits' if key in found else 'misses')
+        counts[stat] = counts.get(stat, 0) + 1
+    memcache.Client().offset_multi_async(counts, initial_value=0)
+
+
+def getForm(form_class, key, build):
+    """
+    Return the form rendered for an entity, rendering it on a cache miss
+
+    Args:
+        form_class (Message): class of the cached form
+        key (ndb.Key): key of the entity the form is rendered from
+        build (callable): renders the form from Datastore on a cache miss
+    Returns:
+        form (Message): cached or freshly rendered form
+    """
+    cache_key = _cacheKey(key)
+    client = memcache.Client()
+    data = client.gets(cache_key)
+    if _isForm(data):
+        _count(key.kind(), 'hits')
+        return protobuf.decode_message(form_class, data)
+
+    _count(key.kind(), 'misses')
+    # leave a placeholder before reading the entity: an update invalidating
+    # the form from now on deletes it, making the cas below fail
+    if data is None and client.add(cache_key, PLACEHOLDER,
+                                   time=PLACEHOLDER_TTL):
+        data = client.gets(cache_key)
+    form = build()
+    if data == PLACEHOLDER:
+        client.cas(cache_key, protobuf.encode_message(form),
+                   time=FORM_CACHE_TTL[key.kind()])
+    return form
+
+
+def peekForms(form_class, keys):
+    """
+    Return the cached forms of several entities, without rendering misses
+
+    Args:
+        form_class (Message): class of the cached forms
+        keys (list): keys of the entities the forms are rendered from
+    Returns:
+        forms (dict): form per key, for the keys whose form is cached
+    """
+    cache_keys = {_cacheKey(key): key for key in keys}
+    cached = memcache.get_multi(cache_keys.keys())
+    forms = {cache_keys[cache_key]: protobuf.decode_message(form_class, data)
+             for cache_key, data in cached.items() if _isForm(data)}
+    if keys:
+        _countMulti(keys, forms)
+        peeked = _peeked[keys[0].kind()]
+        peeked[0] += len(keys)
+        peeked[1] += len(forms)
+        if peeked[0] >= FORM_PEEK_WINDOW:
+            peeked[:] = [peeked[0] // 2, peeked[1] // 2]
+    return forms
+
+
+def worthPeeking(kind):
+    """
+    Tell whether a list request should look up the cached forms of a kind
+
+    Looking forms up takes a keys only query and a memcache round trip
+    before the misses are read, so it only pays off when most forms are
+    cached. One request in FORM_PEEK_PROBE looks them up anyway, to keep the
+    hit rate current.
+
+    Args:
+        kind (string): entity kind of the forms
+    Returns:
+        peek (Boolean): True to look the forms up with peekForms, False to
+                        read the entities with the query
+    """
+    lookups, hits = _peeked[kind]
+    if not lookups or random.random() < 1.0 / FORM_PEEK_PROBE:
+        return True
+    return hits >= FORM_PEEK_MIN_HIT_RATE * lookups
+
+
+def invalidate(*keys):
+    """
+    Drop the cached forms of entities
+
+    Within a transaction, the forms are only dropped once it commits, so a
+    concurrent read can't cache the form of the entity as it was before.
+
+    Args:
+        keys (ndb.Key): keys of the updated entities
+    """
+    cache_keys = [_cacheKey(key) for key in keys]
+    ndb.get_context().call_on_commit(
+        lambda: memcache.delete_multi(cache_keys))
+
+
+def stats():
+    """Return the number of cache hits and misses per entity kind."""
+    keys = {(kind, outcome): MEMCACHE_FORM_STATS_KEY % (kind, outcome)
+            for kind in FORM_CACHE_TTL for outcome in ('hits', 'misses')}
+    counts = memcache.get_multi(keys.values())
+    result = {}
+    for (kind, outcome), key in keys.items():
+        result.setdefault(kind, {})[outcome] = int(counts.get(key, 0))
+    return result
@@ -8,12 +8,14 @@ API endpoints definition and helper functions
 
 """
 
+import random
 from datetime import datetime, timedelta
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
@@ -23,24 +25,55 @@ from containers import CONF_GET_REQUEST, CONF_GET_SIMILAR, CONF_POST_REQUEST
 from containers import CREATE_SESSION, SESSION_GET_REQUEST, SESSION_POST_REQUEST
 from containers import SESSIONS_GET_REQUEST, SESSION_QUERY_TYPE
 from containers import SESSION_QUERY_TIME, SPEAKER_GET_REQUEST, SPEAKER_BY_NAME
+from containers import SPEAKER_SESSIONS_REQUEST, PAGE_REQUEST
+from containers import SPEAKER_SEARCH_REQUEST, CONF_SEARCH_REQUEST
+from containers import ATTENDEES_GET_REQUEST, IMPORT_SESSIONS_REQUEST
 
 from models import ConflictException
 from models import Profile, ProfileMiniForm, ProfileForm
+from models import AttendeeForm, AttendeeForms, TeeShirtSize
+from models import ConferenceStatsForm, TeeShirtSizeCountForm
+from models import SessionWishesForm
 from models import StringMessage, BooleanMessage
+from models import WebsafeKeysForm, BatchResultForm, BatchResultForms
 from models import Conference, ConferenceForm, ConferenceForms
 from models import ConferenceQueryForm, ConferenceQueryMiniForm
 from models import ConferenceQueryForms
-from models import TeeShirtSize
 from models import Session, SessionForm, SessionForms, SessionQueryForm
-from models import Speaker, SpeakerForm, SpeakerForms
+from models import Speaker, SpeakerForm, SpeakerForms, ConferenceSpeaker
+from models import FeaturedSpeaker
 
 from settings import WEB_CLIENT_ID, ANDROID_CLIENT_ID, IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
 from settings import MEMCACHE_ANNOUNCEMENTS_KEY, MEMCACHE_SPEAKER_KEY
-from settings import ANNOUNCEMENT_TPL
-from settings import DEFAULTS, SESSION_DEFAULTS, OPERATORS, FIELDS
-
-from utils import getUserId
+from settings import FEATURED_SPEAKER_REPLICAS, NEARLY_SOLD_OUT_SEATS
+from settings import OPERATORS, FIELDS
+from settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_BATCH_SIZE
+from settings import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from settings import SEARCH_BATCH_SIZE, SPEAKER_SEARCH_SCAN
+from settings import CONFERENCE_SEARCH_WEIGHTS, MAX_IMPORT_SIZE
+
+from counters import createShards, setSeats, countSeats
+from counters import reserveSeat, reserveSeats, releaseSeat
+from counters import scheduleSeatSync
+from announcements import updateNearlySoldOut, reconcileNearlySoldOut
+from announcements import scheduleNearlySoldOutUpdate
+from cache import getForm, peekForms, invalidate, worthPeeking
+from transactions import transactional
+from serializers import toForm
+from search import tokenize, prefixes, queryTokens, rankMatches
+from search import conferenceDocument, conferenceIndex, rankConferences
+from search import encodeCursor, decodeCursor
+from planner import planQuery, QueryPlan
+from profiler import profilerMiddleware, profiled
+from auth import authMiddleware, currentUser, currentUserId, profileKey
+from auth import getProfile, keepProfile
+from attendance import attendanceKey, wishKey, newAttendance, newWish
+from attendance import attendedConferenceKeysAsync, wishedSessionKeysAsync
+from attendance import attendeesQuery
+from analytics import recordAttendance, recordWishes, conferenceStats
+from loader import conferenceData, sessionData
+from loader import loadConferences, loadSessions, loadSpeakers
 
 __author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
 
@@ -79,104 +112,82 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
+    def _copyConferenceToForm(self, conf, displayName=None, fields=None):
         """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
+        cf = toForm(conf, ConferenceForm, fields)
+        if displayName and (fields is None or
+                            'organizerDisplayName' in fields):
+            cf.organizerDisplayName = displayName
         return cf
 
+    def _renderConferences(self, conferences, fields=None):
+        """Copy Conferences to ConferenceForms, filling in the organizer's
+        name from Profile where it isn't stored yet."""
+        # organiser displayName is stored on each conference; only fetch
+        # profiles for conferences that predate it
+        names = {}
+        if fields is None or 'organizerDisplayName' in fields:
+            names = self._getOrganizerNames(conferences)
+        return [self._copyConferenceToForm(conf,
+                                           names.get(conf.organizerUserId),
+                                           fields) for conf in conferences]
+
     # @user_authentication
     def _createConferenceObject(self, request):
         """Create Conference object, returning ConferenceForm/request."""
         # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
-        if not request.name:
-            raise endpoints.BadRequestException("Conference 'name' "
-                                                "field required")
-
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name)
-                for field in request.all_fields()}
-        del data['websafeKey']
-        del data['organizerDisplayName']
-
-        # add default values for those missing
-        # (both data model & outbound Message)
-        for df in DEFAULTS:
-            if data[df] in (None, []):
-                data[df] = DEFAULTS[df]
-                setattr(request, df, DEFAULTS[df])
-
-        # convert dates from strings to Date objects;
-
-        if data['startDate']:
-            data['startDate'] = datetime.strptime(
-                                    data['startDate'][:10], "%Y-%m-%d").date()
-            # set month based on start_date
-            data['month'] = data['startDate'].month
-        else:
-            data['month'] = 0
-        if data['endDate']:
-            data['endDate'] = datetime.strptime(
-                                    data['endDate'][:10], "%Y-%m-%d").date()
-        # set seatsAvailable to be same as maxAttendees on creation
-        if data["maxAttendees"] > 0 and data["seatsAvailable"] is None:
-            data["seatsAvailable"] = data["maxAttendees"]
+        # copy ConferenceForm/ProtoRPC Message into dict, with defaults
+        data = conferenceData(request)
         # generate Profile Key based on user ID and Conference
         # ID based on Profile key get Conference key from ID
         p_key = ndb.Key(Profile, user_id)
+        prof_future = p_key.get_async()
         c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
         c_key = ndb.Key(Conference, c_id, parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
-
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        # denormalise organizer's name so listings don't need the Profile
+        data['organizerDisplayName'] = request.organizerDisplayName = getattr(
+                                prof_future.get_result(), 'displayName', None)
+
+        # create Conference along with the shards holding its seats, send
+        # email to organizer confirming creation of Conference & return
+        # (modified) ConferenceForm
+        conf = Conference(**data)
+        shards = createShards(conf)
+        ndb.put_multi([conf] + shards)
+        conferenceIndex().put(conferenceDocument(conf))
+        updateNearlySoldOut(conf, conf.seatsAvailable)
         taskqueue.add(
-            params={'email': user.email(),
+            params={'email': currentUser().email(),
                     'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
         )
         return request
 
-    @ndb.transactional()
+    @transactional(xg=True, groups=lambda self, request: [
+        ndb.Key(urlsafe=request.websafeConferenceKey)])
     def _updateConferenceObject(self, request):
         """Update Conference object, returning ConferenceForm"""
         # authenticate user
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name)
-                for field in request.all_fields()}
         # get conference object from Datastore
         conf = self._getDataStoreObject(request.websafeConferenceKey)
         # check that user is owner
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
+        maxAttendees = conf.maxAttendees
 
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
+            # organizer's name is kept in sync with Profile, not by clients
+            if field.name == 'organizerDisplayName':
+                continue
             data = getattr(request, field.name)
             # only copy fields where we get data
             if data not in (None, []):
@@ -187,9 +198,24 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        invalidate(conf.key)
+
+        # keep the seat shards in line with the new seats or capacity
+        if conf.seatShards and (request.seatsAvailable is not None or
+                                conf.maxAttendees != maxAttendees):
+            if request.seatsAvailable is None:
+                conf.seatsAvailable = max(0, countSeats(conf, cached=False) +
+                                          conf.maxAttendees -
+                                          (maxAttendees or 0))
+            setSeats(conf, conf.seatsAvailable)
         conf.put()
-        prof = ndb.Key(Profile, user_id).get()
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        # announce the conference if it's now nearly sold out, once committed
+        scheduleNearlySoldOutUpdate(conf)
+        # re-index the conference only if a searched field was given
+        if any(getattr(request, field) not in (None, [])
+               for field in CONFERENCE_SEARCH_WEIGHTS):
+            conferenceIndex().put(conferenceDocument(conf))
+        return self._copyConferenceToForm(conf)
 
     @endpoints.method(
             ConferenceForm, ConferenceForm, path='createConference',
@@ -212,59 +238,50 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
-        # get parent's profile
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        c_key = self._decodeKey(request.websafeConferenceKey)
+
+        def build():
+            # get conference object from Datastore
+            conf = self._getEntityAsync(c_key).get_result()
+            # report the live seat count rather than the periodically synced
+            # one (registrations drop the cached form)
+            conf.seatsAvailable = countSeats(conf)
+            # get parent's profile only if organizer's name isn't stored yet
+            names = self._getOrganizerNames([conf])
+            return self._copyConferenceToForm(conf,
+                                              names.get(conf.organizerUserId))
+        # return ConferenceForm, rendered from Datastore if not cached
+        return getForm(ConferenceForm, c_key, build)
 
     @endpoints.method(
-            message_types.VoidMessage, ConferenceForms,
+            PAGE_REQUEST, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
-        """Return conferences created by user."""
+        """Return conferences created by user, one page at a time."""
         # authenticate user
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
         # create ancestor query for all key matches for this user
         confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
+        confs, next_token = self._fetchPage(confs, request)
+        names = self._getOrganizerNames(confs)
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(
-                conf, getattr(prof, 'displayName')) for conf in confs]
+                conf, names.get(conf.organizerUserId)) for conf in confs],
+            nextPageToken=next_token
         )
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
-
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-
-        for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"],
-                                                   filtr["operator"],
-                                                   filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+        """Return query plan from the submitted filters."""
+        # the planner sorts on the inequality filter run by Datastore first
+        return planQuery(Conference.query(),
+                         self._formatFilters(request.filters), ['name'])
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
         formatted_filters = []
-        inequality_field = None
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name)
@@ -277,20 +294,17 @@ class ConferenceApi(remote.Service):
                 raise endpoints.BadRequestException("Filter contains invalid "
                                                     "field or operator.")
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation been used in previous filters
-                # disallow the filter if inequality was performed on a different
-                # field before
-                # track the field on which the inequality operation is performed
-                if inequality_field and inequality_field != filtr["field"]:
+            # inequalities on more than one field are fine: the query
+            # planner runs all but one of them in memory
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
                     raise endpoints.BadRequestException(
-                            "Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
+                        "Filter on %s needs a number." % filtr["field"])
 
             formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+        return formatted_filters
 
     @endpoints.method(
             ConferenceQueryForms, ConferenceForms,
@@ -298,26 +312,44 @@ class ConferenceApi(remote.Service):
             http_method='POST',
             name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
-
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId))
-                      for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        """Query for conferences, one page at a time."""
+        plan = self._getQuery(request)
+        # only fill in the fields selected by the client, if any
+        forms, next_token = self._fetchForms(plan, request, ConferenceForm,
+                                             self._renderConferences)
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-                items=[
-                    self._copyConferenceToForm(conf,
-                                               names[conf.organizerUserId]
-                                               ) for conf in conferences]
+                items=forms,
+                nextPageToken=next_token,
+                queryPlan=plan.explain() if request.explain else None
+                )
+
+    @endpoints.method(
+            CONF_SEARCH_REQUEST, ConferenceForms,
+            path='searchConferences',
+            http_method='GET',
+            name='searchConferences')
+    def searchConferences(self, request):
+        """Search conferences by the words of their name, description,
+        topics & city, best matches first, one page at a time."""
+        page_size = self._pageSize(request)
+        # the token holds where the previous page stopped scanning each
+        # query word, and the matches it read but didn't return
+        try:
+            cursor = (decodeCursor(request.pageToken) if request.pageToken
+                      else None)
+            documents, cursor = rankConferences(request.query, page_size,
+                                                cursor)
+        except ValueError:
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % request.pageToken)
+        conferences = [conf for conf in ndb.get_multi(
+            [document.key.parent() for document in documents]) if conf]
+        next_token = encodeCursor(cursor) if cursor else None
+        return ConferenceForms(
+                items=self._renderConferences(conferences),
+                nextPageToken=next_token
                 )
 
     @endpoints.method(
@@ -327,21 +359,18 @@ class ConferenceApi(remote.Service):
             name='querySimilarConferences')
     def querySimilarConferences(self, request):
         """Query for similar conferences by the same creator."""
-        # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
-        # get parent's profile
-        prof = conf.key.parent().get()
+        c_key = self._decodeKey(request.websafeConferenceKey)
         # use ancestor query to get conferences by same creator,
         # then filter out the conference user provided
-        conferences = Conference.query(ancestor=prof.key).filter(
-                                                    Conference.key != conf.key)
+        query = Conference.query(ancestor=c_key.parent()).filter(
+                                                    Conference.key != c_key)
 
         # Create filterNode and perform search if all fields are provided
         if (request.field and request.operator and request.value):
             node = ndb.query.FilterNode(request.field,
                                         OPERATORS[request.operator],
                                         request.value)
-            conferences = conferences.filter(node)
+            query = query.filter(node)
 
         # Raise error if user didn't provide all 3 fields,
         # otherwise return current query result without further filtering
@@ -349,6 +378,13 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException(
                                 "You need to define field, operator, and value")
 
+        # get conference object, parent's profile and similar conferences
+        # from Datastore in parallel
+        conf_future = self._getConferenceAndOrganizerAsync(
+                                                request.websafeConferenceKey)
+        conferences_future = query.fetch_async()
+        conf, prof = conf_future.get_result()
+        conferences = conferences_future.get_result()
         return ConferenceForms(
                 items=[
                     self._copyConferenceToForm(conf,
@@ -359,57 +395,40 @@ class ConferenceApi(remote.Service):
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
-        """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert key objects to websafekey, put it back in a list
-                if field.name.endswith('Attend'):
-                    key_list = [x.urlsafe() for x in getattr(prof, field.name)]
-                    setattr(pf, field.name, key_list)
-                # convert t-shirt string to Enum;
-                elif field.name == 'teeShirtSize':
-                    setattr(pf, field.name,
-                            getattr(TeeShirtSize, getattr(prof, field.name)))
-                # just copy others
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
+        """Copy relevant fields from Profile to ProfileForm, listing the
+        conferences & sessions the user attends from their own entities."""
+        c_keys = attendedConferenceKeysAsync(prof.key)
+        s_keys = wishedSessionKeysAsync(prof.key)
+        pf = toForm(prof, ProfileForm)
+        pf.conferenceKeysToAttend = [key.urlsafe()
+                                     for key in c_keys.get_result()]
+        pf.sessionKeysToAttend = [key.urlsafe() for key in s_keys.get_result()]
         return pf
 
     def _getProfileFromUser(self):
         """
         Return user Profile from datastore, creating new one if non-existent.
-        """
-        # make sure user is authed
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
 
-        # get Profile from datastore
-        user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
-        # create new Profile if not there
-        if not profile:
-            profile = Profile(
-                key=p_key,
-                displayName=user.nickname(),
-                mainEmail=user.email(),
-                teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
-            )
-            profile.put()
-
-        return profile      # return Profile
+        The user is authenticated and the Profile read once per request, see
+        auth.py.
+        """
+        return getProfile()
 
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
+        # return cached ProfileForm if only getting the Profile
+        if not save_request:
+            return getForm(ProfileForm, profileKey(),
+                           lambda: self._copyProfileToForm(
+                                                self._getProfileFromUser()))
+
         # get user Profile
         prof = self._getProfileFromUser()
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            displayName = prof.displayName
+            teeShirtSize = prof.teeShirtSize
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -419,7 +438,19 @@ class ConferenceApi(remote.Service):
                         #    setattr(prof, field, str(val).upper())
                         # else:
                         #    setattr(prof, field, val)
-                        prof.put()
+            prof.put()
+            keepProfile(prof)
+            invalidate(prof.key)
+            # copy the new name onto all conferences the user organizes
+            if prof.displayName != displayName:
+                taskqueue.add(params={'userId': prof.key.id()},
+                              url='/tasks/update_organizer_name')
+            # move the user to the new size in the conferences they attend
+            if prof.teeShirtSize != teeShirtSize:
+                taskqueue.add(params={'userId': prof.key.id(),
+                                      'previous': teeShirtSize,
+                                      'teeShirtSize': prof.teeShirtSize},
+                              url='/tasks/update_attendee_size')
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -446,24 +477,15 @@ class ConferenceApi(remote.Service):
         """Create Announcement & assign to memcache; used by
         memcache cron job & putAnnouncement().
         """
+        # registrations & updates keep the announcement current; this only
+        # catches up with changes they missed (e.g. lost memcache updates),
+        # checking the candidates' live seat counts
         confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
             Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
+        ).fetch()
+        reconcileNearlySoldOut(confs)
+        return memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or ""
 
     @endpoints.method(
             message_types.VoidMessage, StringMessage,
@@ -477,47 +499,147 @@ class ConferenceApi(remote.Service):
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
-        """Register or unregister user for selected conference."""
-        retval = None
-        # get user Profile
+        """
+        Register or unregister user for selected conference.
+
+        The seat is taken from (or given back to) one of the conference's
+        seat shards in the same transaction that updates the user's Profile,
+        so the Conference entity itself isn't written on every registration.
+        """
+        # get conference object from Datastore while loading user Profile
+        conf_future = self._getEntityAsync(
+                            self._decodeKey(request.websafeConferenceKey))
         prof = self._getProfileFromUser()
-        # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        conf = conf_future.get_result()
+
+        def register():
+            # check if user already registered otherwise add
+            if not self._addConferencesToProfile(prof, [conf.key]):
+                raise ConflictException(
+                    "You have already registered for this conference")
+
+        def unregister():
+            # check if user already registered, within the transaction
+            a_key = attendanceKey(prof.key, conf.key)
+            if not a_key.get():
+                return False
+            a_key.delete()
+            invalidate(prof.key, conf.key)
+            recordAttendance([conf.key], prof.teeShirtSize, -1)
+            return True
+
         # register
         if reg:
-            # check if user already registered otherwise add
-            if conf.key in prof.conferenceKeysToAttend:
+            # check if user already registered before looking for a seat
+            if attendanceKey(prof.key, conf.key).get():
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
+            # register user, take away one seat if there is any
+            if not reserveSeat(conf, register):
                 raise ConflictException(
                     "There are no seats available.")
-
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(conf.key)
-            conf.seatsAvailable -= 1
             retval = True
 
-        # unregister
+        # unregister user, add back one seat
         else:
-            # check if user already registered
-            if conf.key in prof.conferenceKeysToAttend:
+            retval = releaseSeat(conf, unregister)
+
+        # update Conference.seatsAvailable in the background & return
+        if retval:
+            self._seatsChanged(conf)
+        return BooleanMessage(data=retval)
+
+    @staticmethod
+    def _seatsChanged(conf):
+        """Sync Conference.seatsAvailable in the background and update the
+        nearly sold out announcement after a seat was taken or given back."""
+        scheduleSeatSync(conf)
+        updateNearlySoldOut(conf, countSeats(conf))
+
+    @staticmethod
+    def _addConferencesToProfile(prof, c_keys):
+        """
+        Register a user for conferences within a seat transaction
+
+        Args:
+            prof (Profile): the user's Profile
+            c_keys (list): keys of the conferences a seat was found for
+        Returns:
+            added (list): keys of the conferences the user wasn't
+                          registered for yet
+        """
+        # re-read the user's registrations within the transaction
+        attendances = ndb.get_multi([attendanceKey(prof.key, c_key)
+                                     for c_key in c_keys])
+        added = [c_key for c_key, attendance in zip(c_keys, attendances)
+                 if not attendance]
+        if added:
+            ndb.put_multi([newAttendance(prof.key, c_key) for c_key in added])
+            invalidate(prof.key, *added)
+            recordAttendance(added, prof.teeShirtSize, 1)
+        return added
+
+    def _conferencesRegistration(self, request):
+        """
+        Register user for several conferences at once.
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(conf.key)
-                conf.seatsAvailable += 1
-                retval = True
+        Seats are taken from as many conferences per transaction as possible
+        and the user's registrations are written once per transaction.
+
+        Return:
+            results (BatchResultForms): whether the user was registered for
+                                        each conference, and why not
+        """
+        # get all conference objects from Datastore at once
+        batch = self._getBatch(request.websafeKeys, Conference)
+        prof = self._getProfileFromUser()
+        attending = set(attendance.conference for attendance in ndb.get_multi(
+            [attendanceKey(prof.key, conf.key) for wsck, conf in batch if conf])
+            if attendance)
+        results = {}
+        confs = []
+        for wsck, conf in batch:
+            if not conf:
+                results[wsck] = 'No conference found with key: %s' % wsck
+            elif conf.key in attending:
+                results[wsck] = "You have already registered for this " \
+                                "conference"
             else:
-                retval = False
+                confs.append((wsck, conf))
+
+        # register user for all conferences with a seat at hand, then
+        # retry the others one shard at a time
+        reserved = reserveSeats(
+            [conf for wsck, conf in confs],
+            lambda c_keys: self._addConferencesToProfile(prof, c_keys))
+        for wsck, conf in confs:
+            if conf.key in reserved:
+                self._seatsChanged(conf)
+                results[wsck] = None
+                continue
+            try:
+                self._conferenceRegistration(
+                    CONF_GET_REQUEST.combined_message_class(
+                                                websafeConferenceKey=wsck))
+            except ConflictException as e:
+                results[wsck] = str(e)
+            else:
+                results[wsck] = None
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
+        return BatchResultForms(items=[
+            BatchResultForm(websafeKey=wsck, success=results[wsck] is None,
+                            message=results[wsck])
+            for wsck, conf in batch])
+
+    @endpoints.method(
+            WebsafeKeysForm, BatchResultForms,
+            path='registerForConferences',
+            http_method='POST', name='registerForConferences')
+    def registerForConferences(self, request):
+        """Register user for several conferences (by websafeKeys)."""
+        return self._conferencesRegistration(request)
 
     @endpoints.method(
             message_types.VoidMessage, ConferenceForms,
@@ -528,21 +650,15 @@ class ConferenceApi(remote.Service):
         # get user Profile
         prof = self._getProfileFromUser()
         # get multiple conferences with multiple keys at once
-        conferences = ndb.get_multi(prof.conferenceKeysToAttend)
+        conferences = [conf for conf in ndb.get_multi(
+            attendedConferenceKeysAsync(prof.key).get_result()) if conf]
         # get organizers
-        organisers = [
-            ndb.Key(Profile, conf.organizerUserId) for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        names = self._getOrganizerNames(conferences)
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(
-                conf, names[conf.organizerUserId]) for conf in conferences]
+                conf, names.get(conf.organizerUserId)) for conf in conferences]
         )
 
     @endpoints.method(
@@ -561,6 +677,54 @@ class ConferenceApi(remote.Service):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
+    @endpoints.method(
+            ATTENDEES_GET_REQUEST, AttendeeForms,
+            path='conferences/{websafeConferenceKey}/attendees',
+            http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return the attendees of a conference, one page at a time; only
+        for the conference's owner."""
+        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        if currentUserId() != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can list the attendees of the conference.')
+        # registrations are children of the attendees' Profiles
+        a_keys, next_token = self._fetchPage(attendeesQuery(conf.key),
+                                             request, keys_only=True)
+        profiles = ndb.get_multi([a_key.parent() for a_key in a_keys])
+        return AttendeeForms(
+            items=[toForm(prof, AttendeeForm) for prof in profiles if prof],
+            nextPageToken=next_token)
+
+    @endpoints.method(
+            CONF_GET_REQUEST, ConferenceStatsForm,
+            path='conferences/{websafeConferenceKey}/stats',
+            http_method='GET', name='getConferenceStats')
+    def getConferenceStats(self, request):
+        """Return the attendees, tee shirt sizes and most wished sessions of
+        a conference; only for the conference's owner."""
+        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        if currentUserId() != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the stats of the conference.')
+        attendees, sizes, wishes = conferenceStats(conf.key)
+        # most wished sessions first, skipping deleted ones
+        wssks = sorted(wishes, key=lambda wssk: (-wishes[wssk], wssk))
+        sessions = ndb.get_multi([ndb.Key(urlsafe=wssk) for wssk in wssks])
+        return ConferenceStatsForm(
+            websafeConferenceKey=request.websafeConferenceKey,
+            maxAttendees=conf.maxAttendees,
+            seatsAvailable=countSeats(conf),
+            attendees=attendees,
+            teeShirtSizes=[
+                TeeShirtSizeCountForm(teeShirtSize=getattr(TeeShirtSize, size),
+                                      attendees=count)
+                for size, count in sorted(sizes.items())],
+            sessions=[
+                SessionWishesForm(websafeSessionKey=wssk, name=session.name,
+                                  wishes=wishes[wssk])
+                for wssk, session in zip(wssks, sessions) if session])
+
     @endpoints.method(
             message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
@@ -578,99 +742,82 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.month == 6)
 
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") for conf in q]
+            items=[self._copyConferenceToForm(conf, "")
+                   for conf in self._fetchAll(q)]
         )
 
 # - - - Session - - - - - - - - - - - - - - - - - - - -
 
-    def _copySessionToForm(self, session):
+    def _copySessionToForm(self, session, fields=None):
         """Copy relevant fields from Session to SessionForm."""
-        sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(session, field.name):
-                # convert time to time string; just copy others
-                if field.name in ['date', 'startTime']:
-                    setattr(sf, field.name, str(getattr(session, field.name)))
-                else:
-                    setattr(sf, field.name, getattr(session, field.name))
-            elif field.name == "websafeKey":
-                setattr(sf, field.name, session.key.urlsafe())
-        sf.check_initialized()
-        return sf
+        return toForm(session, SessionForm, fields)
+
+    def _renderSessions(self, sessions, fields=None):
+        """Copy Sessions to SessionForms."""
+        return [self._copySessionToForm(session, fields)
+                for session in sessions]
 
     def _createSessionObject(self, request):
         """Create Session object, returning SessionForm"""
         # User authentication
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-        # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        user_id = currentUserId()
+        # get conference object and speaker (if any) from Datastore
+        conf_future = self._getEntityAsync(
+                            self._decodeKey(request.websafeConferenceKey))
+        if request.speakerId:
+            speaker_future = ndb.Key(Speaker, request.speakerId).get_async()
+        conf = conf_future.get_result()
 
         # User Authorization
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can add session to the conference')
 
-        # Copy SessionForm Message into dict
-        data = {field.name: getattr(request, field.name)
-                for field in request.all_fields()}
-        wsck = data['websafeConferenceKey']
-        del data['websafeKey']
-        del data['websafeConferenceKey']
-
-        # add default values for fields that aren't provided
-        for df in SESSION_DEFAULTS:
-            if data[df] in (None, []):
-                data[df] = SESSION_DEFAULTS[df]
-                setattr(request, df, SESSION_DEFAULTS[df])
-        if data['date']:
-            data['date'] = datetime.strptime(
-                                    data['date'][:10], "%Y-%m-%d").date()
-        if data['startTime']:
-            data['startTime'] = datetime.strptime(
-                                        data['startTime'], "%H:%M").time()
+        # make sure the speaker exists before creating the session
+        if request.speakerId and not speaker_future.get_result():
+            raise endpoints.NotFoundException(
+                'No speaker found with this id')
+
+        # Copy SessionForm Message into dict, with defaults
+        wsck = request.websafeConferenceKey
+        data = sessionData(request)
 
         # generate session Key based on conference Key
         c_key = conf.key
         s_id = Session.allocate_ids(size=1, parent=c_key)[0]
         s_key = ndb.Key(Session, s_id, parent=c_key)
         data['key'] = s_key
-        Session(**data).put()
-
-        # Run queue to check featured speaker if speaker ID is provided
-        if data['speakerId']:
-            speaker = ndb.Key(Speaker, data['speakerId']).get()
-            if not speaker:
-                raise endpoints.NotFoundException(
-                    'No speaker found with this id')
+        session = Session(**data)
+        index = self._putSession(session)
+
+        # Run queue to check featured speaker if the speaker now hosts
+        # more than one session within the conference
+        if index and len(index.sessionKeys) > 1:
             taskqueue.add(params={'wsck': wsck, 'speakerId': data['speakerId']},
                           url='/tasks/check_featured_speaker'
                           )
-        return self._copySessionToForm(s_key.get())
+        return self._copySessionToForm(session)
 
     def _updateSessionObject(self, request):
         """Update Session object, returning SessionForm"""
         # User authentication
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
+        user_id = currentUserId()
 
         # Copy SessionForm Message into dict
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
 
-        # get session object from Datastore
-        session = self._getDataStoreObject(request.websafeSessionKey)
+        # get session object and its parent conference from Datastore
+        s_key = self._decodeKey(request.websafeSessionKey)
+        session, conf = self._getEntitiesAsync(
+                                s_key, s_key.parent()).get_result()
 
         # User Authorization
-        conf = session.key.parent().get()
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can update the session.')
 
+        speakerId, name = session.speakerId, session.name
         # copy relevant fields from Session Form to Session object
         for field in request.all_fields():
             data = getattr(request, field.name)
@@ -681,9 +828,56 @@ class ConferenceApi(remote.Service):
                 if field.name == 'startTime':
                     data = datetime.strptime(data, "%H:%M").time()
                 setattr(session, field.name, data)
-        session.put()
+        self._putSession(session, speakerId)
+        invalidate(session.key)
+
+        # re-check the featured speaker: the previous speaker may be down
+        # to a single session, the current one up to two
+        if speakerId != session.speakerId or name != session.name:
+            speakerIds = sorted(set(
+                [sid for sid in (speakerId, session.speakerId) if sid]))
+            if speakerIds:
+                taskqueue.add(params={'wsck': conf.key.urlsafe(),
+                                      'speakerId': speakerIds},
+                              url='/tasks/check_featured_speaker')
         return self._copySessionToForm(session)
 
+    @staticmethod
+    @transactional
+    def _putSession(session, previousSpeakerId=None):
+        """
+        Put a session, keeping the speaker index of its conference in sync
+
+        Each ConferenceSpeaker lists the sessions of one speaker within the
+        conference. It shares the conference's entity group with the session,
+        so both are written in one transaction.
+
+        Args:
+            session (Session): created or updated session
+            previousSpeakerId (int): speakerId of the session before an update
+        Returns:
+            index (ConferenceSpeaker): sessions of the session's speaker,
+                                       None if the session has no speaker
+        """
+        c_key = session.key.parent()
+        speakerIds = list(set(
+            [sid for sid in (previousSpeakerId, session.speakerId) if sid]))
+        indexes = ndb.get_multi([ndb.Key(ConferenceSpeaker, sid, parent=c_key)
+                                 for sid in speakerIds])
+        for i, (sid, index) in enumerate(zip(speakerIds, indexes)):
+            index = indexes[i] = index or ConferenceSpeaker(id=sid,
+                                                            parent=c_key)
+            # drop the session's old entry, re-add it under its current speaker
+            if session.key in index.sessionKeys:
+                pos = index.sessionKeys.index(session.key)
+                del index.sessionKeys[pos]
+                del index.sessionNames[pos]
+            if sid == session.speakerId:
+                index.sessionKeys.append(session.key)
+                index.sessionNames.append(session.name)
+        ndb.put_multi([session] + indexes)
+        return dict(zip(speakerIds, indexes)).get(session.speakerId)
+
     def _sessionRegistration(self, request, reg=True):
         """
         Given a session, either put it in or remove it from a user's wishlist.
@@ -696,47 +890,128 @@ class ConferenceApi(remote.Service):
             retval(Boolean): If ture, the operation (addition or removal of
                              session from user's wishlist) is successful
         """
-        retval = None
-        # User authentication
+        # get session object from Datastore while authenticating user
+        session_future = self._getEntityAsync(
+                                self._decodeKey(request.websafeSessionKey))
         prof = self._getProfileFromUser()
+        session = session_future.get_result()
+        retval = self._updateWishlist(prof.key, session.key, reg)
+        return BooleanMessage(data=retval)
 
-        # get session object from Datastore
-        wssk = request.websafeSessionKey
-        session = self._getDataStoreObject(wssk)
+    @staticmethod
+    @transactional
+    def _updateWishlist(p_key, s_key, reg):
+        """
+        Put a session in or remove it from a user's wishlist
 
+        The registration & wish are re-read, the wish written or deleted and
+        its stats task added in one transaction, so concurrent requests
+        can't both change the wishlist or count the same wish twice.
+
+        Args:
+            p_key (ndb.Key): key of the user's Profile
+            s_key (ndb.Key): key of the session
+            reg (Boolean): If true, add the session to the wishlist
+                           If false, remove it
+        Returns:
+            retval (Boolean): True once the wishlist was changed
+        """
         # check whether user has registered for conference where session belongs
-        c_key = session.key.parent()
-        if c_key not in prof.conferenceKeysToAttend:
+        w_key = wishKey(p_key, s_key)
+        attendance, wish = ndb.get_multi([attendanceKey(p_key, s_key.parent()),
+                                          w_key])
+        if not attendance:
             raise ConflictException(
                 "You have yet to register for the conference where this "
                 "session will take place")
 
         # put session in wishlist
         if reg:
-            if session.key in prof.sessionKeysToAttend:
+            if wish:
                 raise ConflictException(
                     "You have already placed this session in your wishlist")
-            prof.sessionKeysToAttend.append(session.key)
-            retval = True
+            newWish(p_key, s_key).put()
+            recordWishes([s_key], 1)
 
         # remove session from wishlist
         else:
-            if session.key not in prof.sessionKeysToAttend:
+            if not wish:
                 raise ConflictException(
                     "This session was not in your wishlist. No action taken.")
-            prof.sessionKeysToAttend.remove(session.key)
-            retval = True
-        prof.put()
-        return BooleanMessage(data=retval)
+            w_key.delete()
+            recordWishes([s_key], -1)
+        invalidate(p_key)
+        return True
+
+    def _sessionsRegistration(self, request):
+        """
+        Put several sessions in a user's wishlist with a single write.
+
+        Return:
+            results (BatchResultForms): whether each session was put in the
+                                        user's wishlist, and why not
+        """
+        # get all session objects from Datastore at once
+        batch = self._getBatch(request.websafeKeys, Session)
+        results = self._addSessionsToProfile(self._getProfileFromUser().key,
+                                             batch)
+        return BatchResultForms(items=[
+            BatchResultForm(websafeKey=wssk, success=results[wssk] is None,
+                            message=results[wssk])
+            for wssk, session in batch])
+
+    @transactional
+    def _addSessionsToProfile(self, p_key, batch):
+        """
+        Add sessions to a user's wishlist within a transaction
+
+        Args:
+            p_key (ndb.Key): key of the user's Profile
+            batch (list): (websafeSessionKey, Session) pairs
+        Returns:
+            results (dict): websafeSessionKey mapped to None if the session
+                            was added, otherwise the reason why not
+        """
+        # re-read the user's registrations & wishlist within the transaction
+        sessions = [session for wssk, session in batch if session]
+        found = ndb.get_multi(
+            [attendanceKey(p_key, session.key.parent())
+             for session in sessions] +
+            [wishKey(p_key, session.key) for session in sessions])
+        attending = set(attendance.conference
+                        for attendance in found[:len(sessions)] if attendance)
+        wished = set(wish.session for wish in found[len(sessions):] if wish)
+        results = {}
+        wishes = []
+        for wssk, session in batch:
+            if not session:
+                results[wssk] = 'No session found with key: %s' % wssk
+            # check whether user has registered for conference
+            elif session.key.parent() not in attending:
+                results[wssk] = "You have yet to register for the " \
+                                "conference where this session will take place"
+            elif session.key in wished:
+                results[wssk] = "You have already placed this session in " \
+                                "your wishlist"
+            else:
+                wishes.append(newWish(p_key, session.key))
+                wished.add(session.key)
+                results[wssk] = None
+        ndb.put_multi(wishes)
+        invalidate(p_key)
+        recordWishes([wish.session for wish in wishes], 1)
+        return results
 
     def _getSessionInWishlist(self, request):
         """Return a list of sessions within the user's wishlist."""
         # User authentication
         prof = self._getProfileFromUser()
         # Retrieve all sessions with all session Keys at once
-        sessions = ndb.get_multi(prof.sessionKeysToAttend)
+        sessions = ndb.get_multi(
+            wishedSessionKeysAsync(prof.key).get_result())
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=[self._copySessionToForm(session) for session in sessions
+                   if session]
         )
 
     @endpoints.method(
@@ -760,22 +1035,26 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getSession')
     def getSession(self, request):
         """Return requested session (by websafeSessionKey)."""
-        session = self._getDataStoreObject(request.websafeSessionKey)
-        return self._copySessionToForm(session)
+        s_key = self._decodeKey(request.websafeSessionKey)
+        return getForm(SessionForm, s_key,
+                       lambda: self._copySessionToForm(
+                                    self._getEntityAsync(s_key).get_result()))
 
     @endpoints.method(
             SESSIONS_GET_REQUEST, SessionForms,
             path='conferences/{websafeConferenceKey}/sessions',
             http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
-        """Return sessions given a websafeConferenceKey"""
+        """Return sessions given a websafeConferenceKey, one page at a time"""
         # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        c_key = self._decodeKey(request.websafeConferenceKey)
+        conf_future = self._getEntityAsync(c_key)
         # query sessions using ancestor conference Key
-        sessions = Session.query(ancestor=conf.key)
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
-        )
+        forms, next_token = self._fetchForms(Session.query(ancestor=c_key),
+                                             request, SessionForm,
+                                             self._renderSessions)
+        conf_future.check_success()
+        return SessionForms(items=forms, nextPageToken=next_token)
 
     @endpoints.method(
             SESSION_QUERY_TYPE, SessionForms,
@@ -784,15 +1063,17 @@ class ConferenceApi(remote.Service):
     def getConferenceSessionsByType(self, request):
         """Return sessions given a session type"""
         # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        c_key = self._decodeKey(request.websafeConferenceKey)
+        conf_future = self._getEntityAsync(c_key)
         # query sessions using ancestor conference Key
-        sessions = Session.query(ancestor=conf.key)
+        sessions = Session.query(ancestor=c_key)
         # filter sessions by sessionType
         sessions = sessions.filter(
                         getattr(Session, 'sessionType') == request.type)
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
-        )
+        forms, _ = self._fetchForms(sessions, request, SessionForm,
+                                    self._renderSessions, paged=False)
+        conf_future.check_success()
+        return SessionForms(items=forms)
 
     @endpoints.method(
             CONF_GET_SIMILAR, SessionForms,
@@ -801,9 +1082,10 @@ class ConferenceApi(remote.Service):
     def querySessionLength(self, request):
         """Return sessions given a conference object and duration (minutes)"""
         # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        c_key = self._decodeKey(request.websafeConferenceKey)
+        conf_future = self._getEntityAsync(c_key)
         # query sessions using ancestor conference Key and order by duration
-        sessions = Session.query(ancestor=conf.key).order(
+        sessions = Session.query(ancestor=c_key).order(
                                                     Session.duration_minutes)
         # temp workaroud since the 2nd filter clause picks up all sessions even
         # if the data=None
@@ -820,6 +1102,8 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException(
                 "You need to define both operator and value")
 
+        sessions = self._fetchAll(sessions)
+        conf_future.check_success()
         return SessionForms(
             items=[self._copySessionToForm(session) for session in sessions]
         )
@@ -831,26 +1115,31 @@ class ConferenceApi(remote.Service):
     def querySessionTime(self, request):
         """Return sessions given a conference object, time and type"""
         # get conference object from Datastore
-        conf = self._getDataStoreObject(request.websafeConferenceKey)
-        # query sessions using ancestor conf Key, order sessions by start time
-        sessions = Session.query(ancestor=conf.key).order(Session.startTime)
-
+        c_key = self._decodeKey(request.websafeConferenceKey)
+        conf_future = self._getEntityAsync(c_key)
         # filter sessions by time (before/after/equal certain time)
-        if (request.operator and request.time):
-            node = ndb.query.FilterNode(
-                                    'startTime',
-                                    OPERATORS[request.operator],
-                                    datetime(1970, 01, 01, request.time, 00))
-            sessions = sessions.filter(node)
-        else:
+        if not (request.operator and request.time):
             raise endpoints.BadRequestException("You need to define both "
                                                 "operator and time")
-
-        # only return session types that are not equal to what the user provided
+        if request.operator not in OPERATORS:
+            raise endpoints.BadRequestException("Invalid operator.")
+        # only return session types that are not equal to what the user
+        # provided; the query planner runs whichever inequality matches the
+        # fewest sessions in Datastore and the other one in memory
+        filters = [{'field': 'startTime',
+                    'operator': OPERATORS[request.operator],
+                    'value': datetime(1970, 01, 01, request.time, 00)},
+                   {'field': 'sessionType',
+                    'operator': '!=',
+                    'value': request.sessionType}]
+        plan = planQuery(Session.query(ancestor=c_key), filters,
+                         ['startTime'])
+        # order sessions by start time whichever filter Datastore ran
+        sessions = sorted(plan.run(), key=lambda session: session.startTime)
+        conf_future.check_success()
         return SessionForms(
-            items=[self._copySessionToForm(x)
-                   for x in sessions
-                   if x.sessionType != request.sessionType]
+            items=[self._copySessionToForm(x) for x in sessions],
+            queryPlan=plan.explain() if request.explain else None
         )
 
     # WORKAROUND of above endpoints that fully utilize Datastore queries
@@ -888,19 +1177,17 @@ class ConferenceApi(remote.Service):
     #     )
 
     @endpoints.method(
-            SPEAKER_GET_REQUEST, SessionForms,
+            SPEAKER_SESSIONS_REQUEST, SessionForms,
             path='sessions/speakers/{speakerId}',
             http_method='GET', name='getSessionsBySpeaker')
     def getSessionsBySpeaker(self, request):
-        """Return sessions given a speakerId"""
-        # get speaker object from Datastore
-        speaker = ndb.Key(Speaker, request.speakerId).get()
+        """Return sessions given a speakerId, one page at a time"""
         # query speaker by id
         sessions = Session.query().filter(
                             getattr(Session, 'speakerId') == request.speakerId)
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
-        )
+        forms, next_token = self._fetchForms(sessions, request, SessionForm,
+                                             self._renderSessions)
+        return SessionForms(items=forms, nextPageToken=next_token)
 
     @endpoints.method(
             SESSION_GET_REQUEST, BooleanMessage,
@@ -910,6 +1197,14 @@ class ConferenceApi(remote.Service):
         """Add Session to the user's wishlist."""
         return self._sessionRegistration(request)
 
+    @endpoints.method(
+            WebsafeKeysForm, BatchResultForms,
+            path='addSessionsToWishList',
+            http_method='POST', name='addSessionsToWishList')
+    def addSessionsToWishList(self, request):
+        """Add several Sessions (by websafeKeys) to the user's wishlist."""
+        return self._sessionsRegistration(request)
+
     @endpoints.method(
             SESSION_GET_REQUEST, BooleanMessage,
             path='profile/wishlist/{websafeSessionKey}',
@@ -930,22 +1225,14 @@ class ConferenceApi(remote.Service):
 
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
-        sf = SpeakerForm()
-        for field in sf.all_fields():
-            # retrieve speaker ID and display on SpeakerForm
-            if field.name == 'speakerId':
-                sf.speakerId = speaker.key.integer_id()
-            # copy other fields
-            elif hasattr(speaker, field.name):
-                setattr(sf, field.name, getattr(speaker, field.name))
-        sf.check_initialized()
-        return sf
+        return toForm(speaker, SpeakerForm)
 
     def _createSpeakerObject(self, request):
         """Create Speaker Object, returning SessionForm/request."""
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
         del data['speakerId']
+        data['searchTokens'] = prefixes(data['displayName'])
         key = Speaker(**data).put()
         return self._copySpeakerToForm(key.get())
 
@@ -961,40 +1248,162 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getSpeaker')
     def getSpeaker(self, request):
         """Get Speaker Object given the speakerId"""
-        speaker = ndb.Key(Speaker, request.speakerId).get()
-        return self._copySpeakerToForm(speaker)
+        sp_key = ndb.Key(Speaker, request.speakerId)
+        return getForm(SpeakerForm, sp_key,
+                       lambda: self._copySpeakerToForm(
+                                    self._getEntityAsync(sp_key).get_result()))
 
     @endpoints.method(
             SPEAKER_BY_NAME, SpeakerForms, path='speakers/{name}',
             http_method='GET', name='getSpeakerByName')
     def getSpeakerByName(self, request):
         """Get Speaker Object given the speaker's full name"""
-        speakers = Speaker.query().filter(Speaker.displayName == request.name)
+        speakers = self._fetchAll(
+            Speaker.query().filter(Speaker.displayName == request.name))
         return SpeakerForms(
             items=[self._copySpeakerToForm(speaker) for speaker in speakers]
         )
 
     @endpoints.method(
-            message_types.VoidMessage, SpeakerForms,
+            SPEAKER_SEARCH_REQUEST, SpeakerForms, path='searchSpeakers',
+            http_method='GET', name='searchSpeakers')
+    def searchSpeakers(self, request):
+        """Search speakers by the start of the words of their name,
+        ignoring case, best matches first."""
+        limit = request.limit or DEFAULT_SEARCH_LIMIT
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            raise endpoints.BadRequestException(
+                'limit must be between 1 and %d' % MAX_SEARCH_LIMIT)
+        tokens = tokenize(request.query)
+        if not tokens:
+            raise endpoints.BadRequestException('query must contain a word')
+        # candidates hold the prefixes of every query word (an equality
+        # filter each, merged by Datastore); only the names of at most
+        # SPEAKER_SEARCH_SCAN of them are read (a projection), and only the
+        # best limit are fetched whole
+        query = Speaker.query()
+        for token in queryTokens(tokens):
+            query = query.filter(Speaker.searchTokens == token)
+        names = query.iter(projection=[Speaker.displayName],
+                           limit=SPEAKER_SEARCH_SCAN,
+                           batch_size=SEARCH_BATCH_SIZE)
+        best = rankMatches(request.query, names,
+                           lambda speaker: speaker.displayName, limit)
+        speakers = ndb.get_multi([speaker.key for speaker in best])
+        return SpeakerForms(
+            items=[self._copySpeakerToForm(speaker) for speaker in speakers
+                   if speaker]
+        )
+
+    @endpoints.method(
+            PAGE_REQUEST, SpeakerForms,
             path='speakers/all',
             http_method='GET', name='getSpeakersCreated')
     def getSpeakersCreated(self, request):
-        """Get all Speaker Objects within Datastore"""
-        speakers = Speaker.query()
+        """Get all Speaker Objects within Datastore, one page at a time"""
+        speakers, next_token = self._fetchPage(Speaker.query(), request)
         return SpeakerForms(
-            items=[self._copySpeakerToForm(speaker) for speaker in speakers]
+            items=[self._copySpeakerToForm(speaker) for speaker in speakers],
+            nextPageToken=next_token
         )
 
+# - - - Bulk import - - - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _checkImportSize(forms):
+        """Refuse imports of more than MAX_IMPORT_SIZE items at once."""
+        if len(forms) > MAX_IMPORT_SIZE:
+            raise endpoints.BadRequestException(
+                'At most %d items may be imported at once' % MAX_IMPORT_SIZE)
+
+    @staticmethod
+    def _importResults(results):
+        """Copy (entity, error) pairs of a bulk load to BatchResultForms."""
+        return BatchResultForms(items=[
+            BatchResultForm(
+                websafeKey=entity.key.urlsafe() if entity else None,
+                success=entity is not None, message=error)
+            for entity, error in results])
+
     @endpoints.method(
-            message_types.VoidMessage, StringMessage,
-            path='conference/featured_speaker/get',
-            http_method='GET', name='getFeaturedSpeaker')
-    def getFeaturedSpeaker(self, request):
-        """Return featured speaker from memcache."""
-        return StringMessage(data=memcache.get(MEMCACHE_SPEAKER_KEY) or "")
+            ConferenceForms, BatchResultForms, path='importConferences',
+            http_method='POST', name='importConferences')
+    def importConferences(self, request):
+        """Create many conferences organized by the user at once."""
+        self._checkImportSize(request.items)
+        results = loadConferences(request.items, self._getProfileFromUser())
+        # confirm all the conferences created with a single email
+        created = [repr(form) for form, (conf, error)
+                   in zip(request.items, results) if conf]
+        if created:
+            taskqueue.add(
+                params={'email': currentUser().email(),
+                        'conferenceInfo': '\r\n\r\n'.join(created)},
+                url='/tasks/send_confirmation_email'
+            )
+        return self._importResults(results)
+
+    @endpoints.method(
+            IMPORT_SESSIONS_REQUEST, BatchResultForms,
+            path='conferences/{websafeConferenceKey}/importSessions',
+            http_method='POST', name='importSessions')
+    def importSessions(self, request):
+        """Create many sessions of a conference at once (by websafeKey)."""
+        user_id = currentUserId()
+        self._checkImportSize(request.items)
+        conf = self._getDataStoreObject(request.websafeConferenceKey)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can add session to the conference')
+        return self._importResults(loadSessions(conf, request.items))
+
+    @endpoints.method(
+            SpeakerForms, BatchResultForms, path='importSpeakers',
+            http_method='POST', name='importSpeakers')
+    def importSpeakers(self, request):
+        """Create many speakers at once."""
+        currentUserId()
+        self._checkImportSize(request.items)
+        return self._importResults(loadSpeakers(request.items))
 
     @staticmethod
-    def _getDataStoreObject(websafekey):
+    def _featuredSpeakerKeys(c_key):
+        """Return the memcache keys of all replicas of a featured speaker."""
+        return [MEMCACHE_SPEAKER_KEY % (c_key.urlsafe(), i)
+                for i in range(FEATURED_SPEAKER_REPLICAS)]
+
+    @classmethod
+    def _cacheFeaturedSpeaker(cls, c_key, announcement, speakerId=None):
+        """Store featured speaker of a conference in Datastore & memcache;
+        used by featured speaker task & getFeaturedSpeaker().
+        """
+        if announcement is not None:
+            FeaturedSpeaker(id=1, parent=c_key, announcement=announcement,
+                            speakerId=speakerId).put()
+        else:
+            featured = ndb.Key(FeaturedSpeaker, 1, parent=c_key).get()
+            announcement = featured.announcement if featured else ""
+        memcache.set_multi({key: announcement
+                            for key in cls._featuredSpeakerKeys(c_key)})
+        return announcement
+
+    @endpoints.method(
+            CONF_GET_REQUEST, StringMessage,
+            path='getFeaturedSpeaker/{websafeConferenceKey}',
+            http_method='GET', name='getFeaturedSpeaker')
+    def getFeaturedSpeaker(self, request):
+        """Return featured speaker of a conference from memcache."""
+        c_key = self._decodeKey(request.websafeConferenceKey)
+        # read one replica at random to spread the load of popular conferences
+        announcement = memcache.get(
+                        random.choice(self._featuredSpeakerKeys(c_key)))
+        # fall back to Datastore if evicted, caching it again
+        if announcement is None:
+            announcement = self._cacheFeaturedSpeaker(c_key, None)
+        return StringMessage(data=announcement)
+
+    @classmethod
+    def _getDataStoreObject(cls, websafekey):
         """
         Retrieve Datastore objects using websafeKey
 
@@ -1003,13 +1412,282 @@ class ConferenceApi(remote.Service):
         Returns:
             entity (GAE entities): retrieved object from Datastore
         """
-        # try getting object from datastore using websafekey
+        return cls._getEntityAsync(cls._decodeKey(websafekey)).get_result()
+
+    @staticmethod
+    def _decodeKey(websafekey):
+        """
+        Decode websafeKey into a Datastore key without any datastore access
+
+        Args:
+            websafekey (string): websafekey to be decoded
+        Returns:
+            key (ndb.Key): decoded key
+        """
         try:
-            entity = ndb.Key(urlsafe=websafekey).get()
+            return ndb.Key(urlsafe=websafekey)
         # raise error if websafekey isn't valid (no object found)
         except (ProtocolBufferDecodeError, TypeError):
             raise endpoints.NotFoundException(
                 'No object found with key: %s' % websafekey)
-        return entity
 
-api = endpoints.api_server([ConferenceApi])  # register API
+    @staticmethod
+    @ndb.tasklet
+    def _getEntityAsync(key):
+        """
+        Retrieve a Datastore object asynchronously
+
+        Args:
+            key (ndb.Key): key of the object
+        Returns:
+            future (ndb.Future): resolves to the retrieved object, or raises
+                                 NotFoundException if there is none
+        """
+        entity = yield key.get_async()
+        if entity is None:
+            raise endpoints.NotFoundException(
+                'No object found with key: %s' % key.urlsafe())
+        raise ndb.Return(entity)
+
+    @classmethod
+    @ndb.tasklet
+    def _getEntitiesAsync(cls, *keys):
+        """
+        Retrieve several Datastore objects in parallel
+
+        Args:
+            keys (ndb.Key): keys of the objects
+        Returns:
+            future (ndb.Future): resolves to a tuple of the retrieved objects,
+                                 in the order of keys
+        """
+        entities = yield [cls._getEntityAsync(key) for key in keys]
+        raise ndb.Return(tuple(entities))
+
+    @classmethod
+    def _getConferenceAndOrganizerAsync(cls, websafeConferenceKey):
+        """
+        Retrieve a conference and its organizer's profile in parallel
+
+        The organizer's profile is the parent of the conference key, so both
+        lookups can be issued as soon as the key has been decoded.
+
+        Args:
+            websafeConferenceKey (string): websafekey of the conference
+        Returns:
+            future (ndb.Future): resolves to a (Conference, Profile) tuple
+        """
+        c_key = cls._decodeKey(websafeConferenceKey)
+        return cls._getEntitiesAsync(c_key, c_key.parent())
+
+    @classmethod
+    def _fetchPage(cls, query, request, keys_only=False):
+        """
+        Fetch a single page of query results using Datastore cursors
+
+        Args:
+            query (ndb.Query): query to be executed, or a QueryPlan
+            request (Message): inbound message carrying the optional
+                               pageSize and pageToken fields
+            keys_only (Default=False): If true, fetch keys only
+        Returns:
+            entities (list): entities (or keys) within the requested page
+            next_token (string): websafe cursor pointing at the next page,
+                                 None if there are no more results
+        """
+        page_size = cls._pageSize(request)
+        # resume from the cursor handed out with the previous page, if any
+        try:
+            cursor = ndb.Cursor(urlsafe=request.pageToken)
+            if isinstance(query, QueryPlan):
+                entities, next_cursor = query.fetchPage(page_size, cursor,
+                                                        keys_only)
+                more = next_cursor is not None
+            else:
+                entities, next_cursor, more = query.fetch_page_async(
+                                page_size, start_cursor=cursor,
+                                keys_only=keys_only).get_result()
+        # raise error if the token is malformed or belongs to another query
+        except (datastore_errors.BadValueError,
+                datastore_errors.BadRequestError):
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % request.pageToken)
+        next_token = next_cursor.urlsafe() if more and next_cursor else None
+        return entities, next_token
+
+    @staticmethod
+    def _pageSize(request):
+        """Return the pageSize of a request, checking it's within bounds."""
+        page_size = request.pageSize or DEFAULT_PAGE_SIZE
+        if not 0 < page_size <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'pageSize must be between 1 and %d' % MAX_PAGE_SIZE)
+        return page_size
+
+    @staticmethod
+    def _uniqueKeys(websafekeys):
+        """Return websafekeys without duplicates, in their original order."""
+        seen = set()
+        return [key for key in websafekeys
+                if not (key in seen or seen.add(key))]
+
+    @classmethod
+    def _getBatch(cls, websafekeys, model):
+        """
+        Retrieve a batch of Datastore objects of one kind with one get_multi
+
+        Args:
+            websafekeys (list): websafekeys used to retrieve objects
+            model (ndb.Model): expected class of the objects
+        Returns:
+            batch (list): (websafekey, entity) pairs without duplicate keys;
+                          entity is None if not found or of another kind
+        """
+        websafekeys = cls._uniqueKeys(websafekeys)
+        if len(websafekeys) > MAX_BATCH_SIZE:
+            raise endpoints.BadRequestException(
+                'At most %d keys may be given at once' % MAX_BATCH_SIZE)
+        keys = []
+        for websafekey in websafekeys:
+            try:
+                key = cls._decodeKey(websafekey)
+            except endpoints.NotFoundException:
+                key = None
+            keys.append(key if key and key.kind() == model._get_kind()
+                        else None)
+        entities = iter(ndb.get_multi([k for k in keys if k]))
+        return [(websafekey, next(entities) if k else None)
+                for websafekey, k in zip(websafekeys, keys)]
+
+    @staticmethod
+    def _fetchAll(query, keys_only=False):
+        """
+        Run a query exactly once and materialise its results
+
+        Iterating an ndb.Query re-runs it against Datastore every time, so
+        handlers needing the results more than once should use this list.
+
+        Args:
+            query (ndb.Query): query to be executed
+            keys_only (Default=False): If true, fetch keys only
+        Returns:
+            entities (list): all entities (or keys) matched by the query
+        """
+        return query.fetch_async(keys_only=keys_only).get_result()
+
+    @staticmethod
+    def _selectedFields(form_class, fields):
+        """
+        Check the form fields selected by a client
+
+        Args:
+            form_class (Message): class of the forms returned
+            fields (list): field names sent by the client, possibly empty
+        Returns:
+            fields (tuple): sorted field names, always including websafeKey
+                            so results can be linked to; None for all fields
+        """
+        if not fields:
+            return None
+        unknown = set(fields) - set(f.name for f in form_class.all_fields())
+        if unknown:
+            raise endpoints.BadRequestException(
+                'Unknown fields: %s' % ', '.join(sorted(unknown)))
+        return tuple(sorted(set(fields) | set(['websafeKey'])))
+
+    @staticmethod
+    def _getForms(form_class, keys, fields, render):
+        """
+        Return the forms of several entities, filling in selected fields only
+
+        Forms already in the rendered form cache are trimmed to the fields;
+        the entities of the others are read with a single get_multi and
+        rendered with the fields only. These aren't added to the cache,
+        as they lack the other fields.
+
+        Args:
+            form_class (Message): class of the forms returned
+            keys (list): keys of the entities, in the order returned
+            fields (tuple): names of the form fields filled in
+            render (callable): returns the forms of a list of entities
+        Returns:
+            forms (list): one form per entity found
+        """
+        cached = peekForms(form_class, keys)
+        entities = [entity for entity in ndb.get_multi(
+                        [key for key in keys if key not in cached]) if entity]
+        rendered = dict(zip([entity.key for entity in entities],
+                            render(entities)))
+        forms = []
+        for key in keys:
+            if key in cached:
+                forms.append(form_class(**{name: getattr(cached[key], name)
+                                           for name in fields}))
+            elif key in rendered:
+                forms.append(rendered[key])
+        return forms
+
+    def _fetchForms(self, query, request, form_class, render, paged=True):
+        """
+        Run a list endpoint's query and render its results as forms
+
+        When the client selects fields and the rendered form cache holds
+        most forms of the kind (see worthPeeking), a keys only query is run
+        and forms are taken from the cache where possible (see _getForms);
+        otherwise, and for query plans filtering in memory, the query reads
+        the entities in a single round trip.
+
+        Args:
+            query (ndb.Query): query to be executed, or a QueryPlan
+            request (Message): inbound message carrying the optional fields,
+                               and pageSize and pageToken if paged
+            form_class (Message): class of the forms returned
+            render (callable): returns the forms of a list of entities given
+                               the entities and the selected fields
+            paged (Default=True): If true, fetch a single page of results
+                                  If false, fetch all of them
+        Returns:
+            forms (list): forms of the results
+            next_token (string): token of the next page, None if done
+        """
+        fields = self._selectedFields(form_class, request.fields)
+        # time the serialization of the whole list, not of each entity
+        render = profiled('serialization')(render)
+        plan = query if isinstance(query, QueryPlan) else None
+        keys_only = (fields is not None and not (plan and plan.residual) and
+                     worthPeeking((plan.query if plan else query).kind))
+        if paged:
+            results, next_token = self._fetchPage(query, request, keys_only)
+        else:
+            results, next_token = self._fetchAll(query, keys_only), None
+        if keys_only:
+            return self._getForms(form_class, results, fields,
+                                  lambda entities: render(entities, fields)
+                                  ), next_token
+        return render(results, fields), next_token
+
+    @staticmethod
+    def _getOrganizerNames(conferences):
+        """
+        Look up the display names of organizers not stored on the conferences
+
+        Conferences created before organizerDisplayName was denormalised
+        fall back to reading the organizer's Profile until they're backfilled.
+
+        Args:
+            conferences (list): Conference entities
+        Returns:
+            names (dict): organizerUserId mapped to the organizer's displayName
+        """
+        # dedupe organizers so each profile is only read once
+        user_ids = set(conf.organizerUserId for conf in conferences
+                       if conf.organizerDisplayName is None)
+        profiles = ndb.get_multi([ndb.Key(Profile, user_id)
+                                  for user_id in user_ids])
+        return {profile.key.id(): profile.displayName
+                for profile in profiles if profile}
+
+# register API, with a user context per request and profiling a sample of
+# its requests
+api = profilerMiddleware(authMiddleware(
+                            endpoints.api_server([ConferenceApi])))
@@ -13,7 +13,7 @@ from protorpc import messages
 from protorpc import message_types
 
 from models import ConferenceForm, ConferenceQueryForm, ConferenceQueryMiniForm
-from models import SessionForm, SessionQueryForm
+from models import SessionForm, SessionForms, SessionQueryForm
 
 __author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
 
@@ -51,12 +51,16 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
 SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+    fields=messages.StringField(4, repeated=True),
 )
 
 SESSION_QUERY_TYPE = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
     type=messages.StringField(2),
+    fields=messages.StringField(3, repeated=True),
 )
 
 SESSION_QUERY_TIME = endpoints.ResourceContainer(
@@ -70,7 +74,47 @@ SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
                                     required=True),
 )
 
+SPEAKER_SESSIONS_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    speakerId=messages.IntegerField(1, variant=messages.Variant.INT32,
+                                    required=True),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+    fields=messages.StringField(4, repeated=True),
+)
+
 SPEAKER_BY_NAME = endpoints.ResourceContainer(
     message_types.VoidMessage,
     name=messages.StringField(1),
 )
+
+SPEAKER_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1, required=True),
+    limit=messages.IntegerField(2, variant=messages.Variant.INT32),
+)
+
+CONF_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1, required=True),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
+ATTENDEES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(3),
+)
+
+IMPORT_SESSIONS_REQUEST = endpoints.ResourceContainer(
+    SessionForms,
+    websafeConferenceKey=messages.StringField(1),
+)
+
+PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    pageToken=messages.StringField(2),
+)
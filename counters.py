@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""counters.py
+
+Udacity conference server-side Python App Engine sharded seat counter
+
+Spreads the available seats of a Conference over several SeatShard entities,
+each in its own entity group, so that concurrent registrations for the same
+conference don't all contend on the Conference entity. A seat is only ever
+taken from a shard within a transaction that sees the shard holding at least
+one seat, so a conference can't be oversold.
+
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from cache import invalidate
+from transactions import transactional
+from models import SeatShard
+from settings import SEAT_SHARDS, MEMCACHE_SEATS_KEY
+from settings import SEATS_CACHE_TTL, SEATS_SYNC_INTERVAL
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# shards touched by a single transaction of reserveSeats(); a cross-group
+# transaction may touch 25 entity groups, one is left for the registrant
+XG_SHARDS = 24
+
+
+def _shardKeys(conf):
+    """Return the keys of all SeatShards of a conference."""
+    return [ndb.Key(SeatShard, '%s-%d' % (conf.key.urlsafe(), i))
+            for i in range(conf.seatShards)]
+
+
+def _splitSeats(total, shards):
+    """Split total seats as evenly as possible over a number of shards."""
+    return [total // shards + (1 if i < total % shards else 0)
+            for i in range(shards)]
+
+
+def _cacheKey(conf):
+    return MEMCACHE_SEATS_KEY % conf.key.urlsafe()
+
+
+def createShards(conf):
+    """
+    Create the SeatShards holding the available seats of a new conference
+
+    Args:
+        conf (Conference): conference, marked as sharded by this call
+    Returns:
+        shards (list): new SeatShard entities, to be put along with conf
+    """
+    conf.seatShards = SEAT_SHARDS
+    return [SeatShard(key=key, seats=seats) for key, seats in
+            zip(_shardKeys(conf),
+                _splitSeats(conf.seatsAvailable or 0, SEAT_SHARDS))]
+
+
+@transactional(xg=True)
+def _shardConference(c_key):
+    """Move the seats of a conference created before sharding to shards."""
+    conf = c_key.get()
+    if not conf.seatShards:
+        ndb.put_multi([conf] + createShards(conf))
+    return conf
+
+
+def setSeats(conf, total):
+    """
+    Overwrite the available seats of a sharded conference
+
+    Call within a cross-group transaction that also writes conf, so the
+    shards and Conference.seatsAvailable change together.
+
+    Args:
+        conf (Conference): sharded conference
+        total (int): new number of available seats
+    """
+    ndb.put_multi([SeatShard(key=key, seats=seats) for key, seats in
+                   zip(_shardKeys(conf), _splitSeats(total, conf.seatShards))])
+    memcache.delete(_cacheKey(conf))
+
+
+def countSeats(conf, cached=True):
+    """
+    Return the number of seats still available for a conference
+
+    Args:
+        conf (Conference): conference to be counted
+        cached (Default=True): If true, use the total cached in memcache
+                               If false, always sum up the shards
+    Returns:
+        total (int): available seats
+    """
+    if not conf.seatShards:
+        return conf.seatsAvailable
+    total = memcache.get(_cacheKey(conf)) if cached else None
+    if total is None:
+        total = sum(shard.seats for shard in
+                    ndb.get_multi(_shardKeys(conf)) if shard)
+        memcache.set(_cacheKey(conf), total, time=SEATS_CACHE_TTL)
+    return total
+
+
+@transactional(xg=True)
+def _takeSeat(shard_key, register):
+    """Take a seat from one shard, running register in the same txn."""
+    shard = shard_key.get()
+    if shard.seats <= 0:
+        return False
+    register()
+    shard.seats -= 1
+    shard.put()
+    return True
+
+
+@transactional(xg=True)
+def _returnSeat(shard_key, unregister):
+    """Give a seat back to one shard if unregister, in the same txn, agrees."""
+    if not unregister():
+        return False
+    shard = shard_key.get()
+    shard.seats += 1
+    shard.put()
+    return True
+
+
+def reserveSeat(conf, register):
+    """
+    Take one of the available seats of a conference
+
+    Shards still holding seats are tried in random order, one transaction
+    each, until a seat is taken.
+
+    Args:
+        conf (Conference): conference to take the seat from
+        register (callable): called within the transaction taking the seat,
+                             so the caller's own writes commit along with it;
+                             raise an exception to abort
+    Returns:
+        reserved (Boolean): False if the conference is sold out
+    """
+    if not conf.seatShards:
+        conf = _shardConference(conf.key)
+    shards = [shard for shard in ndb.get_multi(_shardKeys(conf))
+              if shard and shard.seats > 0]
+    random.shuffle(shards)
+    for shard in shards:
+        if _takeSeat(shard.key, register):
+            memcache.decr(_cacheKey(conf))
+            return True
+    return False
+
+
+@transactional(xg=True)
+def _takeSeats(shard_keys, register):
+    """Take a seat from one shard per conference, running register in the
+    same txn; shard_keys maps each conference key to the shard to use."""
+    c_keys = list(shard_keys)
+    shards = dict(zip(c_keys, ndb.get_multi([shard_keys[c_key]
+                                             for c_key in c_keys])))
+    reserved = register([c_key for c_key in c_keys
+                         if shards[c_key].seats > 0])
+    for c_key in reserved:
+        shards[c_key].seats -= 1
+    ndb.put_multi([shards[c_key] for c_key in reserved])
+    return reserved
+
+
+def reserveSeats(confs, register):
+    """
+    Take one seat from each of several conferences
+
+    One shard holding seats is picked per conference, and seats are taken
+    from as many conferences at once as a cross-group transaction allows.
+    Conferences whose shard ran out of seats in the meantime are skipped;
+    retry them with reserveSeat().
+
+    Args:
+        confs (list): conferences to take the seats from
+        register (callable): called within each transaction with the keys
+                             of the conferences a seat is available for;
+                             returns the keys it accepted seats for
+    Returns:
+        reserved (list): keys of the conferences a seat was taken from
+    """
+    confs = [conf if conf.seatShards else _shardConference(conf.key)
+             for conf in confs]
+    shard_keys = [_shardKeys(conf) for conf in confs]
+    shards = iter(ndb.get_multi([key for keys in shard_keys for key in keys]))
+    chosen = {}
+    for conf, keys in zip(confs, shard_keys):
+        available = [shard.key for shard in [next(shards) for _ in keys]
+                     if shard and shard.seats > 0]
+        if available:
+            chosen[conf.key] = random.choice(available)
+
+    reserved = []
+    c_keys = list(chosen)
+    for i in range(0, len(c_keys), XG_SHARDS):
+        reserved += _takeSeats({c_key: chosen[c_key]
+                                for c_key in c_keys[i:i + XG_SHARDS]},
+                               register)
+    for conf in confs:
+        if conf.key in reserved:
+            memcache.decr(_cacheKey(conf))
+    return reserved
+
+
+def releaseSeat(conf, unregister):
+    """
+    Give one seat back to a conference
+
+    Args:
+        conf (Conference): conference to give the seat back to
+        unregister (callable): called within the transaction giving back the
+                               seat; return False to keep the seat taken
+    Returns:
+        released (Boolean): value returned by unregister
+    """
+    if not conf.seatShards:
+        conf = _shardConference(conf.key)
+    released = _returnSeat(random.choice(_shardKeys(conf)), unregister)
+    if released:
+        memcache.incr(_cacheKey(conf))
+    return released
+
+
+def scheduleSeatSync(conf):
+    """
+    Copy the shard total to Conference.seatsAvailable soon
+
+    Registrations within the same SEATS_SYNC_INTERVAL share one named task,
+    so the Conference entity itself is written at most once per interval.
+    """
+    window = int(time.time() // SEATS_SYNC_INTERVAL)
+    try:
+        taskqueue.add(name='sync-seats-%s-%d' % (conf.key.urlsafe(), window),
+                      params={'wsck': conf.key.urlsafe()},
+                      countdown=SEATS_SYNC_INTERVAL,
+                      url='/tasks/sync_seats')
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def syncSeats(c_key):
+    """Store the shard total of a conference on Conference.seatsAvailable."""
+    conf = c_key.get()
+    if conf and conf.seatShards:
+        _storeSeats(c_key, countSeats(conf, cached=False))
+
+
+@transactional
+def _storeSeats(c_key, total):
+    conf = c_key.get()
+    if conf.seatsAvailable != total:
+        conf.seatsAvailable = total
+        conf.put()
+        invalidate(c_key)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""export.py
+
+Udacity conference server-side Python App Engine data export
+
+Streams Conferences, Sessions, Speakers and Profiles, one kind after the
+other, to newline-delimited JSON files. Each task of an export writes the
+next EXPORT_CHUNK_SIZE entities of a kind to a part file of its own, reading
+them EXPORT_BATCH_SIZE at a time from the cursor the previous task stopped
+at, so memory doesn't grow with the data. The progress is kept on an Export
+entity: a failed task is retried from the same cursor, rewriting the same
+part, and an interrupted export can be resumed from its last cursor.
+
+"""
+
+import contextlib
+import datetime
+import json
+import os
+
+from google.appengine.api import app_identity
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Export, Conference, Session, Speaker, Profile
+from settings import EXPORT_CHUNK_SIZE, EXPORT_BATCH_SIZE
+from settings import EXPORT_BACKEND, EXPORT_BUCKET, EXPORT_PATH
+from transactions import transactional
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# kinds exported, in order, and properties left out as they're derived
+EXPORT_KINDS = ('Conference', 'Session', 'Speaker', 'Profile')
+MODELS = {model._get_kind(): model
+          for model in (Conference, Session, Speaker, Profile)}
+EXCLUDED = {'Speaker': ('searchTokens',)}
+
+
+class LocalStorage(object):
+    """Export files in a local directory, for local tests & the development
+    server"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def check(self):
+        """Raise IOError unless files can be written."""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        if not os.access(self.root, os.W_OK):
+            raise IOError('Export directory %s is read-only' % self.root)
+
+    @contextlib.contextmanager
+    def open(self, name):
+        """Write a file, only found under its name once complete."""
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'w') as f:
+            yield f
+        os.rename(path + '.tmp', path)
+
+
+class CloudStorage(object):
+    """Export files in a Cloud Storage bucket, the app's default bucket if
+    None"""
+
+    def __init__(self, bucket, root):
+        self.bucket = bucket
+        self.root = root
+
+    def check(self):
+        """Raise ImportError unless the cloudstorage library is installed."""
+        __import__('cloudstorage')
+
+    def open(self, name):
+        """Write a file, only found under its name once complete."""
+        import cloudstorage
+        bucket = self.bucket or app_identity.get_default_gcs_bucket_name()
+        return cloudstorage.open('/%s/%s/%s' % (bucket, self.root, name), 'w',
+                                 content_type='application/x-ndjson')
+
+
+_STORAGE = (CloudStorage(EXPORT_BUCKET, EXPORT_PATH) if EXPORT_BACKEND == 'gcs'
+            else LocalStorage(EXPORT_PATH))
+
+
+def exportStorage():
+    """Return the storage export files are written to."""
+    return _STORAGE
+
+
+def setExportStorage(storage):
+    """Replace the export storage, e.g. with a LocalStorage."""
+    global _STORAGE
+    _STORAGE = storage
+
+
+def _jsonValue(value):
+    """Convert a property value to JSON: keys are websafe, dates & times
+    ISO 8601."""
+    if isinstance(value, list):
+        return [_jsonValue(item) for item in value]
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def exportRecord(entity):
+    """
+    Convert an entity to the record written to its kind's export files
+
+    Args:
+        entity (ndb.Model): Conference, Session, Speaker or Profile
+    Returns:
+        record (dict): properties of the entity, along with its websafeKey
+                       & id
+    """
+    record = {name: _jsonValue(value) for name, value in entity.to_dict(
+        exclude=EXCLUDED.get(entity.key.kind(), ())).items()}
+    record['websafeKey'] = entity.key.urlsafe()
+    record['id'] = entity.key.id()
+    return record
+
+
+def _queue(export):
+    """Queue the task writing the next chunk of an export."""
+    taskqueue.add(params={'export': export.key.id(), 'kind': export.kind,
+                          'part': export.part},
+                  url='/tasks/export')
+
+
+def startExport():
+    """Start an export named after the current time, returning its
+    Export; fails before queueing anything if the storage can't be
+    written."""
+    exportStorage().check()
+    export = Export(id=datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S'),
+                    kind=EXPORT_KINDS[0], counts={})
+    export.put()
+    _queue(export)
+    return export
+
+
+def resumeExport(name):
+    """Queue the next chunk of an unfinished export again, e.g. once its
+    task gave up; returns its Export, None if there's none."""
+    export = ndb.Key(Export, name).get()
+    if export and export.kind:
+        _queue(export)
+    return export
+
+
+@transactional
+def _advance(name, kind, part, cursor, count):
+    """
+    Record a chunk of an export as written
+
+    Args:
+        name (string): name of the export
+        kind (string): kind of the chunk
+        part (int): number of the chunk's part
+        cursor (string): websafe cursor after the chunk, None if it was the
+                         last one of its kind
+        count (int): number of entities written
+    Returns:
+        export (Export): updated Export, None if the chunk had already been
+                         recorded
+    """
+    export = ndb.Key(Export, name).get()
+    if export.kind != kind or export.part != part:
+        return None
+    counts = dict(export.counts or {})
+    counts[kind] = counts.get(kind, 0) + count
+    export.counts = counts
+    if cursor:
+        export.cursor, export.part = cursor, part + 1
+    else:
+        following = EXPORT_KINDS[EXPORT_KINDS.index(kind) + 1:]
+        export.kind = following[0] if following else None
+        export.cursor, export.part = None, 0
+        if not export.kind:
+            export.finished = datetime.datetime.utcnow()
+    export.put()
+    return export
+
+
+def exportChunk(name, kind, part):
+    """
+    Write the next chunk of an export and queue the one after it
+
+    The chunk is written to '<name>/<kind>-<part>.ndjson' from the cursor
+    stored on the Export, so a retried task rewrites the same part with the
+    same entities. Tasks of chunks already recorded do nothing.
+
+    Args:
+        name (string): name of the export
+        kind (string): kind of the chunk
+        part (int): number of the chunk's part
+    """
+    export = ndb.Key(Export, name).get()
+    if not export or export.kind != kind or export.part != part:
+        return
+    entities = MODELS[kind].query().iter(
+        start_cursor=ndb.Cursor(urlsafe=export.cursor),
+        batch_size=EXPORT_BATCH_SIZE, produce_cursors=True)
+    count = 0
+    with exportStorage().open('%s/%s-%05d.ndjson' % (name, kind, part)) as f:
+        for entity in entities:
+            f.write(json.dumps(exportRecord(entity), sort_keys=True) + '\n')
+            count += 1
+            if count == EXPORT_CHUNK_SIZE:
+                break
+    cursor = None
+    if count == EXPORT_CHUNK_SIZE and entities.probably_has_next():
+        cursor = entities.cursor_after().urlsafe()
+    export = _advance(name, kind, part, cursor, count)
+    if export and export.kind:
+        _queue(export)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+indexes.py -- Udacity conference server-side Python App Engine
+
+Composite index advisor for the dynamic queryConferences filters. Every
+query shape _getQuery/_formatFilters can send to Datastore is enumerated
+from FIELDS and OPERATORS, and covered with the smallest set of composite
+indexes, relying on Datastore merging (zigzag merge join) one index per
+equality filter instead of one composite index per combination of filters.
+
+    $ python indexes.py            # report on the current index.yaml
+    $ python indexes.py --write    # rewrite index.yaml with the minimal set
+
+The report is printed to stdout as JSON. Indexes of other kinds, and the
+ancestor Conference indexes of other endpoints, are kept as they are.
+
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+from settings import FIELDS, OPERATORS
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+INDEX_YAML = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'index.yaml')
+AUTOGENERATED = '# AUTOGENERATED'
+MANAGED_HEADER = ('# queryConferences indexes, generated by indexes.py: '
+                  'run it again\n# whenever FIELDS or OPERATORS change '
+                  'instead of editing them by hand.\n')
+KIND = 'Conference'
+# property every queryConferences query is finally sorted by
+ORDER = 'name'
+
+
+def queryShapes(fields, operators):
+    """
+    Enumerate the query shapes queryConferences can send to Datastore
+
+    The query planner sends every equality filter, and the inequality
+    filters of at most one field not used by an equality, to Datastore; the
+    other filters are evaluated in memory and don't need an index. Several
+    equality filters on one (repeated) field use the same index.
+
+    Args:
+        fields (list): property names filters may use
+        operators (list): Datastore operators filters may use
+    Returns:
+        shapes (list): (equality fields, inequality field or None) pairs
+    """
+    inequalities = [None]
+    if any(op != '=' for op in operators):
+        inequalities += sorted(fields)
+    shapes = []
+    for inequality in inequalities:
+        others = sorted(f for f in fields if f != inequality)
+        for n in range(len(others) + 1):
+            for equalities in itertools.combinations(others, n):
+                shapes.append((equalities, inequality))
+    return shapes
+
+
+def _index(*properties):
+    return (KIND, False, tuple((prop, 'asc') for prop in properties))
+
+
+def _sortOrder(inequality):
+    """Properties a query is sorted by: the inequality one, then name."""
+    return (inequality, ORDER) if inequality else (ORDER,)
+
+
+def mergeIndexes(shape):
+    """Indexes Datastore merges to run a shape: one per equality field,
+    each ending with the sort order; a single property sort order is
+    served by the built-in index."""
+    equalities, inequality = shape
+    order = _sortOrder(inequality)
+    if not equalities:
+        return [_index(*order)] if len(order) > 1 else []
+    return [_index(field, *order) for field in equalities]
+
+
+def exactIndex(shape):
+    """The single composite index matching a shape exactly."""
+    equalities, inequality = shape
+    if not equalities and not inequality:
+        return None
+    return _index(*(equalities + _sortOrder(inequality)))
+
+
+def coveringIndexes(shapes):
+    """
+    Compute the minimal set of indexes covering every shape
+
+    Every index returned is needed: an index (field, ..., name) is the only
+    one able to serve the shape filtering on field alone.
+
+    Returns:
+        indexes (list): sorted composite indexes
+    """
+    return sorted(set(index for shape in shapes
+                      for index in mergeIndexes(shape)))
+
+
+def isCovered(shape, indexes):
+    """Check a shape can run with the given indexes, merged or exact."""
+    indexes = set(indexes)
+    return (exactIndex(shape) in indexes or exactIndex(shape) is None or
+            all(index in indexes for index in mergeIndexes(shape)))
+
+
+def parseIndexes(text):
+    """
+    Parse the indexes of an index.yaml file
+
+    Only the subset of YAML used by index.yaml is understood: kind,
+    ancestor and properties with a name and optional direction.
+
+    Returns:
+        indexes (list): (kind, ancestor, ((name, direction), ...)) tuples
+    """
+    indexes = []
+    for line in text.splitlines():
+        line = line.split('#')[0].strip()
+        if line.startswith('- kind:'):
+            indexes.append([line.split(':', 1)[1].strip(), False, []])
+        elif line.startswith('ancestor:'):
+            indexes[-1][1] = line.split(':', 1)[1].strip() in ('yes', 'true')
+        elif line.startswith('- name:'):
+            indexes[-1][2].append([line.split(':', 1)[1].strip(), 'asc'])
+        elif line.startswith('direction:'):
+            indexes[-1][2][-1][1] = line.split(':', 1)[1].strip()
+    return [(kind, ancestor, tuple(tuple(prop) for prop in props))
+            for kind, ancestor, props in indexes]
+
+
+def formatIndexes(indexes):
+    """Write indexes the way index.yaml lists them."""
+    blocks = []
+    for kind, ancestor, properties in indexes:
+        lines = ['- kind: %s' % kind]
+        if ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        for name, direction in properties:
+            lines.append('  - name: %s' % name)
+            if direction != 'asc':
+                lines.append('    direction: %s' % direction)
+        blocks.append('\n'.join(lines) + '\n')
+    return '\n'.join(blocks)
+
+
+def _isManaged(index):
+    """True for the indexes queryConferences needs, which are regenerated."""
+    kind, ancestor, _ = index
+    return kind == KIND and not ancestor
+
+
+def _describe(index):
+    kind, ancestor, properties = index
+    return '%s(%s%s)' % (kind, 'ancestor, ' if ancestor else '',
+                         ', '.join(name if direction == 'asc' else
+                                   '%s %s' % (name, direction)
+                                   for name, direction in properties))
+
+
+def _rowsPerPut(indexes, topics):
+    """Composite index rows written by one Conference.put(); the repeated
+    topics property writes one row per topic in every index using it."""
+    return sum(topics if any(name == 'topics' for name, _ in props) else 1
+               for kind, _, props in indexes if kind == KIND)
+
+
+def writeIndexYaml(text, managed):
+    """Return index.yaml with the managed indexes replaced by a new set,
+    listed above the AUTOGENERATED marker so dev_appserver keeps them."""
+    others = [index for index in parseIndexes(text)
+              if not _isManaged(index) and index not in managed]
+    # keep the explanation dev_appserver puts under the marker
+    marker = text.find(AUTOGENERATED)
+    comment = ''
+    if marker >= 0:
+        end = text.find('- kind:', marker)
+        comment = text[marker:end if end >= 0 else len(text)].rstrip() + '\n'
+    return ''.join(['indexes:\n\n', MANAGED_HEADER, '\n',
+                    formatIndexes(managed), '\n',
+                    comment or AUTOGENERATED + '\n', '\n',
+                    formatIndexes(others)])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--index-yaml', default=INDEX_YAML)
+    parser.add_argument('--write', action='store_true',
+                        help='rewrite index.yaml with the minimal index set')
+    parser.add_argument('--topics', type=int, default=3,
+                        help='topics per conference, to estimate write cost')
+    args = parser.parse_args(argv)
+
+    with open(args.index_yaml) as f:
+        text = f.read()
+    current = [index for index in parseIndexes(text) if _isManaged(index)]
+    shapes = queryShapes(sorted(set(FIELDS.values())),
+                         sorted(set(OPERATORS.values())))
+    covering = coveringIndexes(shapes)
+    exact = sorted(set(index for index in map(exactIndex, shapes) if index))
+
+    result = {
+        'shapes': len(shapes),
+        'exactIndexes': len(exact),
+        'coveringIndexes': [_describe(index) for index in covering],
+        'current': {
+            'indexes': len(current),
+            'uncoveredShapes': len([shape for shape in shapes
+                                    if not isCovered(shape, current)]),
+            'redundant': [_describe(index) for index in current
+                          if index not in covering],
+        },
+        'compositeRowsPerPut': {
+            'current': _rowsPerPut(current, args.topics),
+            'exact': _rowsPerPut(exact, args.topics),
+            'covering': _rowsPerPut(covering, args.topics),
+        },
+    }
+    if args.write:
+        with open(args.index_yaml, 'w') as f:
+            f.write(writeIndexYaml(text, covering))
+        result['written'] = args.index_yaml
+    json.dump(result, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+
+"""
+loader.py -- Udacity conference server-side Python App Engine
+
+Bulk loading of conferences, sessions and speakers, shared by the import
+endpoints of ConferenceApi and the offline loader below. The ids of a batch
+are reserved with one allocate_ids call per kind and parent, entities are
+written with put_multi in batches of IMPORT_BATCH_SIZE, and the featured
+speaker of a conference is checked by a single task however many sessions
+were loaded into it.
+
+The offline loader reads CSV (a header row of form field names, repeated
+fields separated by ';') or JSON (a list of objects) files and loads them
+through remote_api, MAX_IMPORT_SIZE records at a time, e.g.
+
+    $ python loader.py --server your-project-id.appspot.com \
+          --organizer organizer@example.com conferences conferences.csv
+    $ python loader.py --server your-project-id.appspot.com speakers s.json
+    $ python loader.py --server your-project-id.appspot.com \
+          sessions --conference <websafeConferenceKey> sessions.csv
+
+The outcome of every record is printed to stdout as JSON.
+
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import sys
+from datetime import datetime
+
+import endpoints
+from protorpc import messages
+from google.appengine.api import datastore_errors
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from announcements import isNearlySoldOut, updateNearlySoldOut
+from counters import createShards
+from models import Profile, Conference, ConferenceForm
+from models import Session, SessionForm, Speaker, SpeakerForm
+from models import ConferenceSpeaker
+from search import prefixes, conferenceDocument, conferenceIndex
+from settings import DEFAULTS, SESSION_DEFAULTS
+from settings import MAX_IMPORT_SIZE, IMPORT_BATCH_SIZE
+from transactions import transactional
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# errors making a single record fail, instead of the whole batch
+RECORD_ERRORS = (endpoints.BadRequestException, datastore_errors.BadValueError,
+                 messages.ValidationError, ValueError, KeyError, TypeError)
+
+
+def conferenceData(form):
+    """
+    Convert a ConferenceForm to Conference properties, filling in defaults
+
+    Missing fields are set to their default on the form as well, so it can
+    be returned as the created conference.
+
+    Args:
+        form (ConferenceForm): conference to be created
+    Returns:
+        data (dict): properties of the new Conference, without its key &
+                     organizer
+    """
+    if not form.name:
+        raise endpoints.BadRequestException("Conference 'name' "
+                                            "field required")
+
+    # copy ConferenceForm/ProtoRPC Message into dict
+    data = {field.name: getattr(form, field.name)
+            for field in form.all_fields()}
+    del data['websafeKey']
+    del data['organizerDisplayName']
+
+    # add default values for those missing
+    # (both data model & outbound Message)
+    for df in DEFAULTS:
+        if data[df] in (None, []):
+            data[df] = DEFAULTS[df]
+            setattr(form, df, DEFAULTS[df])
+
+    # convert dates from strings to Date objects;
+    if data['startDate']:
+        data['startDate'] = datetime.strptime(
+                                data['startDate'][:10], "%Y-%m-%d").date()
+        # set month based on start_date
+        data['month'] = data['startDate'].month
+    else:
+        data['month'] = 0
+    if data['endDate']:
+        data['endDate'] = datetime.strptime(
+                                data['endDate'][:10], "%Y-%m-%d").date()
+    # set seatsAvailable to be same as maxAttendees on creation
+    if data["maxAttendees"] > 0 and data["seatsAvailable"] is None:
+        data["seatsAvailable"] = data["maxAttendees"]
+    return data
+
+
+def sessionData(form):
+    """
+    Convert a SessionForm to Session properties, filling in defaults
+
+    Args:
+        form (SessionForm): session to be created, possibly along with the
+                            websafeConferenceKey of its conference
+    Returns:
+        data (dict): properties of the new Session, without its key
+    """
+    data = {field.name: getattr(form, field.name)
+            for field in form.all_fields()}
+    data.pop('websafeKey')
+    data.pop('websafeConferenceKey', None)
+
+    # add default values for fields that aren't provided
+    for df in SESSION_DEFAULTS:
+        if data[df] in (None, []):
+            data[df] = SESSION_DEFAULTS[df]
+            setattr(form, df, SESSION_DEFAULTS[df])
+    if data['date']:
+        data['date'] = datetime.strptime(
+                                data['date'][:10], "%Y-%m-%d").date()
+    if data['startTime']:
+        data['startTime'] = datetime.strptime(
+                                    data['startTime'], "%H:%M").time()
+    return data
+
+
+def _allocateKeys(model, size, parent=None):
+    """Reserve the ids of size new entities with a single RPC."""
+    if not size:
+        return []
+    first, last = model.allocate_ids(size=size, parent=parent)
+    return [ndb.Key(model, i, parent=parent) for i in range(first, last + 1)]
+
+
+def _putBatches(entities):
+    """Write entities with put_multi, IMPORT_BATCH_SIZE at a time."""
+    for i in range(0, len(entities), IMPORT_BATCH_SIZE):
+        ndb.put_multi(entities[i:i + IMPORT_BATCH_SIZE])
+
+
+def _build(model, datas, parent=None):
+    """
+    Create the entities of the valid records of a batch
+
+    Args:
+        model (class): kind of the entities
+        datas (list): properties of each record, or the error of records
+                      that couldn't be converted
+        parent (ndb.Key): parent of the entities, if any
+    Returns:
+        results (list): (entity, None) or (None, error) pairs, in the order
+                        of the records
+    """
+    valid = [data for data in datas if isinstance(data, dict)]
+    keys = iter(_allocateKeys(model, len(valid), parent))
+    results = []
+    for data in datas:
+        if not isinstance(data, dict):
+            results.append((None, data))
+            continue
+        try:
+            results.append((model(key=next(keys), **data), None))
+        except RECORD_ERRORS as e:
+            results.append((None, str(e)))
+    return results
+
+
+def _convert(convert, forms):
+    """Convert each form, keeping the error message of those that fail."""
+    datas = []
+    for form in forms:
+        try:
+            datas.append(convert(form))
+        except RECORD_ERRORS as e:
+            datas.append(str(e))
+    return datas
+
+
+def loadConferences(forms, organizer):
+    """
+    Create many conferences of one organizer at once
+
+    Args:
+        forms (list): ConferenceForms of the new conferences
+        organizer (Profile): Profile of the organizer
+    Returns:
+        results (list): (Conference, None) for each conference created,
+                        (None, error) for the others
+    """
+    datas = _convert(conferenceData, forms)
+    for form, data in zip(forms, datas):
+        if isinstance(data, dict):
+            data['organizerUserId'] = form.organizerUserId = \
+                organizer.key.id()
+            data['organizerDisplayName'] = form.organizerDisplayName = \
+                organizer.displayName
+    results = _build(Conference, datas, organizer.key)
+
+    # create each conference along with the shards holding its seats
+    confs = [conf for conf, error in results if conf]
+    entities = []
+    for conf in confs:
+        entities.extend([conf] + createShards(conf))
+    _putBatches(entities)
+    conferenceIndex().putMulti([conferenceDocument(conf) for conf in confs])
+    for conf in confs:
+        if isNearlySoldOut(conf.seatsAvailable):
+            updateNearlySoldOut(conf, conf.seatsAvailable)
+    return results
+
+
+@transactional
+def _indexSessions(c_key, sessions):
+    """
+    Add new sessions to the speaker index of their conference
+
+    Args:
+        c_key (ndb.Key): key of the conference
+        sessions (list): new sessions of the conference
+    Returns:
+        indexes (list): updated ConferenceSpeaker entities
+    """
+    speakerIds = sorted(set(session.speakerId for session in sessions
+                            if session.speakerId))
+    indexes = ndb.get_multi([ndb.Key(ConferenceSpeaker, sid, parent=c_key)
+                             for sid in speakerIds])
+    indexes = [index or ConferenceSpeaker(id=sid, parent=c_key)
+               for sid, index in zip(speakerIds, indexes)]
+    byId = dict(zip(speakerIds, indexes))
+    for session in sessions:
+        if session.speakerId:
+            byId[session.speakerId].sessionKeys.append(session.key)
+            byId[session.speakerId].sessionNames.append(session.name)
+    ndb.put_multi(indexes)
+    return indexes
+
+
+def loadSessions(conf, forms):
+    """
+    Create many sessions of a conference at once
+
+    The speaker index of the conference is updated in one transaction, and
+    a single task checks the featured speaker among the speakers now hosting
+    more than one session.
+
+    Args:
+        conf (Conference): conference of the new sessions
+        forms (list): SessionForms of the new sessions
+    Returns:
+        results (list): (Session, None) for each session created,
+                        (None, error) for the others
+    """
+    # make sure the speakers exist before creating their sessions
+    speakerIds = sorted(set(form.speakerId for form in forms
+                            if form.speakerId))
+    found = set(speaker.key.id() for speaker in ndb.get_multi(
+        [ndb.Key(Speaker, sid) for sid in speakerIds]) if speaker)
+    datas = _convert(sessionData, forms)
+    for i, form in enumerate(forms):
+        if form.speakerId and form.speakerId not in found:
+            datas[i] = 'No speaker found with this id'
+    results = _build(Session, datas, conf.key)
+
+    sessions = [session for session, error in results if session]
+    _putBatches(sessions)
+    featured = [index.key.id() for index in _indexSessions(conf.key, sessions)
+                if len(index.sessionKeys) > 1]
+    if featured:
+        taskqueue.add(params={'wsck': conf.key.urlsafe(),
+                              'speakerId': featured},
+                      url='/tasks/check_featured_speaker')
+    return results
+
+
+def loadSpeakers(forms):
+    """
+    Create many speakers at once
+
+    Args:
+        forms (list): SpeakerForms of the new speakers
+    Returns:
+        results (list): (Speaker, None) for each speaker created,
+                        (None, error) for the others
+    """
+    datas = []
+    for form in forms:
+        data = {field.name: getattr(form, field.name)
+                for field in form.all_fields()}
+        del data['speakerId']
+        data['searchTokens'] = prefixes(data['displayName'])
+        datas.append(data)
+    results = _build(Speaker, datas)
+    _putBatches([speaker for speaker, error in results if speaker])
+    return results
+
+
+# - - - Offline loader - - - - - - - - - - - - - - - - - - - -
+
+def readRecords(path):
+    """Iterate over the records of a CSV or JSON file, by its extension."""
+    with open(path) as f:
+        if path.endswith('.json'):
+            for record in json.load(f):
+                yield record
+        else:
+            for record in csv.DictReader(f):
+                yield record
+
+
+def recordToForm(form_class, record):
+    """
+    Build a form from a record, converting CSV strings to the field types
+
+    Args:
+        form_class (class): ProtoRPC message class, e.g. SessionForm
+        record (dict): field names mapped to values
+    Returns:
+        form (messages.Message): form holding the record
+    """
+    values = {}
+    for name, value in record.items():
+        if value in (None, ''):
+            continue
+        field = form_class.field_by_name(name)
+        if isinstance(value, basestring):
+            if field.repeated:
+                value = [item.strip() for item in value.split(';')
+                         if item.strip()]
+            if isinstance(field, messages.IntegerField):
+                value = ([int(item) for item in value] if field.repeated
+                         else int(value))
+        values[name] = value
+    return form_class(**values)
+
+
+def loadFile(path, form_class, load):
+    """
+    Load the records of a file, MAX_IMPORT_SIZE at a time
+
+    Args:
+        path (string): CSV or JSON file
+        form_class (class): form each record is converted to
+        load (callable): loads a list of forms, e.g. loadSpeakers
+    Returns:
+        report (dict): number of records loaded & failed, the key of each
+                       entity created and the error of each record that
+                       failed, by record number
+    """
+    report = {'file': path, 'loaded': 0, 'failed': 0, 'created': [],
+              'errors': []}
+    records = enumerate(readRecords(path))
+    while True:
+        chunk = list(itertools.islice(records, MAX_IMPORT_SIZE))
+        if not chunk:
+            break
+        numbers, forms = [], []
+        for number, record in chunk:
+            try:
+                forms.append(recordToForm(form_class, record))
+                numbers.append(number)
+            except RECORD_ERRORS as e:
+                report['errors'].append({'record': number,
+                                         'message': str(e)})
+        for number, (entity, error) in zip(numbers, load(forms)):
+            if entity:
+                report['created'].append({'record': number,
+                                          'websafeKey': entity.key.urlsafe(),
+                                          'id': entity.key.id()})
+            else:
+                report['errors'].append({'record': number, 'message': error})
+    report['loaded'] = len(report['created'])
+    report['failed'] = len(report['errors'])
+    report['errors'].sort(key=lambda error: error['record'])
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--server', required=True,
+                        help='host of the app, e.g. localhost:8080')
+    parser.add_argument('--insecure', action='store_true',
+                        help='use http, e.g. for the development server')
+    subparsers = parser.add_subparsers()
+
+    conferences = subparsers.add_parser('conferences',
+                                        help=loadConferences.__doc__)
+    conferences.add_argument('--organizer', required=True,
+                             help='user id of the organizer Profile')
+    conferences.add_argument('file')
+    conferences.set_defaults(kind='conferences')
+
+    sessions = subparsers.add_parser('sessions', help=loadSessions.__doc__)
+    sessions.add_argument('--conference', required=True,
+                          help='websafe key of the conference')
+    sessions.add_argument('file')
+    sessions.set_defaults(kind='sessions')
+
+    speakers = subparsers.add_parser('speakers', help=loadSpeakers.__doc__)
+    speakers.add_argument('file')
+    speakers.set_defaults(kind='speakers')
+    args = parser.parse_args(argv)
+
+    from google.appengine.ext.remote_api import remote_api_stub
+    remote_api_stub.ConfigureRemoteApiForOAuth(
+        args.server, '/_ah/remote_api', secure=not args.insecure)
+
+    if args.kind == 'conferences':
+        organizer = ndb.Key(Profile, args.organizer).get()
+        if not organizer:
+            parser.error('No profile found for organizer %s' % args.organizer)
+        report = loadFile(args.file, ConferenceForm,
+                          lambda forms: loadConferences(forms, organizer))
+    elif args.kind == 'sessions':
+        conf = ndb.Key(urlsafe=args.conference).get()
+        if not isinstance(conf, Conference):
+            parser.error('No conference found with key: %s' % args.conference)
+        report = loadFile(args.file, SessionForm,
+                          lambda forms: loadSessions(conf, forms))
+    else:
+        report = loadFile(args.file, SpeakerForm, loadSpeakers)
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
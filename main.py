@@ -7,16 +7,28 @@ HTTP controller handlers for memcache & task queue access
 
 """
 
+import json
+
 import webapp2
 
 from google.appengine.api import app_identity
 from google.appengine.api import mail
-from google.appengine.api import memcache
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
+from analytics import recordSizeChange, recomputeStats, applyStats
+from attendance import migrateProfiles, attendedConferenceKeysAsync
+from cache import invalidate, stats
 from conference import ConferenceApi
-from settings import MEMCACHE_SPEAKER_KEY
-from models import Conference, Session, Speaker
+from announcements import updateNearlySoldOut
+from counters import syncSeats, countSeats
+from export import startExport, resumeExport, exportChunk
+from transactions import transactional, stats as transactionStats
+from profiler import profilerMiddleware, stats as profileStats
+from search import prefixes, conferenceDocument, conferenceIndex
+from settings import FANOUT_BATCH_SIZE
+from models import Profile, Conference, Session, Speaker, ConferenceSpeaker
+from models import FeaturedSpeaker
 
 __author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
 
@@ -45,28 +57,320 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
 class checkedFeaturedSpeaker(webapp2.RequestHandler):
     def post(self):
         """Check Featured Speaker within a Conference"""
-        conf = ndb.Key(urlsafe=self.request.get('wsck')).get()
-        speaker = ndb.Key(Speaker, int(self.request.get('speakerId'))).get()
-        sessions = Session.query(ancestor=conf.key)
-        sessions = sessions.filter(
-                Session.speakerId == int(self.request.get('speakerId')))
+        c_key = ndb.Key(urlsafe=self.request.get('wsck'))
+        # a bulk import checks all its speakers with one task: the one
+        # hosting the most sessions is featured
+        speakerIds = [int(sid) for sid in self.request.get_all('speakerId')]
+        # get the speakers, the sessions they host within the conference and
+        # the speaker featured so far
+        entities = ndb.get_multi(
+            [ndb.Key(ConferenceSpeaker, sid, parent=c_key)
+             for sid in speakerIds] +
+            [ndb.Key(Speaker, sid) for sid in speakerIds] +
+            [ndb.Key(FeaturedSpeaker, 1, parent=c_key)])
+        featured = entities.pop()
+        index, speaker = max(
+            zip(entities[:len(speakerIds)], entities[len(speakerIds):]),
+            key=lambda pair: len(pair[0].sessionNames) if pair[0] else 0)
         # don't featured speaker if only in 0 or 1 session
-        if sessions.count() <= 1:
-            announcement = ""
-        else:
+        if index and len(index.sessionNames) > 1:
             announcement = '%s %s %s %s' % (
                 'Featured Speaker - ',
                 speaker.displayName,
                 '. You can find the speaker in the following sessions: ',
-                ', '.join(
-                    session.name for session in sessions)
+                ', '.join(index.sessionNames)
             )
-        memcache.set(MEMCACHE_SPEAKER_KEY, announcement)
+            ConferenceApi._cacheFeaturedSpeaker(c_key, announcement,
+                                                speaker.key.id())
+        # clear the announcement of a featured speaker down to 0 or 1 session
+        elif featured and featured.speakerId in speakerIds:
+            ConferenceApi._cacheFeaturedSpeaker(c_key, "")
+        self.response.set_status(204)
+
+
+class SyncSeatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy the sharded seat count onto Conference.seatsAvailable."""
+        syncSeats(ndb.Key(urlsafe=self.request.get('wsck')))
+        self.response.set_status(204)
+
+
+@transactional
+def setOrganizerName(c_keys, displayName):
+    """Store displayName on conferences sharing the same organizer."""
+    # conferences are children of their organizer's Profile, so a batch
+    # of them forms a single entity group
+    confs = [conf for conf in ndb.get_multi(c_keys)
+             if conf and conf.organizerDisplayName != displayName]
+    for conf in confs:
+        conf.organizerDisplayName = displayName
+    ndb.put_multi(confs)
+    invalidate(*[conf.key for conf in confs])
+
+
+class UpdateOrganizerNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy an organizer's displayName onto their Conferences."""
+        user_id = self.request.get('userId')
+        p_key = ndb.Key(Profile, user_id)
+        # always copy the current name, so out of order tasks are harmless
+        prof_future = p_key.get_async()
+        c_keys, cursor, more = Conference.query(ancestor=p_key).fetch_page(
+            FANOUT_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        prof = prof_future.get_result()
+        if prof and c_keys:
+            setOrganizerName(c_keys, prof.displayName)
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'userId': user_id,
+                                  'cursor': cursor.urlsafe()},
+                          url='/tasks/update_organizer_name')
+        self.response.set_status(204)
+
+
+class UpdateAttendeeSizeHandler(webapp2.RequestHandler):
+    def post(self):
+        """Move a user from one tee shirt size to another in the stats of
+        the conferences they attend."""
+        c_keys = attendedConferenceKeysAsync(
+            ndb.Key(Profile, self.request.get('userId'))).get_result()
+        recordSizeChange(c_keys, self.request.get('previous'),
+                         self.request.get('teeShirtSize'))
+        self.response.set_status(204)
+
+
+class UpdateNearlySoldOutHandler(webapp2.RequestHandler):
+    def post(self):
+        """Add or remove an updated Conference from the nearly sold out
+        set."""
+        conf = ndb.Key(urlsafe=self.request.get('wsck')).get()
+        if conf:
+            updateNearlySoldOut(conf, countSeats(conf))
+        self.response.set_status(204)
+
+
+class RecordStatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Add the deltas of a committed change to the attendee stats."""
+        applyStats(self.request.headers['X-AppEngine-TaskName'],
+                   self.request.get('deltas'))
+        self.response.set_status(204)
+
+
+class RecomputeStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start rebuilding the attendee stats of every Conference."""
+        taskqueue.add(url='/tasks/recompute_stats')
+        self.response.set_status(202)
+
+    def post(self):
+        """Rebuild the stats of one Conference, or queue a task per
+        Conference of one batch."""
+        wsck = self.request.get('wsck')
+        if wsck:
+            recomputeStats(ndb.Key(urlsafe=wsck))
+            self.response.set_status(204)
+            return
+        c_keys, cursor, more = Conference.query().fetch_page(
+            FANOUT_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        queue = taskqueue.Queue()
+        for i in range(0, len(c_keys), 100):
+            queue.add([taskqueue.Task(params={'wsck': c_key.urlsafe()},
+                                      url='/tasks/recompute_stats')
+                       for c_key in c_keys[i:i + 100]])
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/recompute_stats')
+        self.response.set_status(204)
+
+
+class BackfillOrganizerNamesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start denormalising organizer names onto existing Conferences."""
+        taskqueue.add(url='/tasks/backfill_organizer_names')
+        self.response.set_status(202)
+
+    def post(self):
+        """Backfill organizerDisplayName on one batch of Conferences."""
+        c_keys, cursor, more = Conference.query().fetch_page(
+            FANOUT_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        # group conferences by organizer, read each organizer once
+        organizers = {}
+        for c_key in c_keys:
+            organizers.setdefault(c_key.parent(), []).append(c_key)
+        profiles = ndb.get_multi(organizers.keys())
+        for prof in profiles:
+            if prof:
+                setOrganizerName(organizers[prof.key], prof.displayName)
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/backfill_organizer_names')
         self.response.set_status(204)
 
 
+@transactional
+def buildSpeakerIndex(c_key):
+    """Rebuild the ConferenceSpeaker entities of a conference."""
+    indexes = {}
+    for session in Session.query(ancestor=c_key).order(Session.key):
+        if session.speakerId:
+            index = indexes.setdefault(session.speakerId, ConferenceSpeaker(
+                                        id=session.speakerId, parent=c_key))
+            index.sessionKeys.append(session.key)
+            index.sessionNames.append(session.name)
+    ndb.put_multi(indexes.values())
+
+
+class BackfillSpeakerIndexHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start indexing the speakers of existing Sessions."""
+        taskqueue.add(url='/tasks/backfill_speaker_index')
+        self.response.set_status(202)
+
+    def post(self):
+        """Rebuild the speaker index of one batch of Conferences."""
+        c_keys, cursor, more = Conference.query().fetch_page(
+            FANOUT_BATCH_SIZE, keys_only=True,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        for c_key in c_keys:
+            buildSpeakerIndex(c_key)
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/backfill_speaker_index')
+        self.response.set_status(204)
+
+
+class BackfillConferenceSearchHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start indexing existing Conferences for search."""
+        taskqueue.add(url='/tasks/backfill_conference_search')
+        self.response.set_status(202)
+
+    def post(self):
+        """Index one batch of Conferences for search."""
+        confs, cursor, more = Conference.query().fetch_page(
+            FANOUT_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        conferenceIndex().putMulti([conferenceDocument(conf)
+                                    for conf in confs])
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/backfill_conference_search')
+        self.response.set_status(204)
+
+
+class BackfillSpeakerSearchHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start indexing the names of existing Speakers for search."""
+        taskqueue.add(url='/tasks/backfill_speaker_search')
+        self.response.set_status(202)
+
+    def post(self):
+        """Store the search prefixes of one batch of Speakers."""
+        speakers, cursor, more = Speaker.query().fetch_page(
+            FANOUT_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        for speaker in speakers:
+            speaker.searchTokens = prefixes(speaker.displayName)
+        ndb.put_multi(speakers)
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/backfill_speaker_search')
+        self.response.set_status(204)
+
+
+class MigrateAttendanceHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start moving the registrations & wishlists listed on Profiles to
+        Attendance & SessionWish entities."""
+        taskqueue.add(url='/tasks/migrate_attendance')
+        self.response.set_status(202)
+
+    def post(self):
+        """Migrate one batch of Profiles, each in its own transaction."""
+        profiles, cursor, more = Profile.query().fetch_page(
+            FANOUT_BATCH_SIZE,
+            start_cursor=ndb.Cursor(urlsafe=self.request.get('cursor') or None))
+        migrateProfiles(profiles)
+        # continue with the next batch in a new task
+        if more and cursor:
+            taskqueue.add(params={'cursor': cursor.urlsafe()},
+                          url='/tasks/migrate_attendance')
+        self.response.set_status(204)
+
+
+class ExportHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start exporting Conferences, Sessions, Speakers & Profiles to
+        newline-delimited JSON, or resume an unfinished export (?resume=
+        its name); reports the export's progress as JSON."""
+        name = self.request.get('resume')
+        export = resumeExport(name) if name else startExport()
+        if not export:
+            self.abort(404)
+        self.response.set_status(202)
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps({
+            'export': export.key.id(), 'kind': export.kind,
+            'part': export.part, 'counts': export.counts}, sort_keys=True))
+
+    def post(self):
+        """Write one chunk of an export."""
+        exportChunk(self.request.get('export'), self.request.get('kind'),
+                    int(self.request.get('part')))
+        self.response.set_status(204)
+
+
+class CacheStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report rendered form cache hits and misses as JSON."""
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(stats(), sort_keys=True))
+
+
+class TransactionStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report transaction attempts, latency and contention as JSON."""
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(transactionStats(), sort_keys=True))
+
+
+class ProfileHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report the latency, RPC & serialization profile of sampled
+        requests per endpoint method and URL as JSON."""
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(profileStats(), sort_keys=True))
+
+
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/check_featured_speaker', checkedFeaturedSpeaker),
+    ('/tasks/sync_seats', SyncSeatsHandler),
+    ('/tasks/update_organizer_name', UpdateOrganizerNameHandler),
+    ('/tasks/backfill_organizer_names', BackfillOrganizerNamesHandler),
+    ('/tasks/backfill_speaker_index', BackfillSpeakerIndexHandler),
+    ('/tasks/backfill_speaker_search', BackfillSpeakerSearchHandler),
+    ('/tasks/backfill_conference_search', BackfillConferenceSearchHandler),
+    ('/tasks/migrate_attendance', MigrateAttendanceHandler),
+    ('/tasks/update_attendee_size', UpdateAttendeeSizeHandler),
+    ('/tasks/update_nearly_sold_out', UpdateNearlySoldOutHandler),
+    ('/tasks/record_stats', RecordStatsHandler),
+    ('/tasks/recompute_stats', RecomputeStatsHandler),
+    ('/tasks/export', ExportHandler),
+    ('/admin/cache_stats', CacheStatsHandler),
+    ('/admin/transaction_stats', TransactionStatsHandler),
+    ('/admin/profile', ProfileHandler),
 ], debug=True)
+
+# profile a sample of the requests
+app = profilerMiddleware(app)
@@ -27,10 +27,27 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy lists, moved to Attendance & SessionWish entities and emptied by
+    # attendance.migrateProfile
     conferenceKeysToAttend = ndb.KeyProperty(repeated=True, kind='Conference')
     sessionKeysToAttend = ndb.KeyProperty(repeated=True, kind='Session')
 
 
+class Attendance(ndb.Model):
+    """Attendance -- registration of a user for a Conference, child of the
+    user's Profile with the websafe conference key as id"""
+    conference = ndb.KeyProperty(kind='Conference', required=True)
+    registered = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+class SessionWish(ndb.Model):
+    """SessionWish -- Session in a user's wishlist, child of the user's
+    Profile with the websafe session key as id"""
+    session = ndb.KeyProperty(kind='Session', required=True)
+    conference = ndb.KeyProperty(kind='Conference', required=True)
+    added = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName = messages.StringField(1)
@@ -46,6 +63,44 @@ class ProfileForm(messages.Message):
     sessionKeysToAttend = messages.StringField(5, repeated=True)
 
 
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- Conference attendee outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- multiple Conference attendee outbound form message"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class TeeShirtSizeCountForm(messages.Message):
+    """TeeShirtSizeCountForm -- attendees of one tee shirt size"""
+    teeShirtSize = messages.EnumField('TeeShirtSize', 1)
+    attendees = messages.IntegerField(2)
+
+
+class SessionWishesForm(messages.Message):
+    """SessionWishesForm -- wishlists a Session is in"""
+    websafeSessionKey = messages.StringField(1)
+    name = messages.StringField(2)
+    wishes = messages.IntegerField(3)
+
+
+class ConferenceStatsForm(messages.Message):
+    """ConferenceStatsForm -- Conference attendee analytics outbound form
+    message"""
+    websafeConferenceKey = messages.StringField(1)
+    maxAttendees = messages.IntegerField(2)
+    seatsAvailable = messages.IntegerField(3)
+    attendees = messages.IntegerField(4)
+    teeShirtSizes = messages.MessageField(TeeShirtSizeCountForm, 5,
+                                          repeated=True)
+    sessions = messages.MessageField(SessionWishesForm, 6, repeated=True)
+
+
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
@@ -56,11 +111,29 @@ class BooleanMessage(messages.Message):
     data = messages.BooleanField(1)
 
 
+class WebsafeKeysForm(messages.Message):
+    """WebsafeKeysForm -- multiple websafe keys inbound form message"""
+    websafeKeys = messages.StringField(1, repeated=True)
+
+
+class BatchResultForm(messages.Message):
+    """BatchResultForm -- outcome of one item of a batch outbound message"""
+    websafeKey = messages.StringField(1)
+    success = messages.BooleanField(2)
+    message = messages.StringField(3)
+
+
+class BatchResultForms(messages.Message):
+    """BatchResultForms -- outcomes of all items of a batch outbound message"""
+    items = messages.MessageField(BatchResultForm, 1, repeated=True)
+
+
 class Conference(ndb.Model):
     """Conference -- Conference object"""
     name = ndb.StringProperty(required=True)
     description = ndb.StringProperty()
     organizerUserId = ndb.StringProperty()
+    organizerDisplayName = ndb.StringProperty(indexed=False)
     topics = ndb.StringProperty(repeated=True)
     city = ndb.StringProperty()
     startDate = ndb.DateProperty()
@@ -68,6 +141,38 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    seatShards = ndb.IntegerProperty(indexed=False)
+
+
+class ConferenceDocument(ndb.Model):
+    """ConferenceDocument -- search terms of a Conference, the single child
+    of its kind under the Conference"""
+    name = ndb.StringProperty(indexed=False)
+    scoredTerms = ndb.StringProperty(repeated=True)
+    weights = ndb.JsonProperty()
+
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- conferences announced as nearly sold out"""
+    conferenceKeys = ndb.KeyProperty(kind='Conference', repeated=True,
+                                     indexed=False)
+    conferenceNames = ndb.StringProperty(repeated=True, indexed=False)
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- share of a Conference's available seats"""
+    seats = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class ConferenceStatsShard(ndb.Model):
+    """ConferenceStatsShard -- share of the attendee aggregates of a
+    Conference: attendees, attendees per teeShirtSize and wishlist entries
+    per websafe session key"""
+    attendees = ndb.IntegerProperty(default=0, indexed=False)
+    teeShirtSizes = ndb.JsonProperty()
+    sessionWishes = ndb.JsonProperty()
+    recentTasks = ndb.StringProperty(repeated=True, indexed=False)
 
 
 class ConferenceForm(messages.Message):
@@ -89,6 +194,8 @@ class ConferenceForm(messages.Message):
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    queryPlan = messages.StringField(3)
 
 
 class TeeShirtSize(messages.Enum):
@@ -128,6 +235,10 @@ class ConferenceQueryForms(messages.Message):
     ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message
     """
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+    explain = messages.BooleanField(4)
+    fields = messages.StringField(5, repeated=True)
 
 
 class Session(ndb.Model):
@@ -156,6 +267,8 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    queryPlan = messages.StringField(3)
 
 
 class SessionQueryForm(messages.Message):
@@ -164,12 +277,30 @@ class SessionQueryForm(messages.Message):
     operator = messages.StringField(2)
     time = messages.IntegerField(
         3, variant=messages.Variant.INT32, default=None)
+    explain = messages.BooleanField(4)
+
+
+class ConferenceSpeaker(ndb.Model):
+    """ConferenceSpeaker -- sessions hosted by a Speaker within a Conference,
+    keyed by speakerId under the Conference"""
+    sessionKeys = ndb.KeyProperty(repeated=True, kind='Session', indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- featured speaker announcement of a Conference,
+    the single child of its kind under the Conference, and the speakerId it
+    features"""
+    announcement = ndb.StringProperty(indexed=False)
+    speakerId = ndb.IntegerProperty(indexed=False)
 
 
 class Speaker(ndb.Model):
     """Speaker -- Session Speaker Object"""
     displayName = ndb.StringProperty(required=True)
     mainEmail = ndb.StringProperty(required=True)
+    # prefixes of the normalised words of displayName, see search.py
+    searchTokens = ndb.StringProperty(repeated=True)
     # sessionKeysToAttend = ndb.KeyProperty(repeated=True, kind='Session')
 
 
@@ -184,3 +315,17 @@ class SpeakerForm(messages.Message):
 class SpeakerForms(messages.Message):
     """SpeakerForms -- multiple Speaker outbound form message"""
     items = messages.MessageField(SpeakerForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class Export(ndb.Model):
+    """Export -- progress of a newline-delimited JSON export, keyed by its
+    name: the kind being exported (None once done), the cursor after its
+    last chunk, the number of its next part and the entities written per
+    kind"""
+    kind = ndb.StringProperty(indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    part = ndb.IntegerProperty(default=0, indexed=False)
+    counts = ndb.JsonProperty()
+    started = ndb.DateTimeProperty(auto_now_add=True)
+    finished = ndb.DateTimeProperty(indexed=False)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""planner.py
+
+Udacity conference server-side Python App Engine query planner
+
+Datastore only allows inequality filters on a single property per query.
+The planner takes any number of equality and inequality filters, pushes
+the equalities and the inequalities of the most selective property into the
+Datastore query, and evaluates the remaining filters in memory while
+streaming the query results in batches.
+
+"""
+
+import datetime
+import operator
+
+from google.appengine.ext import ndb
+
+from settings import PLANNER_BATCH_SIZE, PLANNER_SAMPLE_LIMIT
+from settings import PLANNER_MAX_SCAN
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# Python equivalents of the Datastore filter operators
+_COMPARE = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def _describe(filtr):
+    return '%s %s %r' % (filtr['field'], filtr['operator'], filtr['value'])
+
+
+def _node(filtr):
+    return ndb.query.FilterNode(filtr['field'], filtr['operator'],
+                                filtr['value'])
+
+
+def _stored(value):
+    """Convert a value to the type Datastore stores it as: dates & times
+    are stored as datetimes, times on 1970-01-01 and dates at midnight."""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.time):
+        return datetime.datetime.combine(datetime.date(1970, 1, 1), value)
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _isTemporal(filtr):
+    return isinstance(filtr['value'], (datetime.date, datetime.time))
+
+
+def _matches(entity, filtr):
+    """Evaluate a filter on an entity like Datastore does: a repeated
+    property matches if any of its values does, and values are compared as
+    stored, so a TimeProperty can be filtered by a datetime."""
+    values = getattr(entity, filtr['field'])
+    if not isinstance(values, list):
+        values = [values]
+    compare = _COMPARE[filtr['operator']]
+    return any(compare(_stored(value), _stored(filtr['value']))
+               for value in values)
+
+
+class QueryPlan(object):
+    """Datastore query plus the filters evaluated in memory on its results"""
+
+    def __init__(self, query, pushed, residual, orders, estimates):
+        self.query = query
+        self.pushed = pushed
+        self.residual = residual
+        self.orders = orders
+        self.estimates = estimates
+
+    def matches(self, entity):
+        """Return True if entity passes every in-memory filter."""
+        return all(_matches(entity, filtr) for filtr in self.residual)
+
+    def run(self):
+        """Yield every matching entity, reading results in batches."""
+        for entity in self.query.iter(batch_size=PLANNER_BATCH_SIZE):
+            if self.matches(entity):
+                yield entity
+
+    def fetchPage(self, page_size, start_cursor=None, keys_only=False):
+        """
+        Fetch one page of matching entities
+
+        At most PLANNER_MAX_SCAN results of the Datastore query are read per
+        page, so a page may come back short (but with a cursor) when the
+        in-memory filters reject most rows.
+
+        Args:
+            page_size (int): largest number of entities returned
+            start_cursor (ndb.Cursor): where the previous page stopped
+            keys_only (Boolean): fetch keys instead of entities; only for
+                                 plans without in-memory filters
+        Returns:
+            entities (list): matching entities within the page
+            cursor (ndb.Cursor): where this page stopped, None if done
+        """
+        results = self.query.iter(
+            batch_size=PLANNER_BATCH_SIZE if self.residual else page_size,
+            start_cursor=start_cursor, produce_cursors=True,
+            keys_only=keys_only)
+        entities, scanned = [], 0
+        while len(entities) < page_size and scanned < PLANNER_MAX_SCAN:
+            if not results.has_next():
+                return entities, None
+            entity = results.next()
+            scanned += 1
+            if self.matches(entity):
+                entities.append(entity)
+        return entities, (results.cursor_after() if results.has_next()
+                          else None)
+
+    def explain(self):
+        """Describe how the query is run."""
+        steps = ['datastore filters: %s' % (
+                    ', '.join(_describe(f) for f in self.pushed) or 'none'),
+                 'datastore order: %s' % ', '.join(self.orders)]
+        if self.residual:
+            steps.append('in-memory filters: %s' % ', '.join(
+                            _describe(f) for f in self.residual))
+            temporal = [f['field'] for f in self.residual if _isTemporal(f)]
+            if temporal:
+                steps.append('compared as stored datetimes: %s' %
+                             ', '.join(temporal))
+        if self.estimates:
+            steps.append('estimated matches: %s' % ', '.join(
+                '%s %s%s' % (field, count,
+                             '+' if count >= PLANNER_SAMPLE_LIMIT else '')
+                for field, count in sorted(self.estimates.items())))
+        return '; '.join(steps)
+
+
+def planQuery(query, filters, orders):
+    """
+    Plan a query with inequality filters on any number of properties
+
+    Equality filters always go to Datastore. When inequalities are used on
+    more than one property, the matches of each are counted (up to
+    PLANNER_SAMPLE_LIMIT, keys only and in parallel) and only those of the
+    property matching the fewest entities go to Datastore; the others are
+    evaluated in memory.
+
+    Args:
+        query (ndb.Query): query for the kind & ancestor searched
+        filters (list): dicts of field, operator ('=', '!=', '<', ...) and
+                        value, values already converted to the property type
+        orders (list): property names results are sorted by, after the
+                       inequality property pushed to Datastore
+    Returns:
+        plan (QueryPlan): plan ready to be run or fetched a page at a time
+    """
+    equalities = [f for f in filters if f['operator'] == '=']
+    equality_fields = set(f['field'] for f in equalities)
+    inequalities, residual = {}, []
+    for filtr in filters:
+        # a field with an equality filter is already narrowed down to one
+        # value, its inequalities are checked in memory
+        if filtr['field'] in equality_fields and filtr['operator'] != '=':
+            residual.append(filtr)
+        elif filtr['operator'] != '=':
+            inequalities.setdefault(filtr['field'], []).append(filtr)
+
+    for filtr in equalities:
+        query = query.filter(_node(filtr))
+
+    estimates = {}
+    if len(inequalities) > 1:
+        futures = {}
+        for field, field_filters in inequalities.items():
+            # sampled in the same shape as the final query, so both use
+            # the same indexes
+            sample = query
+            for filtr in field_filters:
+                sample = sample.filter(_node(filtr))
+            for order in [field] + [f for f in orders if f != field]:
+                sample = sample.order(ndb.GenericProperty(order))
+            futures[field] = sample.count_async(PLANNER_SAMPLE_LIMIT)
+        estimates = {field: future.get_result()
+                     for field, future in futures.items()}
+        chosen = min(inequalities, key=lambda field: (estimates[field], field))
+    else:
+        chosen = next(iter(inequalities), None)
+
+    pushed = list(equalities)
+    for field, field_filters in inequalities.items():
+        if field == chosen:
+            pushed += field_filters
+            for filtr in field_filters:
+                query = query.filter(_node(filtr))
+        else:
+            residual += field_filters
+
+    # Datastore requires sorting on the inequality property first
+    if chosen:
+        orders = [chosen] + [field for field in orders if field != chosen]
+    for field in orders:
+        query = query.order(ndb.GenericProperty(field))
+    # Datastore runs != as a < and a > query merged in memory, which only
+    # hands out cursors when sorted on the key last (no extra index needed)
+    if any(filtr['operator'] == '!=' for filtr in pushed):
+        query = query.order(ndb.Model.key)
+        orders = orders + ['__key__']
+    return QueryPlan(query, pushed, residual, orders, estimates)
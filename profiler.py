@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""profiler.py
+
+Udacity conference server-side Python App Engine request profiler
+
+WSGI middleware recording, for a sample of requests, the wall time, the
+number of App Engine RPCs per service and the time spent serialising
+entities to forms, per endpoint method (or URL of main.app). Samples are
+aggregated across instances into time-windowed memcache histograms, from
+which stats() reports rolling percentiles.
+
+"""
+
+import collections
+import functools
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+from settings import MEMCACHE_PROFILE_KEY, MEMCACHE_PROFILE_METHODS_KEY
+from settings import PROFILE_SAMPLE_RATE, PROFILE_WINDOW, PROFILE_WINDOWS
+from settings import PROFILE_LATENCY_BUCKETS, PROFILE_SERVICES
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+SPI_PREFIX = '/_ah/spi/'
+# requests never sampled: the profile report itself
+EXCLUDED_PATHS = ('/admin/profile',)
+PERCENTILES = (50, 90, 99)
+
+# measurements of the request being sampled on the current thread, if any
+_local = threading.local()
+# (method, window) pairs this instance already created the keys of
+_registered = set()
+_methods = set()
+
+
+def _bucketNames():
+    return (['<=%dms' % limit for limit in PROFILE_LATENCY_BUCKETS] +
+            ['>%dms' % PROFILE_LATENCY_BUCKETS[-1]])
+
+
+def _bucket(seconds):
+    """Return the label of the histogram bucket for a duration."""
+    ms = seconds * 1000
+    for limit in PROFILE_LATENCY_BUCKETS:
+        if ms <= limit:
+            return '<=%dms' % limit
+    return '>%dms' % PROFILE_LATENCY_BUCKETS[-1]
+
+
+def _statNames():
+    """Every counter kept per method and window."""
+    return (['samples', 'serialized'] +
+            ['wall ' + bucket for bucket in _bucketNames()] +
+            ['serialization ' + bucket for bucket in _bucketNames()] +
+            ['rpc ' + service for service in PROFILE_SERVICES + ('other',)])
+
+
+def _countRpc(service, call, request, response):
+    """apiproxy pre-call hook counting the RPCs of a sampled request."""
+    rpcs = getattr(_local, 'rpcs', None)
+    if rpcs is not None:
+        rpcs[service if service in PROFILE_SERVICES else 'other'] += 1
+
+
+def profiled(stat):
+    """
+    Add the time spent in a function to the sampled request's stat
+
+    Args:
+        stat (string): name of the timing, e.g. 'serialization'
+    Returns:
+        decorator (callable): wraps a function to be timed
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = getattr(_local, 'timings', None)
+            if timings is None:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[stat] = timings.get(stat, 0) + time.time() - start
+        return wrapper
+    return decorator
+
+
+def _method(environ):
+    """Name a request by its endpoint method, or else its path."""
+    path = environ.get('PATH_INFO', '')
+    if path.startswith(SPI_PREFIX):
+        return path[len(SPI_PREFIX):]
+    return path
+
+
+def _register(method, window):
+    """Create the counters of a method's window with an expiry, and list
+    the method for stats(); once per instance."""
+    if (method, window) in _registered:
+        return
+    memcache.add_multi(
+        {MEMCACHE_PROFILE_KEY % (method, window, stat): 0
+         for stat in _statNames()},
+        time=PROFILE_WINDOW * (PROFILE_WINDOWS + 1))
+    _registered.add((method, window))
+    if method in _methods:
+        return
+    client = memcache.Client()
+    for _ in range(3):
+        methods = client.gets(MEMCACHE_PROFILE_METHODS_KEY)
+        if methods is None:
+            if client.add(MEMCACHE_PROFILE_METHODS_KEY, [method]):
+                break
+        elif method in methods or client.cas(MEMCACHE_PROFILE_METHODS_KEY,
+                                             methods + [method]):
+            break
+    _methods.add(method)
+
+
+def _record(method, wall, timings, rpcs):
+    """Add one sampled request to the current window's counters."""
+    window = int(time.time() // PROFILE_WINDOW)
+    _register(method, window)
+    counts = {
+        'samples': 1,
+        'wall ' + _bucket(wall): 1,
+    }
+    # only requests that timed their serialization go in its histogram
+    if 'serialization' in timings:
+        counts['serialized'] = 1
+        counts['serialization ' + _bucket(timings['serialization'])] = 1
+    for service, count in rpcs.items():
+        counts['rpc ' + service] = count
+    memcache.offset_multi(
+        {MEMCACHE_PROFILE_KEY % (method, window, stat): delta
+         for stat, delta in counts.items()},
+        initial_value=0)
+
+
+def profilerMiddleware(app):
+    """
+    Wrap a WSGI application with the profiler
+
+    Args:
+        app (callable): WSGI application, e.g. conference.api or main.app
+    Returns:
+        app (callable): WSGI application sampling PROFILE_SAMPLE_RATE of
+                        its requests
+    """
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append('profiler', _countRpc)
+
+    def profiledApp(environ, start_response):
+        if (random.random() >= PROFILE_SAMPLE_RATE or
+                environ.get('PATH_INFO', '').startswith(EXCLUDED_PATHS)):
+            return app(environ, start_response)
+        _local.rpcs = collections.Counter()
+        _local.timings = {}
+        start = time.time()
+        try:
+            return app(environ, start_response)
+        finally:
+            wall = time.time() - start
+            rpcs, timings = _local.rpcs, _local.timings
+            # stop counting before the profiler's own memcache calls
+            _local.rpcs = _local.timings = None
+            _record(_method(environ), wall, timings, rpcs)
+    return profiledApp
+
+
+def _percentiles(histogram, samples):
+    """Return the upper bound of the bucket holding each percentile, none
+    without samples."""
+    result = {}
+    if not samples:
+        return result
+    for percentile in PERCENTILES:
+        target, seen = samples * percentile / 100.0, 0
+        for bucket in _bucketNames():
+            seen += histogram.get(bucket, 0)
+            if seen >= target:
+                result['p%d' % percentile] = bucket
+                break
+    return result
+
+
+def stats():
+    """
+    Report the sampled requests of the last PROFILE_WINDOWS windows
+
+    Returns:
+        stats (dict): per method, the number of samples and estimated
+                      requests, wall time & serialization time percentiles
+                      (as histogram bucket bounds; the latter over the
+                      samples that timed their serialization, counted in
+                      serialized), and average RPCs per request by service
+    """
+    methods = memcache.get(MEMCACHE_PROFILE_METHODS_KEY) or []
+    now = int(time.time() // PROFILE_WINDOW)
+    windows = range(now - PROFILE_WINDOWS + 1, now + 1)
+    keys = {(method, window, stat): MEMCACHE_PROFILE_KEY % (method, window,
+                                                            stat)
+            for method in methods for window in windows
+            for stat in _statNames()}
+    counts = memcache.get_multi(keys.values())
+
+    totals = collections.defaultdict(collections.Counter)
+    for (method, window, stat), key in keys.items():
+        totals[method][stat] += int(counts.get(key, 0))
+
+    result = {}
+    for method, total in totals.items():
+        samples = total['samples']
+        if not samples:
+            continue
+        histograms = collections.defaultdict(dict)
+        rpcs = {}
+        for stat, count in total.items():
+            kind, _, name = stat.partition(' ')
+            if kind == 'rpc':
+                rpcs[name] = round(float(count) / samples, 2)
+            elif kind in ('wall', 'serialization'):
+                histograms[kind][name] = count
+        result[method] = {
+            'samples': samples,
+            'estimatedRequests': int(samples / PROFILE_SAMPLE_RATE),
+            'wall': _percentiles(histograms['wall'], samples),
+            'serialized': total['serialized'],
+            'serialization': _percentiles(histograms['serialization'],
+                                          total['serialized']),
+            'rpcsPerRequest': rpcs,
+        }
+    return {'sampleRate': PROFILE_SAMPLE_RATE,
+            'windowSeconds': PROFILE_WINDOW * PROFILE_WINDOWS,
+            'methods': result}
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+
+"""search.py
+
+Udacity conference server-side Python App Engine search helpers
+
+Normalises free text into search tokens, expands them into the prefixes
+stored on indexed entities, and ranks the entities matching a query, so
+name lookups can be served by a single equality filter on a repeated
+property instead of scanning the whole kind.
+
+Conferences are searched through an inverted index of the words of their
+name, description, topics and city, kept in ConferenceDocument entities, or
+in process memory when SEARCH_BACKEND is 'memory'. The documents holding a
+term are read highest weight first, so the best matches are found without
+reading every document of common words.
+
+"""
+
+import base64
+import bisect
+import heapq
+import json
+import re
+import unicodedata
+
+from google.appengine.ext import ndb
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
+
+from models import ConferenceDocument
+from settings import SEARCH_PREFIX_LENGTH, SEARCH_BACKEND
+from settings import CONFERENCE_SEARCH_WEIGHTS, CONFERENCE_PREFIX_FIELDS
+from settings import SEARCH_BATCH_SIZE
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# weights are stored subtracted from this bound, so stored terms sort by
+# descending weight
+_WEIGHT_BOUND = 1000
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into normalised search tokens
+
+    Tokens are lowercased and stripped of accents, so matching is both
+    case- and accent-insensitive.
+
+    Args:
+        text (basestring): text to be tokenized, may be None
+    Returns:
+        tokens (list): normalised words of text, in order
+    """
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    text = u''.join(c for c in unicodedata.normalize('NFKD', text)
+                    if not unicodedata.combining(c))
+    return _WORD.findall(text.lower())
+
+
+def prefixes(text):
+    """
+    Return every prefix of every token of text, to be stored on an entity
+
+    Prefixes are cut at SEARCH_PREFIX_LENGTH characters; longer query
+    tokens are matched against the full token in rankMatches().
+
+    Args:
+        text (basestring): text to be indexed
+    Returns:
+        prefixes (list): sorted, distinct prefixes
+    """
+    return sorted(set(token[:i] for token in tokenize(text)
+                      for i in range(1, min(len(token),
+                                            SEARCH_PREFIX_LENGTH) + 1)))
+
+
+def queryTokens(tokens):
+    """Return the stored prefixes to filter on for a tokenized query: one
+    per distinct query token, as every one must match."""
+    return sorted(set(token[:SEARCH_PREFIX_LENGTH] for token in tokens))
+
+
+def _score(query, words):
+    """Score the words of a name against the tokens of a query; None if
+    a query token isn't a prefix of any word."""
+    score = 0
+    for token in query:
+        if token in words:
+            score += 2
+        elif any(word.startswith(token) for word in words):
+            score += 1
+        else:
+            return None
+    # favour names the query spells out in order, from the first word
+    if words[:len(query)] == query:
+        score += 1
+    return score
+
+
+def rankMatches(query, entities, text, limit):
+    """
+    Rank entities by how well their text matches a query
+
+    Each query token must be a prefix of a word of the entity's text.
+    A whole word match scores higher than a prefix match, and names
+    starting with the query rank first; ties are ordered by text. Only the
+    best limit entities are kept while ranking, so entities may be streamed
+    from a query.
+
+    Args:
+        query (basestring): text searched for
+        entities (iterable): candidate entities
+        text (callable): returns the searched text of an entity
+        limit (int): largest number of entities returned
+    Returns:
+        entities (list): best matching entities, best first
+    """
+    tokens = tokenize(query)
+
+    def scored():
+        for entity in entities:
+            score = _score(tokens, tokenize(text(entity)))
+            if score is not None:
+                yield (-score, text(entity).lower(), entity)
+    return [entity for _, _, entity in
+            heapq.nsmallest(limit, scored(), key=lambda match: match[:2])]
+
+
+def conferenceDocument(conf):
+    """
+    Build the search document of a conference
+
+    Every word of the searched fields becomes a term weighted by its field,
+    cut at SEARCH_PREFIX_LENGTH characters; words of CONFERENCE_PREFIX_FIELDS
+    also add their prefixes at half the weight. A term found in several
+    fields adds up their weights.
+
+    Args:
+        conf (Conference): conference to be indexed, with its key set
+    Returns:
+        document (ConferenceDocument): unsaved document of conf
+    """
+    weights = {}
+    for field, weight in CONFERENCE_SEARCH_WEIGHTS.items():
+        value = getattr(conf, field)
+        if isinstance(value, list):
+            value = u' '.join(value)
+        words = set(token[:SEARCH_PREFIX_LENGTH] for token in tokenize(value))
+        terms = dict.fromkeys(words, weight)
+        if field in CONFERENCE_PREFIX_FIELDS:
+            for word in words:
+                for i in range(1, len(word)):
+                    terms.setdefault(word[:i], weight / 2.0)
+        for term, term_weight in terms.items():
+            weights[term] = weights.get(term, 0) + term_weight
+    return ConferenceDocument(id=1, parent=conf.key, name=conf.name,
+                              scoredTerms=sorted(scoredTerm(term, weight)
+                                                 for term, weight
+                                                 in weights.items()),
+                              weights=weights)
+
+
+def scoredTerm(term, weight):
+    """Encode a term along with its weight in a document, so a term's
+    documents sort by descending weight."""
+    return u'%s %08.3f' % (term, _WEIGHT_BOUND - weight)
+
+
+class DatastoreIndex(object):
+    """Conference search index kept in ConferenceDocument entities"""
+
+    def put(self, document):
+        """Store a document; within a transaction on its conference, it is
+        written along with the conference."""
+        document.put()
+
+    def putMulti(self, documents):
+        """Store several documents at once."""
+        ndb.put_multi(documents)
+
+    def getMulti(self, keys):
+        """Return the documents of several keys, None for those missing."""
+        return ndb.get_multi(keys)
+
+    def ranked(self, term, position=None):
+        """Scan the documents containing a term, highest weight first, from
+        a position returned by a previous scan; a range of the built-in index
+        of scoredTerms."""
+        return _QueryScan(ConferenceDocument.query(
+            ConferenceDocument.scoredTerms >= term + u' ',
+            ConferenceDocument.scoredTerms < term + u'!').order(
+                ConferenceDocument.scoredTerms).iter(
+                    start_cursor=ndb.Cursor(urlsafe=position)
+                    if position else None,
+                    produce_cursors=True, batch_size=SEARCH_BATCH_SIZE))
+
+
+class _QueryScan(object):
+    """Documents of a term read from a Datastore query"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def next(self):
+        """Return the next document, None once all were read."""
+        return next(self.results, None)
+
+    def position(self):
+        """Return the websafe cursor after the last document read."""
+        return self.results.cursor_after().urlsafe()
+
+
+class _ListScan(object):
+    """Documents of a term read from a sorted list"""
+
+    def __init__(self, documents, position):
+        self.documents = documents
+        self.offset = position or 0
+
+    def next(self):
+        """Return the next document, None once all were read."""
+        if self.offset >= len(self.documents):
+            return None
+        self.offset += 1
+        return self.documents[self.offset - 1]
+
+    def position(self):
+        """Return the number of documents read."""
+        return self.offset
+
+
+class MemoryIndex(object):
+    """In-process conference search index, for local tests & benchmarks"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def put(self, document):
+        """Store a document, replacing the previous one of its conference."""
+        self.documents[document.key] = document
+
+    def putMulti(self, documents):
+        """Store several documents at once."""
+        for document in documents:
+            self.put(document)
+
+    def getMulti(self, keys):
+        """Return the documents of several keys, None for those missing."""
+        return [self.documents.get(key) for key in keys]
+
+    def ranked(self, term, position=None):
+        """Scan the documents containing a term, highest weight first, from
+        a position returned by a previous scan."""
+        return _ListScan(sorted(
+            [document for document in self.documents.values()
+             if term in document.weights],
+            key=lambda document: (-document.weights[term], document.key)),
+            position)
+
+
+_INDEX = {'datastore': DatastoreIndex, 'memory': MemoryIndex}[SEARCH_BACKEND]()
+
+
+def conferenceIndex():
+    """Return the conference search index in use."""
+    return _INDEX
+
+
+def setConferenceIndex(index):
+    """Replace the conference search index, e.g. with a MemoryIndex."""
+    global _INDEX
+    _INDEX = index
+
+
+def _rank(document, terms):
+    """Sort key of a matching document: summed weight, name, then key."""
+    return (-sum(document.weights[term] for term in terms),
+            (document.name or u'').lower(), document.key.urlsafe())
+
+
+def encodeCursor(cursor):
+    """Turn the state a search stopped in into a page token."""
+    cursor = dict(cursor, pending=[key.urlsafe() for key in cursor['pending']])
+    return base64.urlsafe_b64encode(json.dumps(cursor, sort_keys=True))
+
+
+def decodeCursor(token):
+    """Turn a page token back into the state of a search, raising
+    ValueError if it's malformed."""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(str(token)))
+        cursor['after'] = tuple(cursor['after'])
+        cursor['pending'] = [ndb.Key(urlsafe=key)
+                             for key in cursor['pending']]
+        valid = (len(cursor['positions']) == len(cursor['bounds']) ==
+                 len(cursor['terms']) and 'done' in cursor)
+    except (TypeError, ValueError, KeyError, UnicodeEncodeError,
+            ProtocolBufferDecodeError):
+        valid = False
+    if not valid:
+        raise ValueError('Invalid page token')
+    return cursor
+
+
+def rankConferences(query, limit, cursor=None):
+    """
+    Return the search documents of the best conferences matching a query
+
+    Conferences must contain every word of the query, or a word starting
+    with it in CONFERENCE_PREFIX_FIELDS. They are ranked by the summed
+    weight of the query words, then by name.
+
+    The documents of each query word are read in turns, highest weight
+    first, until no document not read yet can outrank the page: such a
+    document weighs at most the sum of the weights last read for each word
+    (threshold algorithm). Every match is reachable, however common the
+    words. The returned cursor holds where the scan of each word stopped and
+    the matches read but not returned yet, so the next page carries on from
+    there instead of reading the documents of the previous pages again.
+
+    Args:
+        query (basestring): text searched for
+        limit (int): number of documents returned
+        cursor (dict): state of the search after the previous page, from
+                       decodeCursor
+    Returns:
+        documents (list): matching ConferenceDocuments, best first
+        cursor (dict): state of the search after this page, for
+                       encodeCursor; None if no more documents match
+    """
+    terms = queryTokens(tokenize(query))
+    if not terms:
+        return [], None
+    if cursor and cursor['terms'] != terms:
+        raise ValueError('Invalid page token')
+    index = conferenceIndex()
+    cursor = cursor or {'after': None, 'positions': [None] * len(terms),
+                        'bounds': [None] * len(terms), 'pending': [],
+                        'done': False}
+    after, bounds = cursor['after'], list(cursor['bounds'])
+    # matches read for previous pages but not returned yet, ranked after
+    # their last document
+    best = sorted((_rank(document, terms), document)
+                  for document in index.getMulti(cursor['pending'])
+                  if document and all(term in document.weights
+                                      for term in terms))
+    seen = set(document.key for _, document in best)
+    done = cursor['done']
+    scans = [] if done else [
+        index.ranked(term, position)
+        for term, position in zip(terms, cursor['positions'])]
+    while not done:
+        for i, scan in enumerate(scans):
+            document = scan.next()
+            # every document containing all terms is in each list, so
+            # they have all been read once a list runs out
+            if document is None:
+                done = True
+                break
+            bounds[i] = document.weights[terms[i]]
+            if document.key in seen:
+                continue
+            seen.add(document.key)
+            if not all(term in document.weights for term in terms):
+                continue
+            rank = _rank(document, terms)
+            if after is None or rank > after:
+                bisect.insort(best, (rank, document))
+        # documents not read yet weigh at most the sum of the bounds
+        if (not done and len(best) > limit and
+                -best[limit][0][0] > sum(bounds)):
+            break
+
+    page = [match for _, match in best[:limit]]
+    if len(best) <= limit:
+        return page, None
+    return page, {
+        'terms': terms, 'after': best[limit - 1][0], 'bounds': bounds,
+        'positions': ([None] * len(terms) if done
+                      else [scan.position() for scan in scans]),
+        'pending': [match.key for _, match in best[limit:]],
+        'done': done}
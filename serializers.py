@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Udacity conference server-side Python App Engine form serializers
+
+Copy functions from Datastore entities to their outbound ProtoRPC forms,
+compiled once at import time from the model properties and form fields
+instead of reflecting over all_fields() for every entity copied.
+
+"""
+
+from operator import attrgetter
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+from models import Profile, ProfileForm, AttendeeForm
+from models import Conference, ConferenceForm
+from models import Session, SessionForm
+from models import Speaker, SpeakerForm
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+
+def _copyAsString(name):
+    """Convert dates and times to their string representation."""
+    get = attrgetter(name)
+    return lambda entity: str(get(entity))
+
+
+def _copyAsWebsafeKeys(name):
+    """Convert a list of keys to a list of websafe keys."""
+    get = attrgetter(name)
+    return lambda entity: [key.urlsafe() for key in get(entity)]
+
+
+def _copyAsEnum(name, enum):
+    """Convert the name of an enum value to the enum value."""
+    get = attrgetter(name)
+    return lambda entity: getattr(enum, get(entity))
+
+
+def _websafeKey(entity):
+    return entity.key.urlsafe()
+
+
+def _integerId(entity):
+    return entity.key.integer_id()
+
+
+def compileSerializer(model_class, form_class, fields=None, **overrides):
+    """
+    Build a function copying model_class entities into form_class messages
+
+    How each form field is filled in is decided here, once:
+        - fields not in fields, when given, are left empty
+        - fields given in overrides use the function provided
+        - websafeKey is filled in with the entity's websafe key
+        - date & time properties are converted to strings, key lists to
+          websafe key lists, and strings to enum values of EnumFields
+        - any other field named after a model property is copied as is
+        - remaining fields are left empty
+
+    The resulting messages aren't checked with check_initialized(), since
+    every form filled in here is built by the server from stored entities.
+
+    Args:
+        model_class (ndb.Model): class of the entities to be copied
+        form_class (Message): class of the forms to be returned
+        fields (list): names of the form fields filled in, all if None
+        overrides (callable): per field name, returns the field's value
+                              given an entity
+    Returns:
+        serializer (callable): returns a form_class given an entity
+    """
+    copiers = []
+    for field in form_class.all_fields():
+        prop = model_class._properties.get(field.name)
+        if fields is not None and field.name not in fields:
+            continue
+        elif field.name in overrides:
+            copy = overrides[field.name]
+        elif field.name == 'websafeKey':
+            copy = _websafeKey
+        elif prop is None:
+            continue
+        elif isinstance(prop, (ndb.DateProperty, ndb.TimeProperty)):
+            copy = _copyAsString(field.name)
+        elif isinstance(prop, ndb.KeyProperty) and prop._repeated:
+            copy = _copyAsWebsafeKeys(field.name)
+        elif isinstance(field, messages.EnumField):
+            copy = _copyAsEnum(field.name, field.type)
+        else:
+            copy = attrgetter(field.name)
+        copiers.append((field.name, copy))
+
+    def serializer(entity):
+        return form_class(**{name: copy(entity) for name, copy in copiers})
+    return serializer
+
+
+# form fields filled in by a function of their own, per (model, form) pair
+OVERRIDES = {
+    (Speaker, SpeakerForm): {'speakerId': _integerId},
+}
+
+# serializer per (model, form) pair, compiled once at import time
+SERIALIZERS = {
+    pair: compileSerializer(*pair, **OVERRIDES.get(pair, {}))
+    for pair in [(Conference, ConferenceForm), (Profile, ProfileForm),
+                 (Profile, AttendeeForm), (Session, SessionForm),
+                 (Speaker, SpeakerForm)]
+}
+
+# serializers filling in some fields only, compiled on first use per
+# (model, form, fields)
+_PARTIAL_SERIALIZERS = {}
+
+
+def toForm(entity, form_class, fields=None):
+    """
+    Copy an entity into a form using its registered serializer
+
+    Args:
+        entity (ndb.Model): entity to be copied
+        form_class (Message): class of the form to be returned
+        fields (tuple): names of the form fields filled in, all if None
+    Returns:
+        form (Message): form_class copy of entity
+    """
+    pair = (type(entity), form_class)
+    if fields is None:
+        return SERIALIZERS[pair](entity)
+    key = pair + (tuple(fields),)
+    if key not in _PARTIAL_SERIALIZERS:
+        _PARTIAL_SERIALIZERS[key] = compileSerializer(
+            *pair, fields=fields, **OVERRIDES.get(pair, {}))
+    return _PARTIAL_SERIALIZERS[key](entity)
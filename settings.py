@@ -9,6 +9,8 @@ Datastore models, and dictionary for Datastore queries
 
 """
 
+import os
+
 __author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
 
 # Replace the following lines with client IDs obtained from the APIs
@@ -19,10 +21,153 @@ IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
 
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-MEMCACHE_SPEAKER_KEY = "FEATURED_SPEAKER"
+MEMCACHE_NEARLY_SOLD_OUT_KEY = "NEARLY_SOLD_OUT_SET"
+MEMCACHE_SPEAKER_KEY = "FEATURED_SPEAKER_%s_%d"
+MEMCACHE_SEATS_KEY = "SEATS_AVAILABLE_%s"
+MEMCACHE_FORM_KEY = "FORM_%d_%s"
+MEMCACHE_FORM_STATS_KEY = "FORM_STATS_%s_%s"
+MEMCACHE_TXN_STATS_KEY = "TXN_STATS_%s_%s"
+MEMCACHE_TXN_CONTENDED_KEY = "TXN_CONTENDED_%s"
+MEMCACHE_PROFILE_KEY = "PROFILE_%s_%d_%s"
+MEMCACHE_PROFILE_METHODS_KEY = "PROFILE_METHODS"
+MEMCACHE_TOKEN_KEY = "OAUTH_TOKEN_%s"
 ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
                     'are nearly sold out: %s')
 
+# number of entities returned per page by the list endpoints when the client
+# doesn't ask for a specific pageSize, and the largest page it may ask for
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# number of SeatShard entities a conference's seats are spread over (a
+# cross-group transaction may touch at most 25 entity groups), seconds the
+# total is cached in memcache, and seconds between copying the total back
+# onto Conference.seatsAvailable
+SEAT_SHARDS = 10
+SEATS_CACHE_TTL = 60
+SEATS_SYNC_INTERVAL = 10
+
+# bump FORM_CACHE_VERSION whenever a form message or _copy*ToForm changes,
+# so forms rendered by the previous version are no longer read; forms are
+# cached for the number of seconds given for their entity kind
+FORM_CACHE_VERSION = 1
+FORM_CACHE_TTL = {
+    'Conference': 10 * 60,
+    'Session': 10 * 60,
+    'Speaker': 60 * 60,
+    'Profile': 5 * 60,
+}
+
+# list requests selecting fields look up cached forms (a keys only query,
+# then a memcache round trip) when at least this share of the recent lookups
+# of their kind hit on the instance, or for one request in FORM_PEEK_PROBE;
+# lookup counts are halved every FORM_PEEK_WINDOW forms
+FORM_PEEK_MIN_HIT_RATE = 0.5
+FORM_PEEK_PROBE = 10
+FORM_PEEK_WINDOW = 1000
+
+# conferences with at most this many seats left (but not sold out) are
+# announced as nearly sold out
+NEARLY_SOLD_OUT_SEATS = 5
+
+# upper bounds (ms) of the transaction latency histogram buckets, and number
+# of most contended entity groups kept per transactional function
+TXN_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+TXN_CONTENDED_GROUPS = 20
+
+# share of requests profiled, length (s) and number of the memcache windows
+# the profile report covers, upper bounds (ms) of its histogram buckets, and
+# App Engine services whose RPCs are counted separately
+PROFILE_SAMPLE_RATE = 0.05
+PROFILE_WINDOW = 10 * 60
+PROFILE_WINDOWS = 6
+PROFILE_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                           10000)
+PROFILE_SERVICES = ('datastore_v3', 'memcache', 'taskqueue', 'urlfetch')
+
+# number of memcache copies of each conference's featured speaker, so reads
+# of a popular conference are spread over several memcache keys
+FEATURED_SPEAKER_REPLICAS = 8
+
+# characters of each word stored as search prefixes, number of speakers
+# returned by searchSpeakers by default and at most, number of speaker names
+# or conference documents read per Datastore batch while ranking, and
+# largest number of speaker names ranked per search
+SEARCH_PREFIX_LENGTH = 12
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+SEARCH_BATCH_SIZE = 100
+SPEAKER_SEARCH_SCAN = 1000
+
+# weight of a query word found in each searched Conference field (half of it
+# when only the start of a word matches, for the fields indexing prefixes),
+# and where the conference search index is kept: 'datastore' or 'memory'
+# (in-process, for local tests and benchmarks)
+CONFERENCE_SEARCH_WEIGHTS = {
+    'name': 4,
+    'topics': 3,
+    'city': 2,
+    'description': 1,
+}
+CONFERENCE_PREFIX_FIELDS = ('name', 'topics', 'city')
+SEARCH_BACKEND = 'datastore'
+
+# results read per Datastore batch by query plans filtering in memory, matches
+# counted per inequality property to pick the one pushed to Datastore, and
+# results read at most to fill one page
+PLANNER_BATCH_SIZE = 50
+PLANNER_SAMPLE_LIMIT = 1000
+PLANNER_MAX_SCAN = 1000
+
+# Google's OAuth token lookup, its deadline, attempts and first backoff delay
+# (s), the number of token user ids kept per instance, and the longest they're
+# cached (s) -- tokens are dropped sooner when they expire
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+TOKENINFO_DEADLINE = 5
+TOKENINFO_ATTEMPTS = 3
+TOKENINFO_BACKOFF = 0.2
+TOKEN_CACHE_SIZE = 1000
+TOKEN_CACHE_TTL = 60 * 60
+
+# how endpoint requests identify their user, passed to utils.getUserId:
+# 'email' keeps the Profiles & organizerUserIds stored so far; 'oauth' keys
+# them by Google user id instead, resolved through the cached tokeninfo
+# lookup, and needs existing Profiles & Conferences to be re-keyed first
+USER_ID_TYPE = 'email'
+
+# number of ConferenceStatsShard entities the attendee aggregates of a
+# conference are spread over; all are rewritten by a single cross-group
+# transaction when recomputed, so at most 25
+STATS_SHARDS = 10
+
+# names of the last tasks whose deltas were added to each stats shard, so a
+# retried task doesn't count twice
+STATS_RECENT_TASKS = 50
+
+# largest number of websafe keys accepted by the batch endpoints
+MAX_BATCH_SIZE = 100
+
+# number of entities updated by each task of a background fan-out/backfill
+FANOUT_BATCH_SIZE = 100
+
+# largest number of items accepted by the bulk import endpoints (and loaded
+# at once by loader.py), and number of entities written per put_multi
+MAX_IMPORT_SIZE = 500
+IMPORT_BATCH_SIZE = 100
+
+# entities written per export task (one part file each) and read per
+# Datastore batch, and where the newline-delimited JSON is stored: 'local'
+# (directory EXPORT_PATH, for local tests & the development server, as the
+# production filesystem is read-only) or 'gcs' (under EXPORT_PATH in Cloud
+# Storage bucket EXPORT_BUCKET, the app's default bucket if None; needs the
+# cloudstorage client library installed in lib/)
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 100
+EXPORT_BACKEND = ('gcs' if os.environ.get('SERVER_SOFTWARE', '').startswith(
+    'Google App Engine') else 'local')
+EXPORT_BUCKET = None
+EXPORT_PATH = 'exports'
+
 DEFAULTS = {
     "city": "Default City",
     "maxAttendees": 0,
@@ -414,6 +414,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.queryConferences = function () {
         $scope.submitted = false;
+        $scope.nextPageToken = null;
         if ($scope.selectedTab == 'ALL') {
             $scope.queryConferencesAll();
         } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
@@ -423,13 +424,29 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         }
     };
 
+    /**
+     * Loads the next page of the conferences of the tab currently selected, appending them to the list.
+     */
+    $scope.loadMoreConferences = function () {
+        if ($scope.selectedTab == 'ALL') {
+            $scope.queryConferencesAll($scope.nextPageToken);
+        } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
+            $scope.getConferencesCreated($scope.nextPageToken);
+        }
+    };
+
     /**
      * Invokes the conference.queryConferences API.
+     *
+     * @param pageToken the nextPageToken of the previous page, to append the next page of results
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (pageToken) {
         var sendFilters = {
             filters: []
         }
+        if (pageToken) {
+            sendFilters.pageToken = pageToken;
+        }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
             if (filter.field && filter.operator && filter.value) {
@@ -458,10 +475,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!pageToken) {
+                            $scope.conferences = [];
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextPageToken = resp.nextPageToken;
                     }
                     $scope.submitted = true;
                 });
@@ -470,10 +490,12 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
 
     /**
      * Invokes the conference.getConferencesCreated method.
+     *
+     * @param pageToken the nextPageToken of the previous page, to append the next page of results
      */
-    $scope.getConferencesCreated = function () {
+    $scope.getConferencesCreated = function (pageToken) {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
+        gapi.client.conference.getConferencesCreated(pageToken ? {pageToken: pageToken} : {}).
             execute(function (resp) {
                 $scope.$apply(function () {
                     $scope.loading = false;
@@ -495,10 +517,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!pageToken) {
+                            $scope.conferences = [];
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextPageToken = resp.nextPageToken;
                     }
                     $scope.submitted = true;
                 });
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""transactions.py
+
+Udacity conference server-side Python App Engine transaction instrumentation
+
+Drop-in replacement for ndb.transactional that counts, per transactional
+function, the attempts, retries, failures and errors, keeps histograms of
+the commit and total latency, and remembers which entity groups (those of
+the keys & entities passed to the function, or named by its groups option)
+were involved when a commit had to be retried. Counters are aggregated
+across instances in memcache and reported by stats().
+
+"""
+
+import functools
+import time
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from settings import MEMCACHE_TXN_STATS_KEY, MEMCACHE_TXN_CONTENDED_KEY
+from settings import TXN_LATENCY_BUCKETS, TXN_CONTENDED_GROUPS
+
+__author__ = 'wiseleywu@gmail.com (Wiseley Wu)'
+
+# names of the instrumented functions, registered as they're decorated
+_NAMES = set()
+
+_COUNTERS = ('transactions', 'attempts', 'retries', 'commits', 'failures',
+             'errors')
+
+
+def _bucket(seconds):
+    """Return the label of the latency histogram bucket for a duration."""
+    ms = seconds * 1000
+    for limit in TXN_LATENCY_BUCKETS:
+        if ms <= limit:
+            return '<=%dms' % limit
+    return '>%dms' % TXN_LATENCY_BUCKETS[-1]
+
+
+def _keys(values):
+    """Yield the keys of keys & entities found in values, looking into
+    lists, tuples & sets."""
+    for value in values:
+        if isinstance(value, (list, tuple, set)):
+            for key in _keys(value):
+                yield key
+        elif isinstance(value, ndb.Model) and value.key:
+            yield value.key
+        elif isinstance(value, ndb.Key):
+            yield value
+
+
+def _groups(groups, args, kwargs):
+    """Return the entity groups a transactional function is called for:
+    those of groups(*args, **kwargs) if given, else those of the keys &
+    entities among its arguments."""
+    if groups:
+        try:
+            values = groups(*args, **kwargs)
+        except Exception:
+            # e.g. an invalid key, which the function itself reports
+            return set()
+    else:
+        values = list(args) + list(kwargs.values())
+    return set(key.root().urlsafe() for key in _keys(values))
+
+
+def _record(name, attempts, outcome, start, commit_start, contended):
+    """Add the outcome of one transaction to the memcache counters."""
+    end = time.time()
+    counts = {
+        'transactions': 1,
+        'attempts': attempts,
+        'retries': attempts - 1,
+        outcome: 1,
+        'latency ' + _bucket(end - start): 1,
+    }
+    if outcome == 'commits':
+        counts['commit latency ' + _bucket(end - commit_start)] = 1
+    # not waited for, so the write endpoints don't block on it
+    memcache.Client().offset_multi_async(
+        {MEMCACHE_TXN_STATS_KEY % (name, stat): delta
+         for stat, delta in counts.items() if delta},
+        initial_value=0)
+    if contended:
+        _recordContention(name, contended)
+
+
+def _recordContention(name, contended):
+    """Count the entity groups of retried attempts, keeping the busiest."""
+    client = memcache.Client()
+    key = MEMCACHE_TXN_CONTENDED_KEY % name
+    # compare and set, so concurrent updates aren't lost; contention is
+    # rare enough for a few tries to do
+    for _ in range(3):
+        groups = client.gets(key)
+        if groups is None:
+            if client.add(key, dict(contended)):
+                return
+            continue
+        for group, count in contended.items():
+            groups[group] = groups.get(group, 0) + count
+        busiest = sorted(groups.items(), key=lambda item: -item[1])
+        if client.cas(key, dict(busiest[:TXN_CONTENDED_GROUPS])):
+            return
+
+
+def transactional(func=None, groups=None, **options):
+    """
+    Run a function in a transaction, like ndb.transactional, and record it
+
+    Use as @transactional or @transactional(xg=True, retries=...). Within
+    a transaction already running, the function joins it and isn't
+    recorded on its own. The entity groups counted as contended are those of
+    the keys & entities among the function's arguments, unless groups
+    names them.
+
+    Args:
+        func (callable): function to be run in a transaction
+        groups (callable): called with the function's arguments, returns
+                           the keys or entities whose groups it writes
+        options: transaction options passed on to ndb.transaction
+    Returns:
+        wrapper (callable): instrumented transactional function
+    """
+    if func is None:
+        return lambda func: transactional(func, groups, **options)
+    name = '%s.%s' % (func.__module__, func.__name__)
+    _NAMES.add(name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if ndb.in_transaction():
+            return func(*args, **kwargs)
+        state = {'attempts': 0, 'commit_start': None}
+        entity_groups = _groups(groups, args, kwargs)
+        contended = {}
+
+        def attempt():
+            # a new attempt means the previous one failed to commit
+            if state['attempts']:
+                for group in entity_groups:
+                    contended[group] = contended.get(group, 0) + 1
+            state['attempts'] += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                state['commit_start'] = time.time()
+
+        start = time.time()
+        try:
+            result = ndb.transaction(attempt, **options)
+        except datastore_errors.TransactionFailedError:
+            contended_last = dict(contended)
+            for group in entity_groups:
+                contended_last[group] = contended_last.get(group, 0) + 1
+            _record(name, state['attempts'], 'failures', start,
+                    state['commit_start'], contended_last)
+            raise
+        except Exception:
+            _record(name, state['attempts'], 'errors', start,
+                    state['commit_start'], contended)
+            raise
+        _record(name, state['attempts'], 'commits', start,
+                state['commit_start'], contended)
+        return result
+    return wrapper
+
+
+def stats():
+    """
+    Report the recorded transactions
+
+    Returns:
+        stats (dict): per module.function name, the counters, the latency and
+                      commit latency histograms, and the entity groups most
+                      often written by attempts that had to be retried
+    """
+    stat_names = list(_COUNTERS)
+    for prefix in ('latency ', 'commit latency '):
+        stat_names += [prefix + '<=%dms' % limit
+                       for limit in TXN_LATENCY_BUCKETS]
+        stat_names.append(prefix + '>%dms' % TXN_LATENCY_BUCKETS[-1])
+    keys = {(name, stat): MEMCACHE_TXN_STATS_KEY % (name, stat)
+            for name in _NAMES for stat in stat_names}
+    counts = memcache.get_multi(keys.values())
+    contended = memcache.get_multi(
+        [MEMCACHE_TXN_CONTENDED_KEY % name for name in _NAMES])
+
+    result = {}
+    for (name, stat), key in keys.items():
+        count = int(counts.get(key, 0))
+        report = result.setdefault(name, {'latency': {},
+                                          'commit latency': {}})
+        if stat.startswith('commit latency '):
+            report['commit latency'][stat[len('commit latency '):]] = count
+        elif stat.startswith('latency '):
+            report['latency'][stat[len('latency '):]] = count
+        else:
+            report[stat] = count
+    for name in _NAMES:
+        result[name]['contended'] = contended.get(
+            MEMCACHE_TXN_CONTENDED_KEY % name, {})
+    return result
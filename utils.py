@@ -1,10 +1,22 @@
+import collections
+import hashlib
 import json
 import os
+import threading
 import time
 import uuid
 
 from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
+from settings import MEMCACHE_TOKEN_KEY, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from settings import TOKENINFO_URL, TOKENINFO_DEADLINE, TOKENINFO_ATTEMPTS
+from settings import TOKENINFO_BACKOFF
+
+# user ids of the tokens seen by this instance, least recently used first:
+# memcache key of the token -> (user id, expiry timestamp)
+_tokens = collections.OrderedDict()
+_tokensLock = threading.Lock()
 
 
 def getUserId(user, id_type="email"):
@@ -18,22 +30,7 @@ def getUserId(user, id_type="email"):
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        return getTokenUserIdAsync(token, token_type).get_result()
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm
@@ -44,3 +41,125 @@ def getUserId(user, id_type="email"):
             return profile.id()
         else:
             return str(uuid.uuid1().get_hex())
+
+
+@ndb.tasklet
+def fetchTokenInfo(token_type, token):
+    """
+    Look a token up on Google's tokeninfo endpoint, without blocking
+
+    Args:
+        token_type (string): 'id_token' or 'access_token'
+        token (string): OAuth token of the request
+    Returns:
+        status (int): HTTP status of the response
+        content (string): body of the response
+    """
+    rpc = urlfetch.create_rpc(deadline=TOKENINFO_DEADLINE)
+    urlfetch.make_fetch_call(rpc, TOKENINFO_URL % (token_type, token))
+    resp = yield rpc
+    raise ndb.Return((resp.status_code, resp.content))
+
+
+class StaticTokenInfo(object):
+    """Stand-in for the tokeninfo endpoint, for local tests & benchmarks"""
+
+    def __init__(self, tokens):
+        # token -> tokeninfo dict, e.g. {'user_id': ..., 'expires_in': ...}
+        self.tokens = tokens
+
+    @ndb.tasklet
+    def __call__(self, token_type, token):
+        if token not in self.tokens:
+            raise ndb.Return((400, json.dumps({'error': 'invalid_token'})))
+        raise ndb.Return((200, json.dumps(self.tokens[token])))
+
+
+_fetchTokenInfo = fetchTokenInfo
+
+
+def setTokenInfoFetcher(fetcher):
+    """Replace the tokeninfo lookup, e.g. with a StaticTokenInfo."""
+    global _fetchTokenInfo
+    _fetchTokenInfo = fetcher
+
+
+@ndb.tasklet
+def _resolveTokenAsync(token, token_type):
+    """Return the user id of a token and the seconds it's still valid
+    for, from tokeninfo; ('', 0) if it can't be resolved."""
+    delay = TOKENINFO_BACKOFF
+    for attempt in range(TOKENINFO_ATTEMPTS):
+        try:
+            status, content = yield _fetchTokenInfo(token_type, token)
+        except urlfetch.Error:
+            status, content = None, ''
+        if status == 200:
+            info = json.loads(content)
+            raise ndb.Return((info.get('user_id', ''),
+                              int(info.get('expires_in', 0))))
+        if status == 400 and 'invalid_token' in content:
+            # not an id token, try again right away as an access token
+            if token_type == 'access_token':
+                break
+            token_type = 'access_token'
+        elif attempt + 1 < TOKENINFO_ATTEMPTS:
+            # RPCs already started by the caller progress while waiting, but
+            # getUserId's caller is blocked until the lookup ends
+            yield ndb.sleep(delay)
+            delay *= 2
+    raise ndb.Return(('', 0))
+
+
+def _cachedUserId(key):
+    """Return the user id cached by this instance for a token, if unexpired."""
+    with _tokensLock:
+        entry = _tokens.pop(key, None)
+        if entry is None or entry[1] <= time.time():
+            return None
+        _tokens[key] = entry
+        return entry[0]
+
+
+def _cacheUserId(key, user_id, expires):
+    """Cache a token's user id in this instance, evicting the least
+    recently used tokens."""
+    with _tokensLock:
+        _tokens.pop(key, None)
+        _tokens[key] = (user_id, expires)
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+
+
+@ndb.tasklet
+def getTokenUserIdAsync(token, token_type):
+    """
+    Resolve the user id of an OAuth token, cached until the token expires
+
+    The token is looked up in this instance's LRU cache, then memcache, and
+    only then on the tokeninfo endpoint. Tokens are cached by their hash.
+
+    Args:
+        token (string): OAuth token of the request
+        token_type (string): 'id_token' or 'access_token'
+    Returns:
+        user_id (string): Google user id, '' if the token is invalid
+    """
+    key = MEMCACHE_TOKEN_KEY % hashlib.sha256(token).hexdigest()
+    user_id = _cachedUserId(key)
+    if user_id:
+        raise ndb.Return(user_id)
+
+    ctx = ndb.get_context()
+    cached = yield ctx.memcache_get(key)
+    if cached and cached[1] > time.time():
+        _cacheUserId(key, *cached)
+        raise ndb.Return(cached[0])
+
+    user_id, expires_in = yield _resolveTokenAsync(token, token_type)
+    ttl = min(expires_in, TOKEN_CACHE_TTL)
+    if user_id and ttl > 0:
+        expires = time.time() + ttl
+        _cacheUserId(key, user_id, expires)
+        yield ctx.memcache_set(key, (user_id, expires), time=ttl)
+    raise ndb.Return(user_id)